@@ -26,6 +26,18 @@ The state of the application is a python dictionary, with the following keys.
             "brs_prompt": (str - String to show when application is in browse mode)
         }
         "text": (str - Contents of text widget, displayed in the application) 
+        "du": (bool - whether the recursive sizes of the children are measured and displayed),
+        "sizes": (dict - maps children to their (recursive) size in bytes, as far as they are measured),
+        "compared": (dict - maps children to their class in the comparison being viewed, see CommandReducer.compareCommand, or None),
+        "columns": (list - names of the metadata columns shown next to the children; see Metadata.COLUMNS),
+        "preview": (bool - whether the preview pane, showing the beginning of the selected file, is shown),
+        "marks": (IntervalSet - indices (in children list) of the marked children, which commands act on),
+        "history": (History - views gone back and forward through with Alt-Left and Alt-Right),
+        "tree": (bool - whether directories are expanded in place, their children shown as indented rows),
+        "stale": (bool - whether children are a cached listing being revalidated in the background, see FileSystem.quickListing),
+        "completion": (dict - the completions of the command being cycled through with Tab, see BasicReducer.completeText, or None),
+        "recall": (dict - the command history recall or search in progress, see BasicReducer.recallCommand, or None),
+        "cursor": (int - index (in children list) of the last selected child, as a hint - see BasicReducer.selectedIndex)
     }
 
 This dictionary is a single source of truth for the state of the application, and is never modified directly.
@@ -45,6 +57,8 @@ In contrast, KeyBindReducer hold reducers which make more complicated changes to
 KeyBindReducer methods always call either one BasicReducer method or a composition of BasicReducer methods,
     and are used directly as part of callback functions for application events.
 
+Builtin commands typed in command mode (see README) are reducers held by the CommandReducer class.
+
 The Renderer class holds a class method called render.
 Renderer.render takes in state dictionary and an Application instance
     and changes widget properties for the application to match the state.
@@ -53,19 +67,74 @@ In other words, it "renders" the application to match the state.
 Finally, since this is a file explorer application, the app uses the python os library heavily.
 The FileSystem class holds class methods to abstract away calls to the os library.
 
-The module also has a global object LOGGER, which is the module level logger.
+The FileIndex class is a persistent sqlite3 index of the files beneath a set of directories,
+    used to search large trees without walking them again.
+
+Slow work is run off the Tk event loop by a TaskQueue, 
+    which hands the results back to the application as reducers.
+
+The module also has a global object LOGGER, which is the module level logger,
+    and a global object TASKS, which is the module level TaskQueue.
 
 To run this application, run it just as you would run a python script.
 
     $ python sp_file_explorer.py
 
+Run it with --help for the arguments which work on the file index without starting the GUI,
+    and for --headless, which lists, searches and measures directories as JSON lines (see the Headless class).
+
 """
 
+import time
+STARTED = time.perf_counter()
+"""float: Value of time.perf_counter() when the module started importing (see Application.benchmarkStartup)"""
+
 import sys
 import os
+import io
 import copy
+import re
+import stat
+import errno
+import shutil
+import json
+import zlib
+import mmap
+import hashlib
+import queue
+import tarfile
+import zipfile
+import posixpath
+import struct
+import shlex
+import bisect
+import contextlib
+import heapq
+import fnmatch
+import itertools
 import logging
-from tkinter import Tk, Label, Listbox, Scrollbar, Text, N, S, E, W, VERTICAL, END, DISABLED, NORMAL, NONE, INSERT, DISABLED, StringVar
+import sqlite3
+import argparse
+import threading
+import subprocess
+import urllib.parse
+import multiprocessing
+from collections import OrderedDict, deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+try:
+    import pwd
+except ImportError:
+    pwd = None
+
+# tkinter is only imported when a window is created (see Pane and main), so that --headless runs without it.
+# These are the values of the tkinter constants of the same names.
+N, S, E, W = "n", "s", "e", "w"
+VERTICAL = "vertical"
+END = "end"
+NORMAL = "normal"
+DISABLED = "disabled"
+NONE = "none"
 
 
 def initLogging(logger_name, logfile_name):
@@ -99,12 +168,330 @@ def initLogging(logger_name, logfile_name):
     return logger
 
 
-LOGGER = initLogging(__name__, "sp_file_explorer.log")
+LOGFILE = "sp_file_explorer.log"
+"""str: Name of the log file of the application"""
+
+LOGGER = logging.getLogger(__name__)
 """logging.Logger: Module Level Logger 
 
 This global logger can be called by any function of any class in the module.
+Its handlers are only added by initLogging, which main calls once the window is painted,
+    so that importing the module does not open the log file.
 """
 
+class LocalBackend:
+    """ Backend of FileSystem which uses the os module, i.e. the real file systems of the machine
+
+    A backend provides the few primitive operations which FileSystem, Metadata and Preview need:
+        stat, lstat, isdir, isfile, scandir, open (for reading) and chdir.
+    See MemoryBackend for the other implementation.
+    """
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def lstat(self, path):
+        return os.lstat(path)
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def isfile(self, path):
+        return os.path.isfile(path)
+
+    def scandir(self, path):
+        """ Yields the entries of a directory (with name, is_dir() and is_file(), like os.DirEntry) """
+        with os.scandir(path) as it:
+            yield from it
+
+    def open(self, path):
+        """ Opens a file for reading bytes """
+        return open(path, "rb")
+
+    def chdir(self, path):
+        os.chdir(path)
+
+
+class MemoryBackend:
+    """ Backend of FileSystem which keeps a directory tree in memory, for tests, benchmarks and simulated slow mounts
+
+    The tree is mounted beneath a root path (see FileSystem.mount), and paths beneath it never touch the disk.
+    Directories are dictionaries mapping names to children, and files are bytes.
+    A directory can also hold synthetic files (see synthesize), which are generated when they are listed
+        rather than stored, so that a directory of millions of entries costs a few bytes.
+    Every operation first sleeps for latency seconds, to simulate a slow (for instance network) mount,
+        and its stat results carry a device number of its own, so that Mounts tracks its latency apart from the others.
+    The working directory of the process cannot be inside the tree, so chdir only checks the directory exists.
+    """
+
+    class Entry:
+        """ Directory entry yielded by MemoryBackend.scandir """
+
+        def __init__(self, name, dir):
+            self.name = name
+            self._dir = dir
+
+        def is_dir(self):
+            return self._dir
+
+        def is_file(self):
+            return not self._dir
+
+    def __init__(self, root, latency=0.0):
+        """ Creates an empty tree
+
+        Args:
+            root (str): Path at which the tree is mounted
+            latency (float): Seconds every operation takes
+        """
+        self.root = root.rstrip(os.sep) or os.sep
+        self.latency = latency
+        self.device = zlib.crc32(self.root.encode()) | 1 << 32
+        self._tree = {}
+        self._synthetic = {}
+        self._mtimes = {self.root: 1}
+        self._clock = 1
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _parts(self, path):
+        if path != self.root and not path.startswith(self.root.rstrip(os.sep) + os.sep):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        return [part for part in path[len(self.root):].split(os.sep) if part]
+
+    def _lookup(self, path):
+        """ Returns the node at path - a dict for directories, bytes or a synthetic size (int) for files """
+        node = self._tree
+        parts = self._parts(path)
+        for index, part in enumerate(parts):
+            if not isinstance(node, dict):
+                raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+            if part in node:
+                node = node[part]
+                continue
+            synthetic = self._synthetic.get(os.path.dirname(path) if index == len(parts) - 1 else None)
+            if synthetic is not None:
+                count, prefix, size = synthetic
+                number = part[len(prefix):]
+                if part.startswith(prefix) and number.isdigit() and str(int(number)) == number and int(number) < count:
+                    return size
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        return node
+
+    def _touch(self, dir):
+        self._clock += 1
+        self._mtimes[dir] = self._clock
+
+    def makeDirs(self, path):
+        """ Creates a directory and its missing parents
+
+        Args:
+            path (str): Path of the directory
+        """
+        node = self._tree
+        current = self.root
+        for part in self._parts(path):
+            current = os.path.join(current, part)
+            if part not in node:
+                node[part] = {}
+                self._touch(os.path.dirname(current))
+                self._touch(current)
+            node = node[part]
+
+    def writeFile(self, path, data=b""):
+        """ Creates or replaces a file, creating its missing parent directories
+
+        Args:
+            path (str): Path of the file
+            data (bytes): Contents of the file
+        """
+        self.makeDirs(os.path.dirname(path))
+        self._lookup(os.path.dirname(path))[os.path.basename(path)] = bytes(data)
+        self._touch(os.path.dirname(path))
+
+    def remove(self, path):
+        """ Removes a file or a directory (with everything beneath it)
+
+        Args:
+            path (str): Path of the file or directory
+        """
+        del self._lookup(os.path.dirname(path))[os.path.basename(path)]
+        self._touch(os.path.dirname(path))
+
+    def synthesize(self, dir, count, prefix="file", size=0):
+        """ Adds count synthetic files, named prefix0, prefix1, ..., to a directory (creating it if needed)
+
+        Args:
+            dir (str): Path of the directory
+            count (int): Number of files
+            prefix (str): Prefix of their names
+            size (int): Size of each file, in bytes
+        """
+        self.makeDirs(dir)
+        self._synthetic[dir] = (count, prefix, size)
+        self._touch(dir)
+
+    def stat(self, path):
+        self._wait()
+        node = self._lookup(path)
+        if isinstance(node, dict):
+            mode, size = stat.S_IFDIR | 0o755, 4096
+        else:
+            mode, size = stat.S_IFREG | 0o644, node if isinstance(node, int) else len(node)
+        mtime = self._mtimes.get(path, 1)
+        uid = os.getuid() if hasattr(os, "getuid") else 0
+        return os.stat_result((mode, 0, self.device, 1, uid, 0, size, mtime / 1e9, mtime / 1e9, mtime / 1e9), {"st_mtime_ns": mtime})
+
+    lstat = stat
+
+    def isdir(self, path):
+        try:
+            return stat.S_ISDIR(self.stat(path).st_mode)
+        except OSError:
+            return False
+
+    def isfile(self, path):
+        try:
+            return stat.S_ISREG(self.stat(path).st_mode)
+        except OSError:
+            return False
+
+    def scandir(self, path):
+        """ Yields the entries of a directory, generating its synthetic files as they are reached """
+        self._wait()
+        node = self._lookup(path)
+        if not isinstance(node, dict):
+            raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+        for name, child in list(node.items()):
+            yield MemoryBackend.Entry(name, isinstance(child, dict))
+        count, prefix, size = self._synthetic.get(path, (0, "", 0))
+        for number in range(count):
+            yield MemoryBackend.Entry(f"{prefix}{number}", False)
+
+    def open(self, path):
+        self._wait()
+        node = self._lookup(path)
+        if isinstance(node, dict):
+            raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+        if isinstance(node, int):
+            line = (os.path.basename(path) + "\n").encode()
+            node = (line * (min(node, 65536) // len(line) + 1))[:min(node, 65536)]
+        return io.BytesIO(node)
+
+    def chdir(self, path):
+        if not self.isdir(path):
+            raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+
+
+class Mounts:
+    """ Class (container of methods) which tracks the latency of each mount, and runs I/O calls on them with a timeout
+
+    Mounts are told apart by the st_dev of their directories (see FileSystem.deviceOf).
+    Every call made through call() is timed, and the latency of its mount is a moving average of those times,
+        so a mount whose calls take more than SLOW_SECONDS on average, such as a busy NFS or FUSE mount, is slow.
+    On slow mounts, the children are shown by name only: the visible rows are not stat-ed for their metadata
+        and classes (see Metadata.request and FileType.request), and cached listings are shown without being
+        checked first, while they are revalidated in the background (see FileSystem.quickListing).
+
+    call() runs the call on a small thread pool, and waits at most TIMEOUT_SECONDS for it,
+        so a call on a dead server fails with a TimeoutError (an OSError) instead of hanging the application.
+    A call which timed out cannot be interrupted, so its mount is hung until the call returns:
+        further calls on it fail right away rather than piling up behind it,
+        and once it returns, the stale listings are revalidated (see BasicReducer.revalidate).
+    """
+
+    SLOW_SECONDS = 0.1
+    """float: Average latency in seconds above which a mount is slow"""
+
+    TIMEOUT_SECONDS = 5.0
+    """float: Seconds a call is waited for before it times out"""
+
+    WEIGHT = 0.25
+    """float: Weight of the latest call in the moving average of the latency of its mount"""
+
+    _latency = {}
+    _hung = {}
+    _lock = threading.Lock()
+    _executor = None
+
+    @classmethod
+    def record(cls, device, seconds):
+        """ Adds the time a call took to the latency of its mount
+
+        Args:
+            device (int): st_dev of the mount, or None if it is not known
+            seconds (float): Time the call took
+        """
+        if device is None:
+            return
+        with cls._lock:
+            latency = cls._latency.get(device)
+            cls._latency[device] = seconds if latency is None else latency + cls.WEIGHT * (seconds - latency)
+
+    @classmethod
+    def latency(cls, device):
+        """ Returns the average latency in seconds of a mount, or None if no call was timed on it """
+        return cls._latency.get(device)
+
+    @classmethod
+    def isSlow(cls, device):
+        """ Returns whether a mount is slow or hung (False for an unknown mount)
+
+        Args:
+            device (int): st_dev of the mount, or None if it is not known
+
+        Returns:
+            bool: True if the mount is hung, or its average latency is above SLOW_SECONDS
+        """
+        return device is not None and (device in cls._hung or cls._latency.get(device, 0.0) > cls.SLOW_SECONDS)
+
+    @classmethod
+    def call(cls, device, function, *args):
+        """ Returns function(*args), timed against the latency of a mount and given up after TIMEOUT_SECONDS
+
+        Args:
+            device (int): st_dev of the mount the function does I/O on, or None if it is not known
+            function (callable): Function doing the I/O
+            args: Arguments of function
+
+        Returns:
+            The result of function
+
+        Raises:
+            TimeoutError: If the mount is hung, or the function did not return in time
+            OSError: Any error raised by function
+        """
+        if device is not None and device in cls._hung:
+            raise TimeoutError(errno.ETIMEDOUT, "Mount is not responding")
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sp-io")
+        started = time.perf_counter()
+        future = cls._executor.submit(function, *args)
+        try:
+            return future.result(cls.TIMEOUT_SECONDS)
+        except (TimeoutError, FutureTimeoutError):
+            if future.done() or future.cancel():
+                raise
+            LOGGER.warning(f"I/O call timed out after {cls.TIMEOUT_SECONDS:g} seconds - mount {device} is hung")
+            if device is not None:
+                cls._hung[device] = future
+                future.add_done_callback(lambda future: cls._recovered(device, started))
+            raise TimeoutError(errno.ETIMEDOUT, f"No response after {cls.TIMEOUT_SECONDS:g} seconds")
+        finally:
+            if future.done():
+                cls.record(device, time.perf_counter() - started)
+
+    @classmethod
+    def _recovered(cls, device, started):
+        LOGGER.info(f"Mount {device} responded again")
+        cls._hung.pop(device, None)
+        cls.record(device, time.perf_counter() - started)
+        TASKS.post(BasicReducer.revalidate)
+
+
 class FileSystem:
     """Class holding static methods for file system functions
 
@@ -112,7 +499,71 @@ class FileSystem:
     Thus, it provides a separation between file system functions and the rest of the application.
     It also allows us (developers) to construct file system functions of arbitrary complexity as needed
         by just adding a static method to this class.  
+
+    The primitive operations are done by a backend: LocalBackend by default,
+        or the backend mounted beneath a path with mount, such as a MemoryBackend in the tests.
+    Directories inside zip and tar archives are listed like any other directory (see Archive).
+    Listings of recently listed directories are cached together with the mtime of the directory.
+    Since the mtime of a directory changes whenever a child is added, removed or renamed,
+        listing a cached directory again only costs a stat, as long as its mtime did not change.
+    A listing also remembers whether each child is a file or a directory,
+        which the directory entries tell us for free on most platforms,
+        so that dirOrFile does not have to stat the children of recently listed directories.
+
+    The stat and listing of a directory are run through Mounts.call, which times them against the latency of the mount
+        of the directory (its st_dev, remembered with its listing), and gives up on a hung mount after a timeout.
     """
+
+    LISTING_CACHE_DIRS = 64
+    """int: Number of recently listed directories whose listings are cached"""
+
+    LISTING_CHUNK = 4096
+    """int: Number of children listed per Mounts.call, so a large directory on a slow mount is timed chunk by chunk"""
+
+    _listings = OrderedDict()
+    _lock = threading.Lock()
+
+    LOCAL = LocalBackend()
+    """sp_file_explorer.LocalBackend: Backend of every path which is not beneath a mounted backend"""
+
+    _mounts = []
+
+    @staticmethod
+    def mount(backend):
+        """ Mounts a backend (such as a MemoryBackend) at its root path, forgetting cached listings beneath it
+
+        Args:
+            backend (sp_file_explorer.MemoryBackend): Backend with a root attribute
+        """
+        FileSystem.unmount(backend.root)
+        FileSystem._mounts.append((backend.root, backend))
+
+    @staticmethod
+    def unmount(root):
+        """ Unmounts the backend mounted at root, if any, forgetting cached listings beneath it
+
+        Args:
+            root (str): Path at which the backend is mounted
+        """
+        FileSystem._mounts[:] = [(prefix, backend) for prefix, backend in FileSystem._mounts if prefix != root]
+        with FileSystem._lock:
+            for dir in [dir for dir in FileSystem._listings if dir == root or dir.startswith(root + os.sep)]:
+                del FileSystem._listings[dir]
+
+    @staticmethod
+    def backendOf(path):
+        """ Returns the backend of a path
+
+        Args:
+            path (str): A filepath
+
+        Returns:
+            sp_file_explorer.LocalBackend: The backend mounted beneath which path is, or LOCAL
+        """
+        for root, backend in FileSystem._mounts:
+            if path == root or path.startswith(root + os.sep):
+                return backend
+        return FileSystem.LOCAL
     
     @staticmethod
     def currentDir():
@@ -126,6 +577,9 @@ class FileSystem:
     @staticmethod
     def listDir(dir):
         """ Returns the list of children files of  directory 
+
+        The directory is read LISTING_CHUNK children at a time, each chunk through Mounts.call,
+            so the timeout applies to every chunk rather than to the whole listing of a large directory.
     
         Args:
             dir (str): A directory filepath
@@ -133,16 +587,174 @@ class FileSystem:
         Returns:
             list: List of children filenames of 'dir'
         """
-        return os.listdir(dir)
+        located = Archive.locate(dir)
+        status = Mounts.call(FileSystem.deviceOf(dir), FileSystem.backendOf(dir).stat, located[0] if located is not None else dir)
+        listing = FileSystem.cachedListing(dir)
+        if listing is not None and listing["mtime"] == status.st_mtime_ns:
+            return list(listing["names"])
+        if located is not None:
+            names, kinds = Archive.listDir(*located)
+            return list(FileSystem.rememberListing(dir, status.st_mtime_ns, names, kinds, status.st_dev)["names"])
+        chunks = FileSystem.listDirChunks(dir, FileSystem.LISTING_CHUNK, FileSystem.LISTING_CHUNK)
+        names = []
+        for chunk in iter(lambda: Mounts.call(status.st_dev, next, chunks, None), None):
+            names.extend(chunk)
+        return names
+
+    @staticmethod
+    def quickListing(dir):
+        """ Returns the children of a directory, and whether they may be stale
+
+        On a slow mount (see Mounts), a cached listing is returned as is, without any I/O,
+            and if the listing of the directory times out, its cached listing is returned instead.
+        Either way it may be stale, and the caller should revalidate it in the background.
+        Otherwise the directory is listed by listDir.
+
+        Args:
+            dir (str): A directory filepath
+
+        Returns:
+            tuple: (list of children filenames of dir, True if they are a cached listing which was not checked)
+
+        Raises:
+            OSError: If the directory cannot be listed (TimeoutError if its mount is hung), and is not cached
+        """
+        listing = FileSystem.cachedListing(dir)
+        if listing is not None and Mounts.isSlow(FileSystem.deviceOf(dir)):
+            return list(listing["names"]), True
+        try:
+            return FileSystem.listDir(dir), False
+        except TimeoutError:
+            if listing is None:
+                raise
+            return list(listing["names"]), True
+
+    @staticmethod
+    def deviceOf(dir):
+        """ Returns the st_dev of a directory, as remembered by its cached listing or that of its parent
+
+        Args:
+            dir (str): A directory filepath
+
+        Returns:
+            int: st_dev of the mount of dir (or of its parent, for a mount point which was not listed yet),
+                or None if neither is cached
+        """
+        for path in (dir, os.path.dirname(dir)):
+            listing = FileSystem._listings.get(path)
+            if listing is not None and listing.get("device") is not None:
+                return listing["device"]
+        return None
+
+    @staticmethod
+    def cachedListing(dir):
+        """ Returns the cached listing of a directory, without checking whether it is up to date
+
+        Args:
+            dir (str): A directory filepath
+
+        Returns:
+            dict: The listing, with keys "mtime" (st_mtime_ns of dir when listed), "names" (list of children)
+                "kinds" (dict mapping children to 'dir', 'file' or None) and "device" (st_dev of dir, or None),
+                or None if dir is not cached
+        """
+        listing = FileSystem._listings.get(dir)
+        if listing is None or listing["names"] is None:
+            return None
+        return listing
+
+    @staticmethod
+    def rememberListing(dir, mtime, names, kinds, device=None):
+        """ Adds the listing of a directory to the cache, evicting the least recently listed directory if full
+
+        Args:
+            dir (str): A directory filepath
+            mtime (int): st_mtime_ns of dir when it was listed
+            names (list): Children of dir, or None while the listing is still in progress
+            kinds (dict): Maps children to 'dir', 'file' or None
+            device (int): st_dev of dir, or None if it is not known
+
+        Returns:
+            dict: The cached listing
+        """
+        listing = {"mtime": mtime, "names": names, "kinds": kinds, "device": device}
+        with FileSystem._lock:
+            FileSystem._listings[dir] = listing
+            FileSystem._listings.move_to_end(dir)
+            if len(FileSystem._listings) > FileSystem.LISTING_CACHE_DIRS:
+                FileSystem._listings.popitem(last=False)
+        return listing
+
+    @staticmethod
+    def recentListings():
+        """ Returns the cached listings, most recently listed last
+
+        Returns:
+            list: Tuples (dir, listing) - see cachedListing
+        """
+        with FileSystem._lock:
+            return [(dir, listing) for dir, listing in FileSystem._listings.items() if listing["names"] is not None]
+
+    @staticmethod
+    def listDirChunks(dir, first, size=None):
+        """ Lists the children of directory in chunks - the first few, and all the others
+
+        This generator yields a list of the first 'first' children as soon as they are read,
+            and then a list of the remaining children once the listing is complete (or lists of size children).
+        It lets the application show the first screenful of a large (or slow) directory right away.
+        The generator may be resumed on a different thread than the one which started it.
+
+        Args:
+            dir (str): A directory filepath
+            first (int): Number of children in the first chunk, or None for a single chunk of all children
+            size (int): Number of children in each of the following chunks, or None for a single chunk of the others
+
+        Yields:
+            list: Lists of children filenames of 'dir'
+        """
+        names = []
+        listed = []
+        kinds = {}
+        backend = FileSystem.backendOf(dir)
+        status = backend.stat(dir)
+        listing = FileSystem.rememberListing(dir, status.st_mtime_ns, None, kinds, status.st_dev)
+        for entry in backend.scandir(dir):
+            names.append(entry.name)
+            try:
+                kinds[entry.name] = "dir" if entry.is_dir() else "file" if entry.is_file() else None
+            except OSError:
+                kinds[entry.name] = None
+            if len(names) == first:
+                listed.extend(names)
+                yield names
+                names = []
+                first = size
+        listing["names"] = listed + names
+        yield names
+
+    @staticmethod
+    def cacheDir():
+        """ Returns the directory in which the application keeps its caches (the index, the session, ...)
+
+        Returns:
+            str: Filepath of the cache directory (which may not exist yet)
+        """
+        cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(cache, "sp_file_explorer")
 
     @staticmethod
     def changeCWD(dir):
         """ Changes current working directory to input directory path
+
+        For a directory inside an archive, changes to the directory containing the archive.
+        The change is run through Mounts.call, so it raises TimeoutError rather than hanging on a hung mount.
         
         Args:
             dir (str): A directory filepath
         """
-        os.chdir(dir)
+        located = Archive.locate(dir)
+        path = os.path.dirname(located[0]) if located is not None else dir
+        Mounts.call(FileSystem.deviceOf(path), FileSystem.backendOf(path).chdir, path)
 
 
     @staticmethod
@@ -178,25 +790,64 @@ class FileSystem:
             path (str): Filepath of a file
 
         Returns:
-            bool: True if file is a directory with appropriate permissions, False otherwise
+            bool: True if file is a directory with appropriate permissions, 
+                or an archive or a directory inside an archive (see Archive), False otherwise
+
+        A child listed as a directory by its cached listing is openable without any I/O.
+        Otherwise the path is checked through Mounts.call, and is not openable if its mount does not respond.
 
         Todo:
             Right now, this function only checks if file is a directory.
             Also include if the user has permissions to open the file.
         """
-        return os.path.isdir(path)   
+        listing = FileSystem._listings.get(os.path.dirname(path))
+        if listing is not None and listing["kinds"].get(os.path.basename(path)) == "dir":
+            return True
+        try:
+            if Mounts.call(FileSystem.deviceOf(os.path.dirname(path)), FileSystem.backendOf(path).isdir, path):
+                return True
+        except TimeoutError as error:
+            LOGGER.warning(f"Cannot check whether {path} is a directory - {error.strerror}")
+            return False
+        located = Archive.locate(path)
+        return located is not None and Archive.kind(*located) == "dir"
 
     @staticmethod
-    def open(cmd):
-        """ Given a terminal command, run it. Does not return anything.
+    def isMissing(path):
+        """ Returns whether a path definitely does not exist
+
+        Only a FileNotFoundError or NotADirectoryError counts: a path which cannot be checked,
+            because its mount does not respond or it is not accessible, is not missing.
 
         Args:
-            cmd (str): Terminal command in string form.
-        
-        Todo:
-            Implement Exception handling if cmd is invalid.
+            path (str): A filepath
+
+        Returns:
+            bool: True if the path does not exist, False if it exists or cannot be checked
+        """
+        try:
+            Mounts.call(FileSystem.deviceOf(os.path.dirname(path)), FileSystem.backendOf(path).stat, path)
+        except (FileNotFoundError, NotADirectoryError):
+            return True
+        except OSError:
+            return False
+        return False
+
+    @staticmethod
+    def open(command, *paths):
+        """ Given a command and filepaths, runs the command on the files in the background.
+
+        The program is launched by the Launcher, which returns right away.
+        Failures to launch and nonzero exit statuses are reported to the user as they happen.
+
+        Args:
+            command (str): Command in string form, e.g. "xterm -e vim"
+            paths (str): Filepaths of the files, which are passed as the last arguments of the command
+
+        Returns:
+            dict: The job tracking the launched program (see Launcher.launch)
         """
-        os.system(cmd)
+        return Launcher.launch(command, *paths)
 
     @staticmethod
     def dirOrFile(path):
@@ -207,540 +858,5584 @@ class FileSystem:
 
         Returns:
             str: 'dir' if file is a directory with appropriate permissions, 'file' otherwise
+
+        Note:
+            A path which is not in a cached listing is not stat-ed on a slow mount (see Mounts), and is a 'file'.
         """
-        if os.path.isdir(path):
+        listing = FileSystem._listings.get(os.path.dirname(path))
+        if listing is not None and os.path.basename(path) in listing["kinds"]:
+            return listing["kinds"][os.path.basename(path)]
+        if Mounts.isSlow(FileSystem.deviceOf(os.path.dirname(path))):
+            return "file"
+        backend = FileSystem.backendOf(path)
+        if backend.isdir(path):
             return "dir"
-        elif os.path.isfile(path):
+        elif backend.isfile(path):
             return "file"
-
-class BasicReducer:
-    """Class of reducers (class methods) that make simple changes to state
-    
-    BasicReducer holds reducer functions that make basic changes to the state dictionary.
-    The reducers in this class are meant to be simple, changing only a few key values.
-    The reducers assume the input state dictionary has all the necessary keys and does not sanitize the inputs.
-    (The KeyBindReducer class will have the more complicated reducers)
+        located = Archive.locate(path)
+        if located is not None:
+            return Archive.kind(*located)
+
+class Archive:
+    """ Class (container of methods) which lets the application browse zip and tar archives as directories
+
+    A path beneath an archive, such as /downloads/build.zip/lib/app.so, is a virtual path:
+        the part after the archive is the path of a member within the archive.
+    The member list of an archive (the central directory of a zip file, the headers of a tar file)
+        is parsed once into an in-memory tree of nested dictionaries,
+        which is cached together with the open archive, for a bounded number of recently used archives.
+    The tree is parsed again if the mtime or size of the archive file changes.
+
+    Listing a directory of an archive only looks it up in the tree,
+        and reading a member (see read) only decompresses the first bytes of that member,
+        so an archive is never extracted to disk.
+    Compressed tar files have no index, so the first listing reads the whole file once,
+        and reading a member may have to decompress the archive up to that member.
     """
 
-    @staticmethod
-    def getInitState():
-        """ Returns a state dictionary which is the initial state of application
-        
-        This is a special reducer called in the very beginning of runtime
-            which sets the initial state of the application.
-        Therefore it does not have any inputs, but it returns a state dictionary as output.
+    SUFFIXES = (".zip", ".jar", ".whl", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+    """tuple: Filename suffixes of the files which are browsed as archives"""
 
-        Returns:
-            dict: A state dictionary representing initial state of application  
-        """
-        newState = {}
-        newState["directory"] = FileSystem.currentDir()
-        newState["children"] = FileSystem.listDir(newState["directory"])
-        newState["selected"] = newState["children"][0:1]
-        newState["scroll_data"] = {
-            "list_size": 25,
-            "list_width": 100,
-            "scroll_trigger": 3,
-            "scroll_top": 0
-        }
-        newState["prompt_data"] = {
-            "cmd_prompt": "(Command):",
-            "brs_prompt": "(Browse) "
-        }
-        newState["mode"] = "browse"
-        newState["text"] = newState["prompt_data"]["brs_prompt"] + "SP File Explorer"
-        LOGGER.debug(f"Generated initial app state = {newState}")
-        return newState
-    
-    @staticmethod
-    def sameState(state):
-        """ A reducer which returns a copy of the input state
+    CACHE_ARCHIVES = 8
+    """int: Number of archives whose trees are cached"""
 
-        This reducer makes a deep copy of the input state dictionary
-        and returns it, to indicate that the state has not changed.
+    ERRORS = (OSError, zipfile.BadZipFile, tarfile.TarError, EOFError, zlib.error)
+    """tuple: Exceptions raised by archives which cannot be read"""
+
+    _archives = OrderedDict()
+    _lock = threading.RLock()
+
+    @classmethod
+    def isArchive(cls, path):
+        """ Returns whether path is a file browsed as an archive
 
         Args:
-            state (dict): State dictionary of application at previous moment
+            path (str): A filepath
 
         Returns:
-            dict: State dictionary which represents nothing being changed
+            bool: True if path is a file with one of SUFFIXES
         """
-        return copy.deepcopy(state) 
+        if not path.lower().endswith(cls.SUFFIXES):
+            return False
+        try:
+            return stat.S_ISREG(Mounts.call(FileSystem.deviceOf(os.path.dirname(path)), os.stat, path).st_mode)
+        except OSError:
+            return False
 
     @classmethod
-    def setModeToBrowse(cls, state, text):
-        """ A reducer which sets the application to browse mode, and displays text
-        
-        This reducer takes in an input state and a string.
-        It first makes a deep copy of the input state.
-        Then, it sets the state['mode'] to 'browse' and sets state['text'] 
-            to the concatenation of state['prompt_data']['brs_prompt'] and the input text.
+    def locate(cls, path):
+        """ Splits a virtual path into the archive and the path of the member within it
+
+        It is called on the UI thread for every path listed or opened, so the archives already opened are checked first,
+            and only the components of path ending in one of SUFFIXES are stat-ed, through Mounts.call,
+            so most paths cost no I/O, and a hung mount times out rather than blocking.
 
         Args:
-            state (dict): State dictionary of application at previous moment
-            text (str): Text to be displayed in text widget (after brs_prompt) 
- 
+            path (str): A filepath
+
         Returns:
-            dict: State dictionary which represents browse mode to be activated and text message to be displayed
+            tuple: The archive filepath and the member path ("" for the archive itself),
+                or None if path is neither an archive nor beneath one
         """
-        newState = cls.sameState(state)
-        newState["mode"] = "browse"
-        newState["text"] = newState["prompt_data"]["brs_prompt"] + text
-        #LOGGER.info(f"Changed app state to browse mode")
-        #LOGGER.debug(f"changed {state} to {newState}")
-        return newState
+        if FileSystem.backendOf(path) is not FileSystem.LOCAL:
+            return None
+        for archive in list(cls._archives):
+            if path == archive or path.startswith(archive + os.sep):
+                return archive, path[len(archive)+1:]
+        parts = path.split(os.sep)
+        for index in range(1, len(parts) + 1):
+            head = os.sep.join(parts[:index])
+            if not head.lower().endswith(cls.SUFFIXES):
+                continue
+            try:
+                mode = Mounts.call(FileSystem.deviceOf(os.path.dirname(head)), os.stat, head).st_mode
+            except OSError:
+                return None
+            if stat.S_ISREG(mode):
+                return head, path[len(head)+1:]
+        return None
+
+    @staticmethod
+    def _insert(tree, name, info):
+        parts = [part for part in posixpath.normpath(name).split("/") if part not in ("", ".", "..")]
+        if not parts:
+            return
+        for part in parts[:-1]:
+            if not isinstance(tree.get(part), dict):
+                tree[part] = {}
+            tree = tree[part]
+        if info is None:
+            if not isinstance(tree.get(parts[-1]), dict):
+                tree[parts[-1]] = {}
+        elif parts[-1] not in tree:
+            tree[parts[-1]] = info
 
     @classmethod
-    def setModeToCommand(cls, state, text):
-        """ A reducer which sets the application to command mode and displays text
+    def _parse(cls, path):
+        """ Opens an archive and returns it with the tree of its members """
+        tree = {}
+        if zipfile.is_zipfile(path):
+            handle = zipfile.ZipFile(path)
+            for info in handle.infolist():
+                cls._insert(tree, info.filename, None if info.is_dir() else info)
+        else:
+            handle = tarfile.open(path)
+            for info in handle.getmembers():
+                cls._insert(tree, info.name, None if info.isdir() else info)
+        return handle, tree
 
-        This reducer takes in an input state and a string.
-        It first makes a deep copy of the input state.
-        Then, it sets the state['mode'] to 'command' and sets state['text']
-            to the concatenation of state['prompt_data']['cmd_prompt'] and the input text.
+    @classmethod
+    def _entry(cls, path):
+        """ Returns the cached entry of an archive, parsing it if needed """
+        st = Mounts.call(FileSystem.deviceOf(os.path.dirname(path)), os.stat, path)
+        key = (st.st_mtime_ns, st.st_size)
+        with cls._lock:
+            entry = cls._archives.get(path)
+            if entry is None or entry["key"] != key:
+                if entry is not None:
+                    entry["handle"].close()
+                started = time.perf_counter()
+                handle, tree = cls._parse(path)
+                LOGGER.info(f"Indexed archive {path} in {(time.perf_counter() - started) * 1000:.1f} ms")
+                entry = {"key": key, "handle": handle, "tree": tree}
+                cls._archives[path] = entry
+            cls._archives.move_to_end(path)
+            while len(cls._archives) > cls.CACHE_ARCHIVES:
+                cls._archives.popitem(last=False)[1]["handle"].close()
+            return entry
+
+    @classmethod
+    def _node(cls, archive, member):
+        node = cls._entry(archive)["tree"]
+        for part in member.split(os.sep) if member else []:
+            if not isinstance(node, dict) or part not in node:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), os.path.join(archive, member))
+            node = node[part]
+        return node
+
+    @classmethod
+    def listDir(cls, archive, member):
+        """ Lists a directory of an archive
 
         Args:
-            state (dict): State dictionary of application at previous moment
-            text (str): Text to be displayed in text widget (after cmd_prompt) 
- 
+            archive (str): Filepath of the archive
+            member (str): Path of the directory within the archive ("" for the top directory)
+
         Returns:
-            dict: State dictionary which represents command mode to be activated and text message to be displayed
+            tuple: The list of children and the dict mapping them to 'dir' or 'file'
         """
-        newState = cls.sameState(state)
-        newState["mode"] = "command"
-        newState["text"] = newState["prompt_data"]["cmd_prompt"] + text
-        #LOGGER.info(f"Changed app state to command mode")
-        #LOGGER.debug(f"changed {state} to {newState}")
-        return newState
+        node = cls._node(archive, member)
+        if not isinstance(node, dict):
+            raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), os.path.join(archive, member))
+        return list(node), {name: "dir" if isinstance(child, dict) else "file" for name, child in node.items()}
 
     @classmethod
-    def deleteText(cls, state):
-        """ A reducer which deletes a character from state["text"]
+    def kind(cls, archive, member):
+        """ Returns whether a member of an archive is a directory or a file
 
-        The reducer takes in an input state.
+        Args:
+            archive (str): Filepath of the archive
+            member (str): Path of the member within the archive
+
+        Returns:
+            str: 'dir' or 'file', or None if there is no such member or the archive cannot be read
+        """
+        try:
+            return "dir" if isinstance(cls._node(archive, member), dict) else "file"
+        except cls.ERRORS:
+            return None
+
+    @classmethod
+    def size(cls, archive, member):
+        """ Returns the total uncompressed size of a member of an archive and everything beneath it
+
+        Args:
+            archive (str): Filepath of the archive
+            member (str): Path of the member within the archive
+
+        Returns:
+            int: Size in bytes
+        """
+        stack = [cls._node(archive, member)]
+        total = 0
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                stack.extend(node.values())
+            else:
+                total += node.file_size if isinstance(node, zipfile.ZipInfo) else node.size
+        return total
+
+    @classmethod
+    def lstat(cls, archive, member):
+        """ Returns the size, mtime and mode of a member of an archive, as recorded in the archive
+
+        Args:
+            archive (str): Filepath of the archive
+            member (str): Path of the member within the archive
+
+        Returns:
+            tuple: Size in bytes, mtime in seconds since the epoch and st_mode of the member
+        """
+        node = cls._node(archive, member)
+        if isinstance(node, dict):
+            return 0, os.stat(archive).st_mtime, stat.S_IFDIR | 0o755
+        if isinstance(node, zipfile.ZipInfo):
+            mode = node.external_attr >> 16 or stat.S_IFREG | 0o644
+            return node.file_size, datetime(*node.date_time).timestamp(), mode
+        return node.size, node.mtime, stat.S_IFREG | node.mode
+
+    @classmethod
+    def read(cls, archive, member, size):
+        """ Reads the first bytes of a member of an archive, without extracting the archive
+
+        Args:
+            archive (str): Filepath of the archive
+            member (str): Path of the member within the archive
+            size (int): Maximum number of bytes to read
+
+        Returns:
+            bytes: The first bytes of the member
+        """
+        node = cls._node(archive, member)
+        if isinstance(node, dict):
+            raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), os.path.join(archive, member))
+        with cls._lock:
+            handle = cls._entry(archive)["handle"]
+            file = handle.open(node) if isinstance(node, zipfile.ZipInfo) else handle.extractfile(node)
+            if file is None:
+                return b""
+            with file:
+                return file.read(size)
+
+
+class IntervalSet:
+    """ Class of immutable sets of integers, stored as sorted disjoint half-open ranges
+
+    The marked children of a directory are stored as an IntervalSet of their indices in state["children"],
+        so that marking a range of 100k children costs one range rather than 100k filenames.
+    Every method returns a new IntervalSet instead of changing the set,
+        which also lets deep copies of the state share it (see __deepcopy__).
+    """
+
+    def __init__(self, ranges=()):
+        """ Creates a set from sorted, disjoint, non-adjacent (start, end) ranges
+
+        Args:
+            ranges (iterable): Ranges (start, end) - each containing start, start+1, ..., end-1
+        """
+        self.ranges = tuple(ranges)
+        self._starts = [start for start, end in self.ranges]
+
+    @classmethod
+    def fromIndices(cls, indices):
+        """ Creates a set from any iterable of integers
+
+        Args:
+            indices (iterable): Integers
+
+        Returns:
+            sp_file_explorer.IntervalSet: Set of the integers
+        """
+        ranges = []
+        for index in sorted(set(indices)):
+            if ranges and ranges[-1][1] == index:
+                ranges[-1][1] = index + 1
+            else:
+                ranges.append([index, index + 1])
+        return cls(tuple(pair) for pair in ranges)
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalSet) and self.ranges == other.ranges
+
+    def __repr__(self):
+        return f"IntervalSet({list(self.ranges)})"
+
+    def __len__(self):
+        return sum(end - start for start, end in self.ranges)
+
+    def __bool__(self):
+        return len(self.ranges) != 0
+
+    def __iter__(self):
+        for start, end in self.ranges:
+            yield from range(start, end)
+
+    def __contains__(self, index):
+        i = bisect.bisect_right(self._starts, index) - 1
+        return i >= 0 and index < self.ranges[i][1]
+
+    def add(self, start, end):
+        """ Returns the union of this set and range(start, end)
+
+        Args:
+            start (int): First integer of the range
+            end (int): Integer after the last of the range
+
+        Returns:
+            sp_file_explorer.IntervalSet: The union
+        """
+        if start >= end:
+            return self
+        ranges = self.ranges
+        first = bisect.bisect_left([e for s, e in ranges], start)
+        last = bisect.bisect_right(self._starts, end)
+        if first < last:
+            start = min(start, ranges[first][0])
+            end = max(end, ranges[last-1][1])
+        return IntervalSet(ranges[:first] + ((start, end),) + ranges[last:])
+
+    def remove(self, start, end):
+        """ Returns this set without range(start, end)
+
+        Args:
+            start (int): First integer of the range
+            end (int): Integer after the last of the range
+
+        Returns:
+            sp_file_explorer.IntervalSet: The difference
+        """
+        ranges = []
+        for s, e in self.ranges:
+            if e <= start or s >= end:
+                ranges.append((s, e))
+                continue
+            if s < start:
+                ranges.append((s, start))
+            if e > end:
+                ranges.append((end, e))
+        return IntervalSet(ranges)
+
+    def union(self, other):
+        """ Returns the union of this set and another, merging their ranges in a single pass
+
+        Args:
+            other (sp_file_explorer.IntervalSet): Another set
+
+        Returns:
+            sp_file_explorer.IntervalSet: The union
+        """
+        if not other:
+            return self
+        if not self:
+            return other
+        ranges = []
+        for start, end in heapq.merge(self.ranges, other.ranges):
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+        return IntervalSet(tuple(pair) for pair in ranges)
+
+    def difference(self, other):
+        """ Returns this set without the integers of another, walking both lists of ranges in a single pass
+
+        Args:
+            other (sp_file_explorer.IntervalSet): Another set
+
+        Returns:
+            sp_file_explorer.IntervalSet: The difference
+        """
+        if not self or not other:
+            return self
+        ranges = []
+        removed = other.ranges
+        i = 0
+        for start, end in self.ranges:
+            while i < len(removed) and removed[i][1] <= start:
+                i += 1
+            j = i
+            while j < len(removed) and removed[j][0] < end:
+                if removed[j][0] > start:
+                    ranges.append((start, removed[j][0]))
+                start = max(start, removed[j][1])
+                j += 1
+            if start < end:
+                ranges.append((start, end))
+        return IntervalSet(ranges)
+
+    def toggle(self, index):
+        """ Returns this set with index removed if it is in the set, or added if it is not
+
+        Args:
+            index (int): An integer
+
+        Returns:
+            sp_file_explorer.IntervalSet: The toggled set
+        """
+        if index in self:
+            return self.remove(index, index + 1)
+        return self.add(index, index + 1)
+
+    def invert(self, size):
+        """ Returns the complement of this set within range(0, size)
+
+        Args:
+            size (int): Size of the universe, e.g. the number of children
+
+        Returns:
+            sp_file_explorer.IntervalSet: The complement
+        """
+        ranges = []
+        previous = 0
+        for start, end in self.ranges:
+            if start >= size:
+                break
+            if start > previous:
+                ranges.append((previous, start))
+            previous = end
+        if previous < size:
+            ranges.append((previous, size))
+        return IntervalSet(ranges)
+
+    def splice(self, start, removed, added):
+        """ Returns this set with its integers moved as if removed integers at start were replaced with added others
+
+        It keeps the marks in step with state["children"] when rows are spliced into it (see BasicReducer.expandChild).
+        Integers within range(start, start+removed) are dropped, and integers after it are shifted by added-removed.
+
+        Args:
+            start (int): First replaced integer
+            removed (int): Number of replaced integers
+            added (int): Number of integers replacing them
+
+        Returns:
+            sp_file_explorer.IntervalSet: The shifted set
+        """
+        shift = added - removed
+        ranges = []
+        for s, e in self.remove(start, start + removed).ranges:
+            if s >= start + removed:
+                s, e = s + shift, e + shift
+            elif e > start + removed:
+                ranges.append((s, start))
+                s, e = start + added, e + shift
+            if ranges and ranges[-1][1] == s:
+                s = ranges.pop()[0]
+            ranges.append((s, e))
+        return IntervalSet(ranges)
+
+
+class History:
+    """ Class of immutable, bounded undo/redo histories of the views of the application
+
+    A view is a small dictionary (see view) holding the directory, children, selection, marks and scroll position of a state.
+    Views hold the very same children lists as the states they were taken from,
+        since BasicReducer.sameState shares the lists of the state instead of copying them,
+        so a history of many views of the same directory costs little more than one listing.
+    Like IntervalSet, every method returns a new History instead of changing the history,
+        and deep copies of the state share it (see __deepcopy__).
+
+    The history is bounded by MAX_ENTRIES views and by MAX_BYTES,
+        an estimate of the memory held by the distinct children lists of the views.
+    When either bound is exceeded, the oldest views are dropped.
+    """
+
+    MAX_ENTRIES = 100
+    """int: Maximum number of views in a history (back and forward together)"""
+
+    MAX_BYTES = 32 * 2**20
+    """int: Maximum estimated bytes held by the views of a history"""
+
+    def __init__(self, back=(), forward=()):
+        """ Creates a history
+
+        Args:
+            back (iterable): Views to go back to, oldest first
+            forward (iterable): Views to go forward to, nearest last
+        """
+        self.back = tuple(back)
+        self.forward = tuple(forward)
+
+    ESTIMATE_SAMPLES = 64
+    """int: Number of children whose sizes are sampled to estimate the size of all of them"""
+
+    @classmethod
+    def estimate(cls, children):
+        """ Estimates the bytes held by a list of children, from the sizes of ESTIMATE_SAMPLES evenly spaced children
+
+        Args:
+            children (list): List of filenames
+
+        Returns:
+            int: Estimated size in bytes of the list and its strings
+        """
+        step = max(1, len(children) // cls.ESTIMATE_SAMPLES)
+        samples = children[::step]
+        strings = sum(sys.getsizeof(child) for child in samples) * len(children) // max(1, len(samples))
+        return sys.getsizeof(children) + strings
+
+    def view(self, state):
+        """ Returns the view of a state
+
+        "listed" records whether the children are the cached listing of the directory (rather than search results),
+            so that restoring the view knows whether the listing can be revalidated.
+        When a view in this history holds the same children list, its "listed" and "bytes" are reused,
+            so taking the view of a state whose children did not change takes constant time.
+
+        Args:
+            state (dict): State dictionary of application
+
+        Returns:
+            dict: The view, with keys "directory", "children", "selected", "marks", "scroll_top", "listed" and "bytes"
+        """
+        for view in self.back[::-1] + self.forward:
+            if view["children"] is state["children"]:
+                listed, size = view["listed"], view["bytes"]
+                break
+        else:
+            listing = FileSystem.cachedListing(state["directory"])
+            listed = listing is not None and listing["names"] == state["children"]
+            size = self.estimate(state["children"])
+        return {
+            "directory": state["directory"],
+            "children": state["children"],
+            "selected": state["selected"],
+            "marks": state["marks"],
+            "scroll_top": state["scroll_data"]["scroll_top"],
+            "listed": listed,
+            "bytes": size
+        }
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __len__(self):
+        return len(self.back) + len(self.forward)
+
+    def nbytes(self):
+        """ Returns the estimated bytes held by the views, counting children lists shared by several views once
+
+        Returns:
+            int: Estimated size in bytes
+        """
+        return sum({id(view["children"]): view["bytes"] for view in self.back + self.forward}.values())
+
+    def _bounded(self):
+        history = self
+        while len(history) > 1 and (len(history) > self.MAX_ENTRIES or history.nbytes() > self.MAX_BYTES):
+            if history.back:
+                history = History(history.back[1:], history.forward)
+            else:
+                history = History(history.back, history.forward[1:])
+        return history
+
+    def push(self, state):
+        """ Returns this history with the view of a state added to go back to, and nothing to go forward to
+
+        Args:
+            state (dict): State being left
+
+        Returns:
+            sp_file_explorer.History: The new history
+        """
+        return History(self.back + (self.view(state),))._bounded()
+
+    def undo(self, state):
+        """ Steps back in this history
+
+        Args:
+            state (dict): Current state, whose view becomes the view to go forward to
+
+        Returns:
+            tuple: The new history and the view to go back to, or this history and None if there is none
+        """
+        if not self.back:
+            return self, None
+        return History(self.back[:-1], self.forward + (self.view(state),))._bounded(), self.back[-1]
+
+    def redo(self, state):
+        """ Steps forward in this history
+
+        Args:
+            state (dict): Current state, whose view becomes the view to go back to
+
+        Returns:
+            tuple: The new history and the view to go forward to, or this history and None if there is none
+        """
+        if not self.forward:
+            return self, None
+        return History(self.back + (self.view(state),), self.forward[:-1])._bounded(), self.forward[-1]
+
+
+class TaskQueue:
+    """ Class which runs slow functions on worker threads and hands their results back to the Tk loop
+
+    Tkinter widgets may only be touched from the thread running the main loop,
+        and the state dictionary may only be changed by reducers.
+    A TaskQueue therefore never lets a worker thread touch either of them.
+    Instead, each submitted function is paired with a reducer, and when the function finishes
+        the reducer is queued together with the function's result.
+    The application periodically calls drain(), which applies every queued reducer to the current state.
+
+    Workers which want to report progress before they finish can queue reducers of their own with post().
+
+    The application has one state per Pane, and every queued reducer is tagged with the pane it concerns:
+        work submitted while a reducer of a pane is being applied (see onBehalfOf) is tagged with that pane,
+        and so are the reducers posted by the worker thread running it, so that only that pane sees its results and notices.
+    Reducers posted outside of any pane, such as BasicReducer.refresh once metadata is read, are applied to every pane.
+    """
+
+    POLL_MS = 50
+    """int: Interval (in milliseconds) at which the application drains the queue"""
+
+    def __init__(self, max_workers=4):
+        """ Creates an empty task queue. Worker threads are only started on first use.
+
+        Args:
+            max_workers (int): Maximum number of worker threads
+        """
+        self.max_workers = max_workers
+        self._executor = None
+        self._pending = queue.SimpleQueue()
+        self._context = threading.local()
+
+    def _getExecutor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sp-task")
+        return self._executor
+
+    @contextlib.contextmanager
+    def onBehalfOf(self, pane):
+        """ Context manager within which the work submitted, and the reducers posted, by this thread concern a pane
+
+        Args:
+            pane (int): Index of the pane, or None for every pane
+        """
+        previous = self.currentPane()
+        self._context.pane = pane
+        try:
+            yield
+        finally:
+            self._context.pane = previous
+
+    def currentPane(self):
+        """ Returns the index of the pane which the current thread works for, or None if it works for every pane """
+        return getattr(self._context, "pane", None)
+
+    def submit(self, func, args=(), reducer=None):
+        """ Runs func(*args) on a worker thread, on behalf of the current pane (see currentPane)
+
+        When func returns, reducer(state, result) is queued for the main loop.
+        If func raises, the exception is logged and a notice is queued instead.
+
+        Args:
+            func (callable): Function to run on a worker thread
+            args (tuple): Positional arguments of func
+            reducer (callable): Reducer taking the state and the result of func, or None
+
+        Returns:
+            concurrent.futures.Future: Future of the submitted function
+        """
+        pane = self.currentPane()
+        future = self._getExecutor().submit(self._call, pane, func, args)
+        future.add_done_callback(lambda future: self._finished(future, reducer, pane))
+        return future
+
+    def _call(self, pane, func, args):
+        with self.onBehalfOf(pane):
+            return func(*args)
+
+    def _finished(self, future, reducer, pane):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            LOGGER.error(f"Background task failed - {error!r}")
+            self.postTo(pane, BasicReducer.notify, f"Error: {error}")
+        elif reducer is not None:
+            self.postTo(pane, reducer, future.result())
+
+    def post(self, reducer, *args):
+        """ Queues reducer(state, *args) to be applied by the main loop to the current pane (see currentPane).
+        Safe to call from any thread.
+
+        Args:
+            reducer (callable): Reducer taking the state followed by args
+            args: Remaining arguments of the reducer
+        """
+        self.postTo(self.currentPane(), reducer, *args)
+
+    def postTo(self, pane, reducer, *args):
+        """ Queues reducer(state, *args) to be applied by the main loop to a pane. Safe to call from any thread.
+
+        Args:
+            pane (int): Index of the pane, or None for every pane
+            reducer (callable): Reducer taking the state followed by args
+            args: Remaining arguments of the reducer
+        """
+        self._pending.put((pane, reducer, args))
+
+    def drain(self, state):
+        """ Applies every queued reducer to state, in the order they were queued
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: The new state dictionary, or state itself if nothing was queued
+        """
+        return self.drainAll([state])[0]
+
+    def drainAll(self, states):
+        """ Applies every queued reducer to the states of the panes it concerns, in the order they were queued
+
+        A reducer tagged with a pane is only applied to the state of that pane (dropped if there is no such pane),
+            and a reducer posted for every pane is applied to each of them.
+        Reducers which do not concern a state return it unchanged (see BasicReducer.extendChildren for instance).
+
+        Args:
+            states (list): State dictionaries of the panes at previous moment, indexed by pane
+
+        Returns:
+            list: The new state dictionaries, each being the input state itself if it did not change
+        """
+        states = list(states)
+        while True:
+            try:
+                pane, reducer, args = self._pending.get_nowait()
+            except queue.Empty:
+                return states
+            for index in range(len(states)) if pane is None else [pane] if pane < len(states) else []:
+                with self.onBehalfOf(index):
+                    states[index] = reducer(states[index], *args)
+
+
+TASKS = TaskQueue()
+"""sp_file_explorer.TaskQueue: Module Level Task Queue
+
+Reducers use this queue to run slow work (disk walks, launching programs, ...) off the Tk loop.
+"""
+
+
+class FileIndex:
+    """ Class holding a persistent sqlite3 index of the files beneath a set of root directories
+
+    The index stores the path, type, size and mtime of every file and directory beneath its roots,
+        so that recursive searches over large trees do not have to walk the disk again.
+
+    A root is added with build(), which walks it with a pool of processes,
+        one task per top-level subdirectory of the root.
+    The index is kept up to date with refresh(), which only stats the indexed directories
+        and relists those whose mtime changed since they were indexed.
+    Note that a changed file inside an unchanged directory is only picked up
+        once something else in that directory changes.
+
+    Names are searched with search() (substring) and searchPrefix() (prefix).
+    Substring search uses a trigram full-text index where sqlite supports it,
+        so both kinds of query are answered from an index rather than by scanning every row.
+
+    Each thread gets its own sqlite connection, and the database runs in WAL mode,
+        so the GUI can query the index while a worker thread refreshes it.
+    """
+
+    SCHEMA = """
+        PRAGMA journal_mode=WAL;
+        CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY);
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            parent TEXT NOT NULL,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_parent ON entries(parent);
+        CREATE INDEX IF NOT EXISTS entries_name ON entries(name);
+    """
+
+    TRIGRAM_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(
+            name, content='entries', content_rowid='id', tokenize='trigram'
+        );
+        CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+            INSERT INTO names(rowid, name) VALUES (new.id, new.name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+            INSERT INTO names(names, rowid, name) VALUES ('delete', old.id, old.name);
+        END;
+    """
+
+    UPSERT = """
+        INSERT INTO entries (path, parent, name, type, size, mtime) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(path) DO UPDATE SET type=excluded.type, size=excluded.size, mtime=excluded.mtime
+    """
+
+    BATCH_SIZE = 5000
+    """int: Number of rows written per executemany call"""
+
+    _shared = None
+
+    def __init__(self, db_path=None, processes=None):
+        """ Opens (or lazily creates) the index stored at db_path
+
+        Args:
+            db_path (str): Filepath of the sqlite database, or None for FileIndex.defaultPath()
+            processes (int): Number of walker processes, or None for one per CPU
+        """
+        self.db_path = db_path or FileIndex.defaultPath()
+        self.processes = processes or os.cpu_count() or 1
+        self.trigram = False
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+    @staticmethod
+    def defaultPath():
+        """ Returns the filepath of the default index database (in the user's cache directory)
+
+        Returns:
+            str: Filepath of the default index database
+        """
+        return os.path.join(FileSystem.cacheDir(), "index.sqlite3")
+
+    @classmethod
+    def shared(cls):
+        """ Returns the index at the default location, shared by the whole application
+
+        Returns:
+            sp_file_explorer.FileIndex: The shared index
+        """
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            folder = os.path.dirname(self.db_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            conn = sqlite3.connect(self.db_path)
+            conn.executescript(self.SCHEMA)
+            try:
+                conn.executescript(self.TRIGRAM_SCHEMA)
+                self.trigram = True
+            except sqlite3.OperationalError:
+                LOGGER.info("sqlite has no fts5 trigram tokenizer - substring search will scan the index")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """ Closes the connection of the calling thread """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _kind(mode):
+        if stat.S_ISDIR(mode):
+            return "dir"
+        elif stat.S_ISLNK(mode):
+            return "link"
+        elif stat.S_ISREG(mode):
+            return "file"
+        return "other"
+
+    @staticmethod
+    def _row(path, st):
+        return (path, os.path.dirname(path), os.path.basename(path), FileIndex._kind(st.st_mode), st.st_size, st.st_mtime)
+
+    @staticmethod
+    def _scanChildren(dir):
+        """ Returns the index rows of the direct children of dir (symlinks are not followed) """
+        rows = []
+        try:
+            with os.scandir(dir) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    rows.append((entry.path, dir, entry.name, FileIndex._kind(st.st_mode), st.st_size, st.st_mtime))
+        except OSError as error:
+            LOGGER.debug(f"Indexing - could not list {dir} - {error}")
+        return rows
+
+    @staticmethod
+    def _scanTree(top):
+        """ Returns the index rows of everything beneath top. This is the walker process entry point. """
+        rows = []
+        stack = [top]
+        while stack:
+            children = FileIndex._scanChildren(stack.pop())
+            rows.extend(children)
+            stack.extend(row[0] for row in children if row[3] == "dir")
+        return rows
+
+    def _scanShards(self, tops):
+        """ Yields the row lists of _scanTree for every directory in tops, walking them in parallel """
+        if len(tops) <= 1 or self.processes <= 1:
+            for top in tops:
+                yield FileIndex._scanTree(top)
+            return
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.processes, len(tops)), mp_context=context) as pool:
+            for future in as_completed([pool.submit(FileIndex._scanTree, top) for top in tops]):
+                yield future.result()
+
+    def _write(self, conn, rows):
+        for start in range(0, len(rows), self.BATCH_SIZE):
+            conn.executemany(self.UPSERT, rows[start:start+self.BATCH_SIZE])
+
+    @staticmethod
+    def _subtreeBounds(path):
+        return (path + os.sep, path + chr(ord(os.sep) + 1))
+
+    def _deleteSubtree(self, conn, path):
+        low, high = self._subtreeBounds(path)
+        conn.execute("DELETE FROM entries WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+
+    def roots(self):
+        """ Returns the root directories of the index
+
+        Returns:
+            list: Filepaths of the indexed roots
+        """
+        return [row[0] for row in self._connection().execute("SELECT path FROM roots ORDER BY path")]
+
+    def rootOf(self, path):
+        """ Returns the indexed root containing path, or None if path is not indexed
+
+        Args:
+            path (str): A filepath
+
+        Returns:
+            str: Filepath of the root containing path, or None
+        """
+        for root in self.roots():
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                return root
+        return None
+
+    def build(self, root):
+        """ Adds root to the index (replacing any previous index of it) by walking it completely
+
+        The top level of root is listed in this process.
+        Each top-level subdirectory is then walked by a separate worker process.
+
+        Args:
+            root (str): Filepath of the directory to index
+
+        Returns:
+            int: Number of entries indexed beneath root
+        """
+        root = os.path.abspath(root)
+        LOGGER.info(f"Indexing {root}")
+        top = self._scanChildren(root)
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO roots (path) VALUES (?)", (root,))
+                self._deleteSubtree(conn, root)
+                conn.execute(self.UPSERT, self._row(root, os.stat(root)))
+                self._write(conn, top)
+                count = len(top)
+                for rows in self._scanShards([row[0] for row in top if row[3] == "dir"]):
+                    self._write(conn, rows)
+                    count += len(rows)
+        LOGGER.info(f"Indexed {count} entries beneath {root}")
+        return count
+
+    def refresh(self):
+        """ Brings the index up to date with the disk by comparing directory mtimes
+
+        Every indexed directory is stat-ed.
+        Deleted directories are dropped from the index, and directories whose mtime changed are relisted.
+        Subdirectories which appeared since the last refresh are walked in parallel, like in build().
+
+        Returns:
+            int: Number of directories which had changed
+        """
+        with self._write_lock:
+            conn = self._connection()
+            changed = []
+            gone = []
+            for path, mtime in conn.execute("SELECT path, mtime FROM entries WHERE type = 'dir'").fetchall():
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    gone.append(path)
+                    continue
+                if st.st_mtime != mtime:
+                    changed.append((path, st))
+            with conn:
+                for path in gone:
+                    self._deleteSubtree(conn, path)
+                new_dirs = []
+                for path, st in changed:
+                    known = dict(conn.execute("SELECT name, type FROM entries WHERE parent = ?", (path,)))
+                    rows = self._scanChildren(path)
+                    present = {row[2] for row in rows}
+                    for name in known.keys() - present:
+                        self._deleteSubtree(conn, os.path.join(path, name))
+                    new_dirs.extend(row[0] for row in rows if row[3] == "dir" and known.get(row[2]) != "dir")
+                    self._write(conn, rows)
+                    conn.execute(self.UPSERT, self._row(path, st))
+                for rows in self._scanShards(new_dirs):
+                    self._write(conn, rows)
+        LOGGER.info(f"Refreshed index - {len(changed)} changed and {len(gone)} deleted directories")
+        return len(changed)
+
+    def update(self, dir):
+        """ Refreshes the index if dir is beneath an indexed root, and otherwise builds it with dir as a root
+
+        Args:
+            dir (str): Filepath of a directory
+
+        Returns:
+            str: Description of what was done, to be shown to the user
+        """
+        if self.rootOf(dir) is None:
+            return f"Indexed {self.build(dir)} entries beneath {dir}"
+        return f"Refreshed index - {self.refresh()} directories changed"
+
+    def _scope(self, under):
+        if under is None:
+            return "", ()
+        low, high = self._subtreeBounds(under.rstrip(os.sep))
+        return " AND entries.path >= ? AND entries.path < ?", (low, high)
+
+    def search(self, text, under=None, limit=1000):
+        """ Returns the indexed paths whose filename contains text (case-insensitively)
+
+        Args:
+            text (str): Substring to search for
+            under (str): If given, only paths beneath this directory are returned
+            limit (int): Maximum number of results
+
+        Returns:
+            list: Tuples (path, type) of matching entries
+        """
+        conn = self._connection()
+        scope, args = self._scope(under)
+        if self.trigram and len(text) >= 3:
+            query = ("SELECT entries.path, entries.type FROM names JOIN entries ON entries.id = names.rowid"
+                     f" WHERE names MATCH ?{scope} LIMIT ?")
+            args = ('"' + text.replace('"', '""') + '"',) + args
+        else:
+            escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query = f"SELECT path, type FROM entries WHERE name LIKE ? ESCAPE '\\'{scope} LIMIT ?"
+            args = ("%" + escaped + "%",) + args
+        return conn.execute(query, args + (limit,)).fetchall()
+
+    def searchPrefix(self, prefix, under=None, limit=1000):
+        """ Returns the indexed paths whose filename starts with prefix (case-sensitively)
+
+        Args:
+            prefix (str): Prefix to search for
+            under (str): If given, only paths beneath this directory are returned
+            limit (int): Maximum number of results
+
+        Returns:
+            list: Tuples (path, type) of matching entries
+        """
+        scope, args = self._scope(under)
+        query = f"SELECT path, type FROM entries WHERE name >= ? AND name < ?{scope} LIMIT ?"
+        return self._connection().execute(query, (prefix, prefix + "\U0010ffff") + args + (limit,)).fetchall()
+
+
+class DiskUsage:
+    """ Class which computes the recursive sizes of the children of a directory in the background
+
+    measure() is started on a worker thread of TASKS.
+    It lstats the children of the directory, takes the sizes of files directly,
+        and hands every child directory which is not cached to a pool of processes,
+        which walk the subtrees in parallel.
+    Sizes are posted to the application as each subtree finishes,
+        so they fill in progressively rather than all at once.
+
+    Sizes are apparent sizes (st_size) of everything but directories, and symlinks are not followed.
+    A file with several hard links is only counted once,
+        both within a subtree and in the total of the directory.
+
+    Results are cached by (path, mtime) of the child directory for the lifetime of the application,
+        so navigating away and back does not walk the subtree again.
+    Note that the mtime of a directory only changes when its own entries change,
+        so changes deep inside a cached subtree are only noticed when the entries above them change too.
+    """
+
+    _cache = {}
+    """dict: Maps a directory path to a tuple (mtime, size, links) for its subtree"""
+
+    _pool = None
+    _futures = []
+    _lock = threading.Lock()
+
+    @staticmethod
+    def format(size):
+        """ Formats a number of bytes for display, e.g. 1536 -> '1.5K'
+
+        Args:
+            size (int): Number of bytes
+
+        Returns:
+            str: Human readable size
+        """
+        for unit in ["B", "K", "M", "G", "T"]:
+            if size < 1024 or unit == "T":
+                return f"{size}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+            size /= 1024
+
+    @staticmethod
+    def _subtree(path):
+        """ Returns (size, links) of the subtree at path. This is the worker process entry point.
+
+        links maps (st_dev, st_ino) to size for every file with several hard links,
+            which are left for the caller to deduplicate against other subtrees.
+        """
+        size = 0
+        links = {}
+        stack = [path]
+        while stack:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if stat.S_ISDIR(st.st_mode):
+                        stack.append(entry.path)
+                    elif st.st_nlink > 1:
+                        links[(st.st_dev, st.st_ino)] = st.st_size
+                    else:
+                        size += st.st_size
+        return size + sum(links.values()), links
+
+    @staticmethod
+    def _total(results):
+        """ Returns the total size of a list of (size, links) results, counting each hard linked file once """
+        total = 0
+        seen = {}
+        for size, links in results:
+            total += size - sum(links.values())
+            seen.update(links)
+        return total + sum(seen.values())
+
+    @classmethod
+    def _getPool(cls):
+        if cls._pool is None:
+            context = multiprocessing.get_context("spawn")
+            cls._pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=context)
+        return cls._pool
+
+    @classmethod
+    def cancel(cls):
+        """ Cancels the subtree walks which have not started yet """
+        with cls._lock:
+            for future in cls._futures:
+                future.cancel()
+            cls._futures = []
+
+    @classmethod
+    def shutdown(cls):
+        """ Cancels pending subtree walks and stops the process pool without waiting for it """
+        cls.cancel()
+        if cls._pool is not None:
+            cls._pool.shutdown(wait=False, cancel_futures=True)
+            cls._pool = None
+
+    @classmethod
+    def start(cls, state):
+        """ Starts measuring the children of state["directory"] on TASKS
+
+        The children of a directory inside an archive are measured from the member list of the archive instead.
+
+        Args:
+            state (dict): State dictionary whose children are to be measured
+        """
+        cls.cancel()
+        if FileSystem.backendOf(state["directory"]) is not FileSystem.LOCAL:
+            TASKS.post(BasicReducer.notify, "Disk usage is only measured on local directories")
+            return
+        located = Archive.locate(state["directory"])
+        if located is not None:
+            TASKS.submit(cls.measureArchive, (state["directory"], located, list(state["children"])))
+            return
+        TASKS.submit(cls.measure, (state["directory"], list(state["children"])))
+
+    @staticmethod
+    def measureArchive(dir, located, children):
+        """ Measures the uncompressed size of every child of a directory inside an archive, posting BasicReducer.setSizes
+
+        Args:
+            dir (str): Filepath of the directory
+            located (tuple): The archive and the path of dir within it (see Archive.locate)
+            children (list): Children of dir
+        """
+        archive, member = located
+        sizes = {child: Archive.size(archive, os.path.join(member, child) if member else child) for child in children}
+        TASKS.post(BasicReducer.setSizes, dir, sizes, f"Disk usage {DiskUsage.format(sum(sizes.values()))} uncompressed")
+
+    @classmethod
+    def measure(cls, dir, children):
+        """ Measures every child of dir, posting BasicReducer.setSizes as results come in
+
+        Files and cached directories are posted together right away.
+        Other directories are walked by the process pool, and posted one by one.
+
+        Args:
+            dir (str): Filepath of the directory
+            children (list): Filenames of the children of dir
+        """
+        sizes = {}
+        results = {}
+        pending = []
+        for child in children:
+            path = FileSystem.pathOfChild(dir, child)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            cached = cls._cache.get(path)
+            if not stat.S_ISDIR(st.st_mode):
+                links = {(st.st_dev, st.st_ino): st.st_size} if st.st_nlink > 1 else {}
+                results[child] = (st.st_size, links)
+                sizes[child] = st.st_size
+            elif cached is not None and cached[0] == st.st_mtime:
+                results[child] = cached[1:]
+                sizes[child] = cached[1]
+            else:
+                pending.append((child, path, st.st_mtime))
+        if not pending:
+            TASKS.post(BasicReducer.setSizes, dir, sizes, f"Disk usage {DiskUsage.format(cls._total(results.values()))}")
+            return
+        TASKS.post(BasicReducer.setSizes, dir, sizes, f"Disk usage - measuring {len(pending)} directories ...")
+        remaining = [len(pending)]
+        pool = cls._getPool()
+        with cls._lock:
+            for child, path, mtime in pending:
+                future = pool.submit(cls._subtree, path)
+                future.add_done_callback(lambda future, child=child, path=path, mtime=mtime:
+                                         cls._finished(future, dir, child, path, mtime, results, remaining))
+                cls._futures.append(future)
+
+    @classmethod
+    def _finished(cls, future, dir, child, path, mtime, results, remaining):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            LOGGER.error(f"Disk usage of {path} failed - {future.exception()!r}")
+            size, links = 0, {}
+        else:
+            size, links = future.result()
+            cls._cache[path] = (mtime, size, links)
+        with cls._lock:
+            results[child] = (size, links)
+            remaining[0] -= 1
+            left = remaining[0]
+        if left > 0:
+            text = f"Disk usage - measuring {left} directories ..."
+        else:
+            text = f"Disk usage {DiskUsage.format(cls._total(list(results.values())))}"
+        TASKS.post(BasicReducer.setSizes, dir, {child: size}, text)
+
+
+class Duplicates:
+    """ Class (container of methods) which finds duplicate files beneath a directory, reading as little as it can
+
+    find() runs on a worker thread of TASKS, and filters the files in three stages,
+        each only looking at the candidates left by the previous one:
+
+        1. The tree is walked, and files are grouped by size - a file with a unique size has no duplicate.
+        2. The first and last EDGE_BYTES of files of the same size are hashed,
+            which tells apart most files which only share a size (and fully hashes small files).
+        3. Only files which still share a size and edge hash are hashed fully.
+
+    Hashing runs in a pool of processes - edges in batches of BATCH_FILES files, and full hashes one file per task,
+        reading files through mmap (or in READ_BYTES reads where mmap is not possible).
+    Hard links to the same file are only counted once, and symlinks, empty files and special files are skipped.
+    Progress is reported with BasicReducer.notify, and the groups are shown with CommandReducer.showDuplicates.
+    """
+
+    EDGE_BYTES = 4096
+    """int: Number of bytes at each end of a file which are hashed before hashing it fully"""
+
+    READ_BYTES = 1024 * 1024
+    """int: Size of the reads of files which cannot be mapped"""
+
+    BATCH_FILES = 64
+    """int: Number of files hashed by one task of the process pool"""
+
+    _pool = None
+
+    @classmethod
+    def _getPool(cls):
+        if cls._pool is None:
+            context = multiprocessing.get_context("spawn")
+            cls._pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=context)
+        return cls._pool
+
+    @classmethod
+    def shutdown(cls):
+        """ Stops the process pool without waiting for it """
+        if cls._pool is not None:
+            cls._pool.shutdown(wait=False, cancel_futures=True)
+            cls._pool = None
+
+    @staticmethod
+    def _hashEdges(file, size):
+        hash = hashlib.blake2b(size.to_bytes(8, "little"))
+        hash.update(file.read(Duplicates.EDGE_BYTES))
+        if size > 2 * Duplicates.EDGE_BYTES:
+            file.seek(size - Duplicates.EDGE_BYTES)
+        hash.update(file.read(Duplicates.EDGE_BYTES))
+        return hash.digest()
+
+    @staticmethod
+    def _hashFull(file, size):
+        hash = hashlib.blake2b()
+        try:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hash.update(mapped)
+        except (OSError, ValueError):
+            file.seek(0)
+            for chunk in iter(lambda: file.read(Duplicates.READ_BYTES), b""):
+                hash.update(chunk)
+        return hash.digest()
+
+    @staticmethod
+    def _hashBatch(files, full):
+        """ Returns the hashes of a batch of (path, size) - of their edges, or full. This is the worker process entry point.
+
+        A file which cannot be read gets the hash None.
+        """
+        hashes = []
+        for path, size in files:
+            try:
+                with open(path, "rb") as file:
+                    hashes.append(Duplicates._hashFull(file, size) if full else Duplicates._hashEdges(file, size))
+            except OSError:
+                hashes.append(None)
+        return hashes
+
+    @staticmethod
+    def _walk(dir):
+        """ Returns a dict mapping sizes to lists of the files of that size beneath dir, counting hard links once """
+        sizes = {}
+        seen = set()
+        stack = [dir]
+        while stack:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if stat.S_ISDIR(st.st_mode):
+                        stack.append(entry.path)
+                    elif stat.S_ISREG(st.st_mode) and st.st_size > 0:
+                        if st.st_nlink > 1:
+                            if (st.st_dev, st.st_ino) in seen:
+                                continue
+                            seen.add((st.st_dev, st.st_ino))
+                        sizes.setdefault(st.st_size, []).append(entry.path)
+        return sizes
+
+    @classmethod
+    def _regroup(cls, groups, full):
+        """ Splits groups of (path, size) by their hashes, hashed by the process pool, and drops those left alone """
+        files = [file for group in groups for file in group]
+        step = 1 if full else cls.BATCH_FILES
+        batches = [files[start:start + step] for start in range(0, len(files), step)]
+        hashes = {}
+        for batch, results in zip(batches, cls._getPool().map(cls._hashBatch, batches, [full] * len(batches))):
+            hashes.update(zip(batch, results))
+        regrouped = {}
+        for index, group in enumerate(groups):
+            for file in group:
+                if hashes[file] is not None:
+                    regrouped.setdefault((index, hashes[file]), []).append(file)
+        return [group for group in regrouped.values() if len(group) > 1]
+
+    @classmethod
+    def find(cls, dir):
+        """ Finds the groups of identical files beneath dir
+
+        Args:
+            dir (str): Filepath of a directory
+
+        Returns:
+            tuple: The list of groups (lists of filepaths, largest wasted space first), 
+                the file size of each group, and the number of bytes which were hashed fully
+        """
+        sizes = cls._walk(dir)
+        groups = [[(path, size) for path in paths] for size, paths in sizes.items() if len(paths) > 1]
+        TASKS.post(BasicReducer.notify, f"Duplicates - hashing the edges of {sum(map(len, groups))} files ...")
+        groups = cls._regroup(groups, full=False)
+        small = [group for group in groups if group[0][1] <= 2 * cls.EDGE_BYTES]
+        large = [group for group in groups if group[0][1] > 2 * cls.EDGE_BYTES]
+        read = sum(size for group in large for path, size in group)
+        TASKS.post(BasicReducer.notify, f"Duplicates - hashing {DiskUsage.format(read)} in {sum(map(len, large))} files ...")
+        groups = small + cls._regroup(large, full=True)
+        groups.sort(key=lambda group: group[0][1] * (len(group) - 1), reverse=True)
+        return [sorted(path for path, size in group) for group in groups], [group[0][1] for group in groups], read
+
+
+class Compare:
+    """ Class (container of methods) which compares two directory trees, for @compare
+
+    Every path beneath either directory is classified as 'only-left', 'only-right', 'same' or 'different'.
+    A directory found on one side only is classified as a whole, without walking it.
+    Symlinks are compared by their targets.
+    Files of the same type are compared by size and mtime first: different sizes are different,
+        and equal sizes and mtimes are the same. The remaining pairs (same size, different mtimes) are ambiguous -
+        they are different, unless contents is set, in which case both files are hashed by the process pool
+        of Duplicates, and compared by their hashes.
+
+    The trees are walked in lockstep, one pair of directories per task of a pool of WORKERS threads,
+        which lists and stats both directories. A pair queues the pairs of its common subdirectories as it completes,
+        so only the directories waiting to be compared are held in memory, never the trees.
+    The results are posted to the application every FLUSH_SECONDS (see CommandReducer.addCompared),
+        so they stream into the list as the subtrees complete, at a few renders per second however many files there are.
+    Starting a comparison cancels the previous one.
+    """
+
+    CLASSES = ("only-left", "only-right", "different", "same")
+    """tuple: Classes of the compared paths"""
+
+    WORKERS = 8
+    """int: Number of threads listing and stat-ing pairs of directories"""
+
+    FLUSH_SECONDS = 0.25
+    """float: Interval at which the results found so far are posted to the application"""
+
+    _generation = 0
+
+    @classmethod
+    def start(cls):
+        """ Cancels the comparison in progress, if any, and returns the generation of the next one """
+        cls.cancel()
+        return cls._generation
+
+    @classmethod
+    def cancel(cls):
+        """ Cancels the comparison in progress, if any - it stops before comparing another pair of directories """
+        cls._generation += 1
+
+    @staticmethod
+    def _scan(dir):
+        """ Returns a dict mapping the names of the entries of dir to their (file type, size, mtime), empty if it cannot be listed """
+        entries = {}
+        try:
+            with os.scandir(dir) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    entries[entry.name] = (stat.S_IFMT(st.st_mode), st.st_size, st.st_mtime_ns)
+        except OSError:
+            pass
+        return entries
+
+    @staticmethod
+    def _target(dir, path):
+        """ Returns the target of the symlink path beneath dir, or None if it cannot be read """
+        try:
+            return os.readlink(os.path.join(dir, path))
+        except OSError:
+            return None
+
+    @classmethod
+    def _pair(cls, left, right, rel):
+        """ Compares the entries of the directories rel beneath left and right
+
+        Returns:
+            tuple: List of (path, class) of the entries classified, list of (path, size) of the ambiguous pairs of files,
+                and list of the paths of the common subdirectories - all paths being relative to left and right
+        """
+        lefts = cls._scan(os.path.join(left, rel))
+        rights = cls._scan(os.path.join(right, rel))
+        classified = []
+        ambiguous = []
+        subdirs = []
+        for name in sorted(lefts.keys() | rights.keys()):
+            path = os.path.join(rel, name)
+            if name not in rights:
+                classified.append((path, "only-left"))
+            elif name not in lefts:
+                classified.append((path, "only-right"))
+            elif lefts[name][0] == rights[name][0] == stat.S_IFDIR:
+                subdirs.append(path)
+            elif lefts[name][:2] != rights[name][:2]:
+                classified.append((path, "different"))
+            elif stat.S_ISLNK(lefts[name][0]):
+                classified.append((path, "same" if cls._target(left, path) == cls._target(right, path) else "different"))
+            elif lefts[name][2] == rights[name][2] or not stat.S_ISREG(lefts[name][0]):
+                classified.append((path, "same"))
+            else:
+                ambiguous.append((path, lefts[name][1]))
+        return classified, ambiguous, subdirs
+
+    @classmethod
+    def compare(cls, left, right, contents, generation):
+        """ Compares the trees beneath left and right, posting CommandReducer.addCompared as results come in
+
+        Runs on a worker thread of TASKS, until the comparison is done or cancelled (see start).
+
+        Args:
+            left (str): Filepath of the directory being viewed
+            right (str): Filepath of the directory it is compared with
+            contents (bool): Whether the ambiguous pairs of files are hashed
+            generation (int): Generation of the comparison (see start)
+        """
+        pool = ThreadPoolExecutor(max_workers=cls.WORKERS, thread_name_prefix="sp-compare")
+        pending = {pool.submit(cls._pair, left, right, ""): None}
+        counts = dict.fromkeys(cls.CLASSES, 0)
+        found = []
+        flushed = time.perf_counter()
+        try:
+            while pending:
+                if generation != cls._generation:
+                    for future in pending:
+                        future.cancel()
+                    return
+                done, _ = wait(pending, timeout=cls.FLUSH_SECONDS, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    if path is not None:
+                        hashes = future.result() if future.exception() is None else [None, None]
+                        found.append((path, "same" if hashes[0] is not None and hashes[0] == hashes[1] else "different"))
+                        continue
+                    classified, ambiguous, subdirs = future.result()
+                    found.extend(classified)
+                    for subdir in subdirs:
+                        pending[pool.submit(cls._pair, left, right, subdir)] = None
+                    for path, size in ambiguous:
+                        if contents:
+                            files = [(os.path.join(left, path), size), (os.path.join(right, path), size)]
+                            pending[Duplicates._getPool().submit(Duplicates._hashBatch, files, True)] = path
+                        else:
+                            found.append((path, "different"))
+                if generation == cls._generation and time.perf_counter() - flushed > cls.FLUSH_SECONDS:
+                    cls._flush(left, right, found, counts, False)
+                    found = []
+                    flushed = time.perf_counter()
+            if generation == cls._generation:
+                cls._flush(left, right, found, counts, True)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _flush(left, right, found, counts, done):
+        """ Counts the paths found, and posts those which are not the same on both sides """
+        for path, kind in found:
+            counts[kind] += 1
+        rows = [(os.path.join(right, path) if kind == "only-right" else path, kind) for path, kind in found if kind != "same"]
+        TASKS.post(CommandReducer.addCompared, left, right, rows, dict(counts), done)
+
+
+class Metadata:
+    """ Class which computes the optional metadata columns of the listbox, only for the visible rows
+
+    The columns are the size, mtime, permissions and owner of a child, which all come from one lstat call.
+    In a large directory, calling lstat on every child would take long,
+        so the Renderer only asks for the rows between scroll_top and scroll_top+list_size.
+    request() hands the children which are neither cached nor already requested
+        to a small thread pool as a single batch,
+        and posts BasicReducer.refresh once the batch is done, so that the rows are rendered again.
+
+    Results are cached per child of a directory, for a bounded number of recently viewed directories.
+    The cache of a directory is dropped when it is listed again because it changed (see BasicReducer.moveDir).
+    Editing a file in place does not change its directory, so the columns of a row which is rendered again
+        are also lstat-ed again in the background once they are REVALIDATE_SECONDS old,
+        and the rows are only refreshed if some of their columns changed.
+    """
+
+    COLUMNS = OrderedDict([("size", 8), ("mtime", 16), ("perm", 10), ("owner", 10)])
+    """OrderedDict: Maps the name of every column to its width (in characters)"""
+
+    CACHE_DIRS = 16
+    """int: Number of directories whose metadata is cached"""
+
+    REVALIDATE_SECONDS = 2.0
+    """float: Age after which the cached columns of a rendered row are lstat-ed again"""
+
+    _cache = OrderedDict()
+    _pending = set()
+    _owners = {}
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _owner(cls, uid):
+        if uid not in cls._owners:
+            try:
+                cls._owners[uid] = pwd.getpwuid(uid).pw_name if pwd is not None else str(uid)
+            except KeyError:
+                cls._owners[uid] = str(uid)
+        return cls._owners[uid]
+
+    @classmethod
+    def _lstat(cls, path):
+        """ Returns the dict of all columns of the file at path, or None if it cannot be stat-ed """
+        try:
+            st = FileSystem.backendOf(path).lstat(path)
+        except OSError:
+            return cls._archiveMember(path)
+        return {
+            "size": DiskUsage.format(st.st_size),
+            "mtime": datetime.fromtimestamp(st.st_mtime).strftime("%Y-%m-%d %H:%M"),
+            "perm": stat.filemode(st.st_mode),
+            "owner": cls._owner(st.st_uid),
+        }
+
+    @classmethod
+    def _archiveMember(cls, path):
+        """ Returns the dict of all columns of a member of an archive, or None if path is not one """
+        located = Archive.locate(path)
+        if located is None:
+            return None
+        try:
+            size, mtime, mode = Archive.lstat(*located)
+        except Archive.ERRORS:
+            return None
+        return {
+            "size": DiskUsage.format(size),
+            "mtime": datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M"),
+            "perm": stat.filemode(mode),
+            "owner": "",
+        }
+
+    @classmethod
+    def get(cls, dir, child):
+        """ Returns the cached columns of a child, or None if they have not been computed yet
+
+        Args:
+            dir (str): Filepath of the parent directory
+            child (str): Filename of the child
+
+        Returns:
+            dict: Maps column names to their text, or None
+        """
+        entry = cls._cache.get(dir, {}).get(child)
+        return None if entry is None else entry[1]
+
+    @classmethod
+    def forget(cls, dir):
+        """ Drops the cached columns of the children of dir
+
+        Args:
+            dir (str): Filepath of a directory
+        """
+        with cls._lock:
+            cls._cache.pop(dir, None)
+
+    @classmethod
+    def request(cls, dir, children):
+        """ Starts computing the columns of those children which are neither cached (recently enough) nor pending
+
+        Args:
+            dir (str): Filepath of the parent directory
+            children (list): Filenames of the (visible) children
+
+        Returns:
+            concurrent.futures.Future: Future of the batch, or None if there was nothing to compute,
+                or if dir is on a slow mount (see Mounts), whose children are shown by name only
+        """
+        if Mounts.isSlow(FileSystem.deviceOf(dir)):
+            return None
+        expired = time.monotonic() - cls.REVALIDATE_SECONDS
+        with cls._lock:
+            cached = cls._cache.get(dir, {})
+            batch = [child for child in children
+                     if (child not in cached or cached[child][0] < expired) and (dir, child) not in cls._pending]
+            if not batch:
+                return None
+            cls._pending.update((dir, child) for child in batch)
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sp-stat")
+        return cls._executor.submit(cls._collect, dir, batch)
+
+    @classmethod
+    def _collect(cls, dir, batch):
+        columns = {child: cls._lstat(FileSystem.pathOfChild(dir, child)) for child in batch}
+        checked = time.monotonic()
+        with cls._lock:
+            cached = cls._cache.setdefault(dir, {})
+            changed = any(child not in cached or cached[child][1] != columns[child] for child in batch)
+            cached.update((child, (checked, columns[child])) for child in batch)
+            cls._cache.move_to_end(dir)
+            if len(cls._cache) > cls.CACHE_DIRS:
+                cls._cache.popitem(last=False)
+            cls._pending.difference_update((dir, child) for child in batch)
+        if changed:
+            TASKS.post(BasicReducer.refresh)
+
+
+class Preview:
+    """ Class which reads previews of files on a worker thread, with a bounded cache
+
+    A preview is the first MAX_BYTES of a file, decoded as UTF-8 text,
+        or a hex dump of its first HEX_BYTES if it looks like a binary file.
+    The file is read with a single bounded read on a worker thread,
+        so neither huge files nor slow mounts can block the Tk loop,
+        and the read goes through Mounts.call, so a hung mount cannot block the worker either.
+
+    Only the most recent request matters, since the selection moves on with every Up/Down press.
+    A new request cancels the previous one if it has not started yet,
+        and a request which starts after being superseded returns before opening the file.
+    Once a preview is read, it is cached and BasicReducer.refresh is posted, so that it is rendered.
+
+    The cache is a LRU cache bounded by the total size of the cached previews (CACHE_BYTES).
+    Previews of the children of a directory are dropped when it is listed again because it changed (see BasicReducer.moveDir).
+    Every preview is cached with the (st_mtime_ns, st_size) of its file, and revalidated on the worker thread
+        whenever the selection moves onto the file, so a file edited in place is read again.
+    """
+
+    MAX_BYTES = 4096
+    """int: Number of bytes of a file which are previewed as text"""
+
+    HEX_BYTES = 512
+    """int: Number of bytes of a binary file which are previewed as a hex dump"""
+
+    CACHE_BYTES = 4 * 1024 * 1024
+    """int: Maximum total length of the cached previews"""
+
+    _cache = OrderedDict()
+    _cache_bytes = 0
+    _wanted = None
+    _checked = None
+    _future = None
+    _executor = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def text(data):
+        """ Returns the first bytes of a file decoded as text, or None if they look like a binary file
+
+        Data containing a NUL byte, or which is not valid UTF-8, looks like a binary file.
+        A multi-byte character cut in half at the end of data does not count as invalid.
+
+        Args:
+            data (bytes): First bytes of a file
+
+        Returns:
+            str: The decoded text, or None
+        """
+        if b"\0" not in data:
+            for cut in range(4):
+                try:
+                    return data[:len(data)-cut].decode("utf-8")
+                except UnicodeDecodeError:
+                    continue
+        return None
+
+    @staticmethod
+    def decode(data):
+        """ Returns the preview text of the first bytes of a file - the text itself, or a hex dump for binary files
+
+        Args:
+            data (bytes): First bytes of a file
+
+        Returns:
+            str: Preview text
+        """
+        text = Preview.text(data)
+        return text if text is not None else Preview.hexDump(data[:Preview.HEX_BYTES])
+
+    @staticmethod
+    def hexDump(data):
+        """ Returns a hex dump of data, 16 bytes per line, like hexdump -C
+
+        Args:
+            data (bytes): Bytes to dump
+
+        Returns:
+            str: Hex dump
+        """
+        lines = []
+        for offset in range(0, len(data), 16):
+            chunk = data[offset:offset+16]
+            hex = " ".join(f"{byte:02x}" for byte in chunk)
+            text = "".join(chr(byte) if 32 <= byte < 127 else "." for byte in chunk)
+            lines.append(f"{offset:08x}  {hex:<47}  |{text}|")
+        return "\n".join(lines)
+
+    @classmethod
+    def get(cls, path):
+        """ Returns the cached preview of path, or None if it has not been read
+
+        Args:
+            path (str): Filepath of a file
+
+        Returns:
+            str: Preview text, or None
+        """
+        with cls._lock:
+            entry = cls._cache.get(path)
+            if entry is None:
+                return None
+            cls._cache.move_to_end(path)
+            return entry[1]
+
+    @classmethod
+    def forget(cls, dir):
+        """ Drops the cached previews of the children of dir
+
+        Args:
+            dir (str): Filepath of a directory
+        """
+        with cls._lock:
+            for path in [path for path in cls._cache if os.path.dirname(path) == dir]:
+                cls._cache_bytes -= len(cls._cache.pop(path)[1])
+
+    @classmethod
+    def request(cls, path):
+        """ Starts reading the preview of path, or revalidating its cached preview, superseding the previous request
+
+        A cached preview is only revalidated once each time the selection moves onto the file, not on every render.
+
+        Args:
+            path (str): Filepath of a file
+
+        Returns:
+            concurrent.futures.Future: Future of the read, or None if the preview was already checked or requested
+        """
+        with cls._lock:
+            if path == cls._wanted or (path == cls._checked and path in cls._cache):
+                return None
+            cls._wanted = path
+            cls._checked = path
+            if cls._future is not None:
+                cls._future.cancel()
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sp-preview")
+            cls._future = cls._executor.submit(cls._read, path)
+            return cls._future
+
+    @classmethod
+    def _head(cls, path):
+        """ Returns the first MAX_BYTES of a file """
+        with FileSystem.backendOf(path).open(path) as file:
+            return file.read(cls.MAX_BYTES)
+
+    @classmethod
+    def _read(cls, path):
+        if cls._wanted != path:
+            return
+        device = FileSystem.deviceOf(os.path.dirname(path))
+        with cls._lock:
+            cached = cls._cache.get(path)
+        key = None
+        try:
+            status = Mounts.call(device, FileSystem.backendOf(path).stat, path)
+            key = (status.st_mtime_ns, status.st_size)
+            if cached is not None and cached[0] == key:
+                text = None
+            else:
+                text = cls.decode(Mounts.call(device, cls._head, path))
+        except TimeoutError as error:
+            text = None if cached is not None else f"Cannot preview - {error.strerror}"
+        except OSError as error:
+            located = Archive.locate(path)
+            text = f"Cannot preview - {error.strerror}"
+            if located is not None:
+                try:
+                    text = cls.decode(Archive.read(*located, cls.MAX_BYTES))
+                except Archive.ERRORS as error:
+                    text = f"Cannot preview - {error}"
+        with cls._lock:
+            if cls._wanted == path:
+                cls._wanted = None
+            if text is None:
+                return
+            if path in cls._cache:
+                cls._cache_bytes -= len(cls._cache.pop(path)[1])
+            cls._cache[path] = (key, text)
+            cls._cache_bytes += len(text)
+            while cls._cache_bytes > cls.CACHE_BYTES and len(cls._cache) > 1:
+                cls._cache_bytes -= len(cls._cache.popitem(last=False)[1][1])
+        TASKS.post(BasicReducer.refresh)
+
+
+class FileType:
+    """ Class which classifies the children of a directory for the colors of their rows, only for the visible rows
+
+    The classes are 'dir', 'symlink', 'broken' (symlink), 'exec' (executable), 'special' (socket, FIFO or device),
+        and for other files, the kind of their content - 'text', 'image', 'archive' or 'binary'.
+
+    fast() classifies a child without any I/O, from the cached listing of its directory and its extension,
+        and is what every row is painted with until it is classified.
+    The Renderer requests the full classification of the visible rows only, like Metadata:
+        request() hands them to a small thread pool as a single batch, which lstats them,
+        and sniffs the magic bytes (the first SNIFF_BYTES) of regular files whose extension is not in EXTENSIONS.
+        BasicReducer.refresh is posted once the batch is done, so that the rows are painted again.
+
+    Classes are cached per child of a directory, for a bounded number of recently viewed directories,
+        and dropped when the directory is listed again because it changed (see BasicReducer.moveDir).
+    The sniffed content kinds are also cached by (st_dev, st_ino, st_mtime_ns) of the file,
+        so a file is never read twice unless it changes, even after its directory is listed again or it is renamed.
+    """
+
+    EXTENSIONS = {
+        **dict.fromkeys([".txt", ".md", ".rst", ".py", ".c", ".h", ".cpp", ".js", ".ts", ".json", ".yaml", ".yml",
+                         ".toml", ".ini", ".cfg", ".csv", ".html", ".css", ".xml", ".sh", ".log", ".java", ".go",
+                         ".rs", ".rb", ".sql"], "text"),
+        **dict.fromkeys([".png", ".jpg", ".jpeg", ".gif", ".bmp", ".svg", ".webp", ".ico", ".tif", ".tiff"], "image"),
+        **dict.fromkeys([".zip", ".tar", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".jar", ".whl", ".zst"], "archive"),
+        **dict.fromkeys([".so", ".o", ".a", ".dll", ".exe", ".pyc", ".bin", ".pdf", ".iso", ".sqlite", ".db"], "binary"),
+    }
+    """dict: Maps lowercase extensions to the content kind of the files they name"""
+
+    MAGIC = [
+        (0, b"\x89PNG", "image"), (0, b"\xff\xd8\xff", "image"), (0, b"GIF8", "image"), (0, b"PK\x03\x04", "archive"), (0, b"\x1f\x8b", "archive"), (0, b"BZh", "archive"),
+        (0, b"\xfd7zXZ", "archive"), (0, b"7z\xbc\xaf", "archive"), (257, b"ustar", "archive"),
+        (0, b"\x7fELF", "binary"), (0, b"%PDF", "binary"),
+    ]
+    """list: Tuples (offset, magic bytes, content kind), checked in order before the text check of Preview.text"""
+
+    SNIFF_BYTES = 512
+    """int: Number of bytes of a file which are sniffed"""
+
+    COLORS = {
+        "dir": None,
+        "file": ("yellow", "orange"),
+        "text": ("yellow", "orange"),
+        "image": ("light pink", "hot pink"),
+        "archive": ("burlywood", "peru"),
+        "binary": ("khaki", "dark khaki"),
+        "exec": ("pale green", "lime green"),
+        "symlink": ("light cyan", "dark turquoise"),
+        "broken": ("salmon", "red"),
+        "special": ("plum", "orchid"),
+    }
+    """dict: Maps classes to the (background, selectbackground) of their rows, or None for the default colors"""
+
+    CACHE_DIRS = 16
+    """int: Number of directories whose classes are cached"""
+
+    SNIFF_ENTRIES = 65536
+    """int: Number of sniffed content kinds which are cached"""
+
+    _cache = OrderedDict()
+    _sniffed = OrderedDict()
+    _pending = set()
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def fast(cls, child, dirorfile):
+        """ Returns the class of a child without any I/O, from its extension
+
+        Args:
+            child (str): Filename of the child
+            dirorfile (str): FileSystem.dirOrFile of the child (which is served by the listing cache)
+
+        Returns:
+            str: 'dir', the content kind of the extension of the child, or 'file' if it is not known
+        """
+        if dirorfile == "dir":
+            return "dir"
+        return cls.EXTENSIONS.get(os.path.splitext(child)[1].lower(), "file")
+
+    @classmethod
+    def get(cls, dir, child):
+        """ Returns the cached class of a child, or None if it has not been classified yet
+
+        Args:
+            dir (str): Filepath of the parent directory
+            child (str): Filename of the child
+
+        Returns:
+            str: Class (see COLORS), or None
+        """
+        return cls._cache.get(dir, {}).get(child)
+
+    @classmethod
+    def forget(cls, dir):
+        """ Drops the cached classes of the children of dir (but not the sniffed content kinds)
+
+        Args:
+            dir (str): Filepath of a directory
+        """
+        with cls._lock:
+            cls._cache.pop(dir, None)
+
+    @classmethod
+    def request(cls, dir, children):
+        """ Starts classifying those children which are neither cached nor pending
+
+        Args:
+            dir (str): Filepath of the parent directory
+            children (list): Filenames of the (visible) children
+
+        Returns:
+            concurrent.futures.Future: Future of the batch, or None if there was nothing to classify,
+                or if dir is on a slow mount (see Mounts), whose children are colored by extension only
+        """
+        if Mounts.isSlow(FileSystem.deviceOf(dir)):
+            return None
+        with cls._lock:
+            cached = cls._cache.get(dir, {})
+            batch = [child for child in children if child not in cached and (dir, child) not in cls._pending]
+            if not batch:
+                return None
+            cls._pending.update((dir, child) for child in batch)
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sp-type")
+        return cls._executor.submit(cls._collect, dir, batch)
+
+    @classmethod
+    def _collect(cls, dir, batch):
+        classes = {child: cls.classify(FileSystem.pathOfChild(dir, child)) for child in batch}
+        with cls._lock:
+            cls._cache.setdefault(dir, {}).update(classes)
+            cls._cache.move_to_end(dir)
+            if len(cls._cache) > cls.CACHE_DIRS:
+                cls._cache.popitem(last=False)
+            cls._pending.difference_update((dir, child) for child in batch)
+        TASKS.post(BasicReducer.refresh)
+
+    @classmethod
+    def classify(cls, path):
+        """ Returns the class of the file at path, reading its first bytes if its extension is not known
+
+        Args:
+            path (str): Filepath of a file
+
+        Returns:
+            str: Class (see COLORS)
+        """
+        backend = FileSystem.backendOf(path)
+        try:
+            st = backend.lstat(path)
+        except OSError:
+            located = Archive.locate(path)
+            if located is None or Archive.kind(*located) is None:
+                return "broken"
+            if Archive.kind(*located) == "dir":
+                return "dir"
+            return cls.EXTENSIONS.get(os.path.splitext(path)[1].lower()) or cls._sniff(path, None)
+        if stat.S_ISLNK(st.st_mode):
+            try:
+                backend.stat(path)
+            except OSError:
+                return "broken"
+            return "symlink"
+        if stat.S_ISDIR(st.st_mode):
+            return "dir"
+        if not stat.S_ISREG(st.st_mode):
+            return "special"
+        if st.st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+            return "exec"
+        return cls.EXTENSIONS.get(os.path.splitext(path)[1].lower()) or cls._sniff(path, st)
+
+    @classmethod
+    def _sniff(cls, path, st):
+        """ Returns the content kind of a file from its magic bytes, cached by (st_dev, st_ino, st_mtime_ns) of st
+
+        Members of archives (st is None) are read with Archive.read, and like files without an inode number
+            (such as those of a MemoryBackend), they are not cached.
+        """
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns) if st is not None and st.st_ino else None
+        with cls._lock:
+            kind = cls._sniffed.get(key)
+        if kind is not None:
+            return kind
+        try:
+            if st is None:
+                data = Archive.read(*Archive.locate(path), cls.SNIFF_BYTES)
+            else:
+                with FileSystem.backendOf(path).open(path) as file:
+                    data = file.read(cls.SNIFF_BYTES)
+        except (OSError, *Archive.ERRORS):
+            return "file"
+        kind = next((kind for offset, magic, kind in cls.MAGIC if data[offset:offset + len(magic)] == magic), None)
+        if kind is None:
+            kind = "text" if Preview.text(data) is not None else "binary"
+        if key is not None:
+            with cls._lock:
+                cls._sniffed[key] = kind
+                if len(cls._sniffed) > cls.SNIFF_ENTRIES:
+                    cls._sniffed.popitem(last=False)
+        return kind
+
+
+class Launcher:
+    """ Class which launches programs on files without blocking the Tk loop, and keeps track of them
+
+    A command typed in command mode is split into an argument list (like a shell would split it),
+        the filepaths are appended as the last arguments, and the program is started with subprocess.Popen
+        directly, without an intermediate shell, so filepaths with spaces or quotes just work.
+    A command starting with SHELL_PREFIX is run by the shell instead (with the filepath quoted),
+        for when pipes or redirections are wanted.
+
+    Popen is called on a dedicated launcher thread, because forking a large process can take a while.
+    Each started program gets a reaper thread, which keeps the tail of its output,
+        waits for it to exit, records its exit status and elapsed time, and posts a notice to the application.
+    The most recent MAX_JOBS jobs are kept in Launcher.jobs, newest last.
+    """
+
+    SHELL_PREFIX = "!"
+
+    MAX_JOBS = 50
+    """int: Number of recent jobs which are remembered"""
+
+    OUTPUT_BYTES = 4096
+    """int: Number of bytes at the end of a job's output which are kept"""
+
+    jobs = deque(maxlen=MAX_JOBS)
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def argv(cls, command, *paths):
+        """ Returns the argument list (or shell command string) which runs command on paths
+
+        Args:
+            command (str): Command typed by the user
+            paths (str): Filepaths of the files to run command on
+
+        Returns:
+            tuple: (args, shell) - the args to hand to Popen, and whether they are for the shell
+        """
+        if command.startswith(cls.SHELL_PREFIX):
+            return " ".join([command[len(cls.SHELL_PREFIX):]] + [shlex.quote(path) for path in paths]), True
+        return shlex.split(command, posix=(os.name != "nt")) + list(paths), False
+
+    @classmethod
+    def launch(cls, command, *paths):
+        """ Starts running command on paths in the background, returning right away
+
+        Args:
+            command (str): Command typed by the user
+            paths (str): Filepaths of the files to run command on
+
+        Returns:
+            dict: The job, with keys "command", "paths", "pid", "start", "elapsed", "status" and "output"
+                which are filled in as the job progresses
+        """
+        job = {"command": command, "paths": paths, "pid": None, "start": time.monotonic(),
+               "elapsed": None, "status": None, "output": b"", "pane": TASKS.currentPane()}
+        with cls._lock:
+            cls.jobs.append(job)
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sp-launch")
+        cls._executor.submit(cls._start, job)
+        return job
+
+    @classmethod
+    def _start(cls, job):
+        try:
+            args, shell = cls.argv(job["command"], *job["paths"])
+            process = subprocess.Popen(args, shell=shell, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, start_new_session=(os.name != "nt"))
+        except (OSError, ValueError) as error:
+            job["elapsed"] = time.monotonic() - job["start"]
+            job["status"] = error
+            LOGGER.error(f"Could not launch {job['command']} - {error}")
+            TASKS.postTo(job["pane"], BasicReducer.notify, f"Could not launch {job['command']}: {error}")
+            return
+        job["pid"] = process.pid
+        LOGGER.info(f"Launched {job['command']} on {len(job['paths'])} files as pid {process.pid}")
+        threading.Thread(target=cls._reap, args=(job, process), name=f"sp-reap-{process.pid}", daemon=True).start()
+
+    @classmethod
+    def _reap(cls, job, process):
+        output = b""
+        for chunk in iter(lambda: process.stdout.read1(cls.OUTPUT_BYTES), b""):
+            output = (output + chunk)[-cls.OUTPUT_BYTES:]
+            job["output"] = output
+        process.stdout.close()
+        job["status"] = process.wait()
+        job["elapsed"] = time.monotonic() - job["start"]
+        LOGGER.info(f"{job['command']} (pid {process.pid}) exited with status {job['status']} after {job['elapsed']:.1f}s")
+        if job["status"] != 0:
+            TASKS.postTo(job["pane"], BasicReducer.notify, cls.describe(job))
+
+    @classmethod
+    def describe(cls, job):
+        """ Returns a one line description of a job
+
+        Args:
+            job (dict): A job returned by launch
+
+        Returns:
+            str: Description of the job
+        """
+        if job["status"] is None:
+            return f"{job['command']}: running for {time.monotonic() - job['start']:.1f}s"
+        if isinstance(job["status"], Exception):
+            return f"{job['command']}: could not launch ({job['status']})"
+        last = job["output"].decode("utf-8", "replace").strip().splitlines()[-1:]
+        detail = f" - {last[0]}" if last else ""
+        return f"{job['command']}: exited with {job['status']} after {job['elapsed']:.1f}s{detail}"
+
+
+class Batch:
+    """ Class which runs a command over many files in parallel, reporting aggregated progress
+
+    A batch runs the command once per chunk of files, where a chunk is a single file (like a for loop),
+        or as many files as fit in one argument list (like xargs).
+    Up to `jobs` chunks run at the same time, each with subprocess.run on a thread of a pool,
+        while a coordinating task on TASKS collects their exit statuses.
+    Every PROGRESS_SECONDS, and when the batch is done, the coordinator posts a notice
+        with the number of files done, the number which failed and the throughput.
+
+    The most recent batches are kept in Batch.batches, newest last.
+    """
+
+    PROGRESS_SECONDS = 0.25
+    """float: Minimum interval between progress notices"""
+
+    ARG_BYTES = 128 * 1024
+    """int: Maximum total length of the filepaths passed to one command in xargs mode"""
+
+    batches = deque(maxlen=10)
+
+    @staticmethod
+    def parseOptions(arg):
+        """ Splits leading -j N (number of parallel jobs) and -n N (files per command) options from a command
+
+        Args:
+            arg (str): Argument string of a batch builtin command, e.g. "-j 4 gzip -9"
+
+        Returns:
+            tuple: (jobs, max_args, command) - jobs and max_args are None if they were not given
+        """
+        options = {}
+        match = re.match(r"((?:-[jn]\s*\d+\s+)*)(.*)", arg, re.DOTALL)
+        for name, value in re.findall(r"-([jn])\s*(\d+)", match.group(1)):
+            options[name] = int(value)
+        return options.get("j"), options.get("n"), match.group(2)
+
+    @classmethod
+    def chunks(cls, paths, max_args=None):
+        """ Splits paths into chunks of at most max_args paths and at most ARG_BYTES bytes
+
+        Args:
+            paths (list): Filepaths
+            max_args (int): Maximum number of paths per chunk, or None for no limit
+
+        Returns:
+            list: Lists of filepaths
+        """
+        chunks = []
+        chunk = []
+        size = 0
+        for path in paths:
+            if chunk and ((max_args is not None and len(chunk) >= max_args) or size + len(path) + 1 > cls.ARG_BYTES):
+                chunks.append(chunk)
+                chunk = []
+                size = 0
+            chunk.append(path)
+            size += len(path) + 1
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    @classmethod
+    def start(cls, command, paths, jobs=None, max_args=1):
+        """ Starts running command over paths in the background
+
+        Args:
+            command (str): Command typed by the user (see Launcher.argv)
+            paths (list): Filepaths of the files to run command over
+            jobs (int): Maximum number of commands running at once, or None for one per CPU
+            max_args (int): Maximum number of files per command, or None for as many as fit
+
+        Returns:
+            dict: The batch, with keys "command", "total", "done", "failed", "errors", "start" and "elapsed"
+                which are updated as the batch progresses
+        """
+        batch = {"command": command, "total": len(paths), "done": 0, "failed": 0, "errors": [],
+                 "start": time.monotonic(), "elapsed": None}
+        cls.batches.append(batch)
+        TASKS.submit(cls._run, (batch, cls.chunks(paths, max_args), jobs or os.cpu_count() or 1))
+        return batch
+
+    @staticmethod
+    def _runChunk(command, chunk):
+        args, shell = Launcher.argv(command, *chunk)
+        try:
+            process = subprocess.run(args, shell=shell, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.PIPE, start_new_session=(os.name != "nt"))
+        except (OSError, ValueError) as error:
+            return -1, str(error)
+        return process.returncode, process.stderr.decode("utf-8", "replace").strip()[-200:]
+
+    @classmethod
+    def _run(cls, batch, chunks, jobs):
+        LOGGER.info(f"Running batch {batch['command']} over {batch['total']} files in {len(chunks)} commands, {jobs} at a time")
+        posted = time.monotonic()
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="sp-batch") as pool:
+            futures = {pool.submit(cls._runChunk, batch["command"], chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                status, error = future.result()
+                batch["done"] += len(futures[future])
+                if status != 0:
+                    batch["failed"] += len(futures[future])
+                    batch["errors"].append((futures[future][0], status, error))
+                    LOGGER.warning(f"Batch {batch['command']} failed with status {status} on {futures[future]} - {error}")
+                if time.monotonic() - posted >= cls.PROGRESS_SECONDS:
+                    posted = time.monotonic()
+                    TASKS.post(BasicReducer.notify, cls.describe(batch))
+        batch["elapsed"] = time.monotonic() - batch["start"]
+        LOGGER.info(cls.describe(batch))
+        TASKS.post(BasicReducer.notify, cls.describe(batch))
+
+    @staticmethod
+    def describe(batch):
+        """ Returns a one line description of the progress of a batch
+
+        Args:
+            batch (dict): A batch returned by start
+
+        Returns:
+            str: Description of the batch
+        """
+        elapsed = batch["elapsed"] or (time.monotonic() - batch["start"])
+        rate = batch["done"] / elapsed if elapsed > 0 else 0
+        text = f"{batch['command']}: {batch['done']}/{batch['total']} files, {batch['failed']} failed, {rate:.0f} files/s"
+        if batch["elapsed"] is not None:
+            text += f", done in {elapsed:.1f}s"
+        if batch["errors"]:
+            path, status, error = batch["errors"][0]
+            text += f" - first failure {os.path.basename(path)} ({status}): {error.splitlines()[-1] if error else ''}"
+        return text
+
+
+class FileOperations:
+    """ Class which copies, moves, deletes and trashes files in the background
+
+    An operation runs as a task on TASKS, which plans the work and hands the files to a pool of threads.
+    Files are copied in parallel, with os.copy_file_range where the platform has it,
+        so the data never passes through user space (and may even be shared by the filesystem),
+        falling back to os.sendfile and finally to plain reads and writes.
+    Moves within a filesystem are a single rename per item; moves across filesystems copy and then delete.
+    Trashing follows the freedesktop.org trash specification.
+
+    When a destination already exists, the conflict policy decides what happens:
+        "skip" leaves it alone, "overwrite" replaces it,
+        and "rename" copies to a new name such as "report (1).txt".
+
+    Operations can be cancelled with cancel(); they stop at the next file (or the next chunk of a large file).
+    Every PROGRESS_SECONDS, and when an operation is done, a notice with its progress is posted,
+        together with BasicReducer.applyChanges for the children added to and removed from each directory,
+        so the affected listings are updated in place rather than listed again.
+
+    The most recent operations are kept in FileOperations.operations, newest last.
+    """
+
+    POLICIES = ["skip", "overwrite", "rename"]
+
+    WORKERS = 4
+    """int: Number of files copied at the same time"""
+
+    CHUNK_BYTES = 8 * 1024 * 1024
+    """int: Number of bytes copied per system call"""
+
+    PROGRESS_SECONDS = 0.25
+    """float: Minimum interval between progress notices"""
+
+    operations = deque(maxlen=10)
+    _lock = threading.Lock()
+
+    @classmethod
+    def start(cls, kind, sources, dest=None, policy="skip"):
+        """ Starts an operation in the background
+
+        Args:
+            kind (str): One of "copy", "move", "delete" and "trash"
+            sources (list): Filepaths of the files and directories to operate on
+            dest (str): Filepath of the destination directory (for copy and move)
+            policy (str): Conflict policy, one of POLICIES
+
+        Returns:
+            dict: The operation, whose progress keys ("files_done", "bytes_done", "failed", ...)
+                are updated as it progresses
+        """
+        op = {"kind": kind, "sources": list(sources), "dest": dest, "policy": policy,
+              "files_total": 0, "files_done": 0, "bytes_total": 0, "bytes_done": 0, "skipped": 0,
+              "failed": 0, "errors": [], "cancelled": False, "start": time.monotonic(), "elapsed": None,
+              "changes": {}, "posted": 0, "pane": TASKS.currentPane()}
+        cls.operations.append(op)
+        TASKS.submit(cls._run, (op,))
+        return op
+
+    @classmethod
+    def cancel(cls):
+        """ Cancels every running operation
+
+        Returns:
+            int: Number of operations cancelled
+        """
+        running = [op for op in cls.operations if op["elapsed"] is None and not op["cancelled"]]
+        for op in running:
+            op["cancelled"] = True
+        return len(running)
+
+    @classmethod
+    def copyFile(cls, src, dst, op=None):
+        """ Copies the data of file src to file dst without passing it through user space where possible
+
+        A method which copies nothing on its first call falls back to the next one, rather than taking it for the end of the file:
+            os.copy_file_range returns 0 for non-empty files on procfs, sysfs and some FUSE and overlay filesystems.
+
+        Args:
+            src (str): Filepath of the source file
+            dst (str): Filepath of the destination file (truncated if it exists)
+            op (dict): Operation to count the copied bytes in and check for cancellation, or None
+
+        Returns:
+            bool: False if the operation was cancelled part way, True otherwise
+        """
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            infd, outfd = fsrc.fileno(), fdst.fileno()
+            methods = []
+            if hasattr(os, "copy_file_range"):
+                methods.append(lambda: os.copy_file_range(infd, outfd, cls.CHUNK_BYTES))
+            if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+                methods.append(lambda: os.sendfile(outfd, infd, None, cls.CHUNK_BYTES))
+            methods.append(lambda: fdst.write(fsrc.read(cls.CHUNK_BYTES)))
+            done = 0
+            for method in methods:
+                try:
+                    while True:
+                        copied = method()
+                        if copied == 0:
+                            if done == 0 and method is not methods[-1]:
+                                break
+                            return True
+                        done += copied
+                        if op is not None:
+                            with cls._lock:
+                                op["bytes_done"] += copied
+                            if op["cancelled"]:
+                                return False
+                except OSError as error:
+                    if method is methods[-1] or error.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP):
+                        raise
+        return True
+
+    @staticmethod
+    def _target(path, policy):
+        """ Returns where to put an item whose destination is path, or None to skip it, following policy """
+        if not os.path.lexists(path) or policy == "overwrite":
+            return path
+        if policy == "skip":
+            return None
+        root, ext = os.path.splitext(path)
+        number = 1
+        while os.path.lexists(f"{root} ({number}){ext}"):
+            number += 1
+        return f"{root} ({number}){ext}"
+
+    @staticmethod
+    def _checkTarget(src, dst):
+        """ Raises OSError if copying src to dst would overwrite src itself, or copy a directory into its own subtree
+
+        Either would destroy the source: a file is truncated before it is read,
+            and a directory tree is walked while its copy is created inside it.
+        """
+        source = os.path.realpath(src)
+        target = os.path.realpath(dst)
+        if target == source:
+            raise OSError(errno.EINVAL, f"Source and destination are the same file: {dst}")
+        if os.path.isdir(src) and not os.path.islink(src) and target.startswith(source.rstrip(os.sep) + os.sep):
+            raise OSError(errno.EINVAL, f"Cannot copy a directory into itself: {dst}")
+
+    @classmethod
+    def _record(cls, op, dir, added=(), removed=()):
+        with cls._lock:
+            change = op["changes"].setdefault(dir, (set(), set()))
+            change[0].update(added)
+            change[1].update(removed)
+
+    @classmethod
+    def _fail(cls, op, path, error):
+        LOGGER.warning(f"{op['kind']} failed on {path} - {error}")
+        with cls._lock:
+            op["failed"] += 1
+            op["errors"].append((path, str(error)))
+
+    @classmethod
+    def _progress(cls, op, force=False):
+        """ Posts the progress of op and the changes since the last post, at most every PROGRESS_SECONDS """
+        now = time.monotonic()
+        if not force and now - op["posted"] < cls.PROGRESS_SECONDS:
+            return
+        with cls._lock:
+            op["posted"] = now
+            changes = {dir: (sorted(added), sorted(removed)) for dir, (added, removed) in op["changes"].items()}
+            op["changes"] = {}
+        if changes:
+            TASKS.postTo(None, BasicReducer.applyChanges, changes)
+        TASKS.postTo(op["pane"], BasicReducer.notify, cls.describe(op))
+
+    @classmethod
+    def _run(cls, op):
+        LOGGER.info(f"Starting {op['kind']} of {len(op['sources'])} items to {op['dest']}")
+        try:
+            getattr(cls, "_" + op["kind"])(op)
+        finally:
+            op["elapsed"] = time.monotonic() - op["start"]
+            LOGGER.info(cls.describe(op))
+            cls._progress(op, force=True)
+
+    @classmethod
+    def _plan(cls, op, src, dst):
+        """ Creates the directories of the tree src at dst, and returns (src, dst, size) for every file in it """
+        plan = []
+        if os.path.isdir(src) and not os.path.islink(src):
+            for dir, dirs, files in os.walk(src):
+                target = os.path.join(dst, os.path.relpath(dir, src))
+                os.makedirs(target, exist_ok=True)
+                for name in files + [name for name in dirs if os.path.islink(os.path.join(dir, name))]:
+                    path = os.path.join(dir, name)
+                    plan.append((path, os.path.join(target, name), os.lstat(path).st_size))
+        else:
+            plan.append((src, dst, os.lstat(src).st_size))
+        return plan
+
+    @classmethod
+    def _copyOne(cls, op, src, dst, size):
+        if op["cancelled"]:
+            return
+        try:
+            if os.path.islink(src):
+                if os.path.lexists(dst):
+                    os.unlink(dst)
+                os.symlink(os.readlink(src), dst)
+            elif cls.copyFile(src, dst, op):
+                shutil.copystat(src, dst)
+        except OSError as error:
+            cls._fail(op, src, error)
+        with cls._lock:
+            op["files_done"] += 1
+        cls._progress(op)
+
+    @classmethod
+    def _copyTree(cls, op, sources):
+        """ Copies sources into op["dest"] in parallel, returning the sources which were copied completely """
+        plan = []
+        copied = []
+        for src in sources:
+            dst = cls._target(os.path.join(op["dest"], os.path.basename(src)), op["policy"])
+            if dst is None:
+                op["skipped"] += 1
+                continue
+            try:
+                cls._checkTarget(src, dst)
+                plan.extend(cls._plan(op, src, dst))
+            except OSError as error:
+                cls._fail(op, src, error)
+                continue
+            copied.append(src)
+            cls._record(op, op["dest"], added=[os.path.basename(dst)])
+        op["files_total"] += len(plan)
+        op["bytes_total"] += sum(size for src, dst, size in plan)
+        failed = op["failed"]
+        with ThreadPoolExecutor(max_workers=cls.WORKERS, thread_name_prefix="sp-copy") as pool:
+            list(pool.map(lambda item: cls._copyOne(op, *item), plan))
+        return copied if op["failed"] == failed and not op["cancelled"] else []
+
+    @classmethod
+    def _copy(cls, op):
+        cls._copyTree(op, op["sources"])
+
+    @classmethod
+    def _move(cls, op):
+        try:
+            device = os.stat(op["dest"]).st_dev
+        except OSError as error:
+            for src in op["sources"]:
+                cls._fail(op, src, error)
+            return
+        across = []
+        for src in op["sources"]:
+            if op["cancelled"]:
+                return
+            try:
+                if os.lstat(src).st_dev != device:
+                    across.append(src)
+                    continue
+            except OSError as error:
+                cls._fail(op, src, error)
+                continue
+            dst = cls._target(os.path.join(op["dest"], os.path.basename(src)), op["policy"])
+            if dst is None:
+                op["skipped"] += 1
+                continue
+            op["files_total"] += 1
+            try:
+                os.replace(src, dst)
+            except OSError as error:
+                cls._fail(op, src, error)
+                continue
+            op["files_done"] += 1
+            cls._record(op, os.path.dirname(src), removed=[os.path.basename(src)])
+            cls._record(op, op["dest"], added=[os.path.basename(dst)])
+            cls._progress(op)
+        for src in cls._copyTree(op, across):
+            cls._remove(op, src)
+
+    @classmethod
+    def _remove(cls, op, path):
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+        except OSError as error:
+            cls._fail(op, path, error)
+            return
+        cls._record(op, os.path.dirname(path), removed=[os.path.basename(path)])
+
+    @classmethod
+    def _delete(cls, op):
+        op["files_total"] = len(op["sources"])
+        for path in op["sources"]:
+            if op["cancelled"]:
+                return
+            cls._remove(op, path)
+            op["files_done"] += 1
+            cls._progress(op)
+
+    @staticmethod
+    def trashDir():
+        """ Returns the filepath of the user's trash directory (freedesktop.org trash specification)
+
+        Returns:
+            str: Filepath of the trash directory
+        """
+        data = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+        return os.path.join(data, "Trash")
+
+    @classmethod
+    def _trash(cls, op):
+        trash = cls.trashDir()
+        os.makedirs(os.path.join(trash, "files"), exist_ok=True)
+        os.makedirs(os.path.join(trash, "info"), exist_ok=True)
+        op["files_total"] = len(op["sources"])
+        for path in op["sources"]:
+            if op["cancelled"]:
+                return
+            name = os.path.basename(cls._target(os.path.join(trash, "files", os.path.basename(path)), "rename"))
+            info = f"[Trash Info]\nPath={urllib.parse.quote(os.path.abspath(path))}\nDeletionDate={datetime.now():%Y-%m-%dT%H:%M:%S}\n"
+            try:
+                with open(os.path.join(trash, "info", name + ".trashinfo"), "x") as file:
+                    file.write(info)
+                shutil.move(path, os.path.join(trash, "files", name))
+            except OSError as error:
+                cls._fail(op, path, error)
+                continue
+            cls._record(op, os.path.dirname(path), removed=[os.path.basename(path)])
+            op["files_done"] += 1
+            cls._progress(op)
+
+    @staticmethod
+    def describe(op):
+        """ Returns a one line description of the progress of an operation
+
+        Args:
+            op (dict): An operation returned by start
+
+        Returns:
+            str: Description of the operation
+        """
+        elapsed = op["elapsed"] or (time.monotonic() - op["start"])
+        text = f"{op['kind']}: {op['files_done']}/{op['files_total']} files"
+        if op["bytes_total"]:
+            rate = DiskUsage.format(int(op["bytes_done"] / elapsed)) if elapsed > 0 else "-"
+            text += f", {DiskUsage.format(op['bytes_done'])}/{DiskUsage.format(op['bytes_total'])} at {rate}/s"
+        if op["skipped"]:
+            text += f", {op['skipped']} skipped"
+        if op["failed"]:
+            path, error = op["errors"][0]
+            text += f", {op['failed']} failed (first: {os.path.basename(path)}: {error})"
+        if op["cancelled"]:
+            text += ", cancelled"
+        elif op["elapsed"] is not None:
+            text += f", done in {elapsed:.1f}s"
+        return text
+
+
+class Session:
+    """ Class (container of methods) which saves a snapshot of the application on quit, and restores it on start
+
+    The snapshot holds the last directory, the selection, the scroll position, the marks, the view settings,
+        and the most recent directory listings (see FileSystem.recentListings) with the mtimes they were listed at.
+    It is stored at path() in a small versioned binary format: a header of MAGIC and VERSION,
+        followed by the zlib compressed JSON of the snapshot.
+    A snapshot with a different magic or version is ignored, so changing the format only costs one cold start.
+
+    On start, the restored listings are put back into the FileSystem listing cache,
+        so the last view is shown without listing anything.
+    The Application then lists the directory again in the background -
+        which only costs a stat if its mtime did not change - and BasicReducer.refreshChildren applies any changes.
+    """
+
+    MAGIC = b"SPFE"
+    VERSION = 1
+    HEADER = struct.Struct(">4sH")
+    """struct.Struct: Header of a snapshot file - MAGIC and VERSION"""
+
+    MAX_LISTINGS = 16
+    """int: Maximum number of directory listings in a snapshot"""
+
+    MAX_NAMES = 50000
+    """int: Maximum total number of children in the listings of a snapshot"""
+
+    KIND_CODES = {"dir": "d", "file": "f", None: "-"}
+
+    @staticmethod
+    def path():
+        """ Returns the filepath of the snapshot
+
+        Returns:
+            str: Filepath of the snapshot (which may not exist)
+        """
+        return os.path.join(FileSystem.cacheDir(), "session.bin")
+
+    @classmethod
+    def snapshot(cls, state):
+        """ Returns the snapshot of a state and of the most recent directory listings
+
+        The listing of state["directory"] always comes first, followed by the most recently listed other directories,
+            as long as they fit in MAX_LISTINGS and MAX_NAMES.
+
+        Args:
+            state (dict): State dictionary of application
+
+        Returns:
+            dict: Snapshot, which only holds JSON values
+        """
+        recent = FileSystem.recentListings()
+        recent.sort(key=lambda item: item[0] != state["directory"])
+        listings = []
+        names = 0
+        for dir, listing in recent:
+            if len(listings) == cls.MAX_LISTINGS:
+                break
+            if names + len(listing["names"]) > cls.MAX_NAMES:
+                continue
+            names += len(listing["names"])
+            kinds = "".join(cls.KIND_CODES[listing["kinds"].get(name)] for name in listing["names"])
+            listings.append([dir, listing["mtime"], listing["names"], kinds])
+        return {
+            "directory": state["directory"],
+            "selected": state["selected"],
+            "scroll_top": state["scroll_data"]["scroll_top"],
+            "marks": [list(pair) for pair in state["marks"].ranges],
+            "du": state["du"],
+            "columns": state["columns"],
+            "preview": state["preview"],
+            "tree": state["tree"],
+            "listings": listings
+        }
+
+    @classmethod
+    def encode(cls, snapshot):
+        """ Encodes a snapshot in the binary format of the snapshot file
+
+        Filenames which are not valid UTF-8 are kept, since json escapes the surrogates they are decoded to.
+
+        Args:
+            snapshot (dict): Snapshot (see snapshot)
+
+        Returns:
+            bytes: The encoded snapshot
+        """
+        data = json.dumps(snapshot, separators=(",", ":")).encode("ascii")
+        return cls.HEADER.pack(cls.MAGIC, cls.VERSION) + zlib.compress(data)
+
+    @classmethod
+    def decode(cls, data):
+        """ Decodes a snapshot encoded by encode
+
+        Args:
+            data (bytes): The encoded snapshot
+
+        Returns:
+            dict: The snapshot, or None if data is not a snapshot of the current VERSION
+        """
+        if len(data) < cls.HEADER.size or cls.HEADER.unpack_from(data) != (cls.MAGIC, cls.VERSION):
+            return None
+        try:
+            return json.loads(zlib.decompress(data[cls.HEADER.size:]))
+        except (zlib.error, ValueError) as error:
+            LOGGER.warning(f"Ignoring corrupt session snapshot - {error}")
+            return None
+
+    @classmethod
+    def save(cls, state, path=None):
+        """ Saves the snapshot of a state, replacing the previous snapshot atomically
+
+        Args:
+            state (dict): State dictionary of application
+            path (str): Filepath of the snapshot, or None for path()
+        """
+        path = path or cls.path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as file:
+                file.write(cls.encode(cls.snapshot(state)))
+            os.replace(path + ".tmp", path)
+            LOGGER.info(f"Saved session snapshot to {path}")
+        except OSError as error:
+            LOGGER.warning(f"Could not save session snapshot to {path} - {error}")
+
+    @classmethod
+    def load(cls, path=None):
+        """ Loads the snapshot saved by save
+
+        Args:
+            path (str): Filepath of the snapshot, or None for path()
+
+        Returns:
+            dict: The snapshot, or None if there is no usable snapshot
+        """
+        try:
+            with open(path or cls.path(), "rb") as file:
+                return cls.decode(file.read())
+        except OSError:
+            return None
+
+    @classmethod
+    def restore(cls, snapshot):
+        """ Puts the listings of a snapshot back into the FileSystem cache, and returns the state it was taken of
+
+        The listing of the snapshot directory is used as is, without checking its mtime,
+            so the state is returned without listing anything - it is revalidated later by the caller.
+        The selection, marks and scroll position are dropped if they do not fit the restored children.
+        The directory is checked and changed to through FileSystem (see Mounts), so a hung mount times out,
+            and the caller starts in its launch directory instead.
+
+        Args:
+            snapshot (dict): Snapshot (see snapshot)
+
+        Returns:
+            dict: State dictionary of the snapshot, or None if its directory no longer exists or cannot be reached
+        """
+        codes = {code: kind for kind, code in cls.KIND_CODES.items()}
+        for dir, mtime, names, kinds in reversed(snapshot["listings"]):
+            FileSystem.rememberListing(dir, mtime, names, {name: codes[code] for name, code in zip(names, kinds)})
+        if not FileSystem.isChildOpenable(snapshot["directory"]):
+            LOGGER.warning(f"Cannot restore session snapshot of {snapshot['directory']} - not an openable directory")
+            return None
+        try:
+            FileSystem.changeCWD(snapshot["directory"])
+        except OSError as error:
+            LOGGER.warning(f"Cannot restore session snapshot of {snapshot['directory']} - {error}")
+            return None
+        listing = FileSystem.cachedListing(snapshot["directory"])
+        state = BasicReducer.getInitState(None if listing is None else list(listing["names"]))
+        children = set(state["children"])
+        if all(child in children for child in snapshot["selected"]):
+            state["selected"] = snapshot["selected"]
+        marks = IntervalSet(tuple(pair) for pair in snapshot["marks"])
+        if not marks or marks.ranges[-1][1] <= len(state["children"]):
+            state["marks"] = marks
+        state["scroll_data"]["scroll_top"] = max(0, min(snapshot["scroll_top"], len(state["children"]) - 1))
+        state["du"] = snapshot["du"]
+        state["columns"] = [column for column in snapshot["columns"] if column in Metadata.COLUMNS]
+        state["preview"] = snapshot["preview"]
+        state["tree"] = snapshot.get("tree", False)
+        state["stale"] = True
+        if state["du"]:
+            DiskUsage.start(state)
+        LOGGER.info(f"Restored session snapshot of {state['directory']}")
+        return state
+
+
+class Frecency:
+    """ Class (container of methods) which remembers the visited directories, ranked by frecency, for @jump
+
+    Frecency combines how often and how recently a directory was visited:
+        the number of visits, weighted by RECENCY according to the time since the last visit.
+    Every visit (see BasicReducer.moveDir) appends a line "count<TAB>last visit<TAB>path" to a log at path(),
+        on a worker thread, without reading the log - so recording a visit costs nothing on startup.
+    The log is only read on the first search, summing the counts of every path.
+    When the log holds many more lines than paths, it is compacted to one line per path, atomically.
+    Compacting also ages the counts once their total exceeds MAX_TOTAL, and forgets rarely visited paths.
+
+    For searching, the lowercased paths are sorted by frecency and joined into a single string,
+        and so are their basenames. Scanning these strings with str.find, in frecency order,
+        finds the best paths containing the query, the best whose basename contains its last word,
+        and the best whose basename starts with it - and the best results are among these (see search),
+        so that a search scores a few dozen paths in Python, within a few milliseconds for tens of thousands of paths.
+    The order is rebuilt when a new path is visited, or when it is older than ORDER_SECONDS,
+        since frecencies change as time passes.
+    """
+
+    RECENCY = ((3600, 4.0), (86400, 2.0), (604800, 0.5))
+    """tuple: Pairs (seconds, weight) - the weight of visits at most that many seconds old, or 0.25 if older"""
+
+    MAX_TOTAL = 10000
+    """int: Total count above which the counts are aged when compacting"""
+
+    COMPACT_RATIO = 2
+    """int: The log is compacted when it holds more than this many lines per path"""
+
+    ORDER_SECONDS = 60
+    """int: Maximum age of the frecency order of the paths, in seconds"""
+
+    _entries = None
+    _lines = 0
+    _order = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def path():
+        """ Returns the filepath of the log
+
+        Returns:
+            str: Filepath of the log (which may not exist)
+        """
+        return os.path.join(FileSystem.cacheDir(), "frecency.log")
+
+    @classmethod
+    def visit(cls, dir, now=None):
+        """ Records a visit to a local directory
+
+        Args:
+            dir (str): Filepath of the directory
+            now (float): Time of the visit, or None for the current time
+        """
+        if FileSystem.backendOf(dir) is not FileSystem.LOCAL or Archive.locate(dir) is not None:
+            return
+        TASKS.submit(cls._append, (dir, int(time.time() if now is None else now)))
+
+    @classmethod
+    def _append(cls, dir, now):
+        with cls._lock:
+            try:
+                os.makedirs(os.path.dirname(cls.path()), exist_ok=True)
+                with open(cls.path(), "a", encoding="utf-8", errors="surrogateescape") as file:
+                    file.write(f"1\t{now}\t{dir}\n")
+            except OSError as error:
+                LOGGER.warning(f"Could not record visit - {error}")
+                return
+            cls._lines += 1
+            if cls._entries is None:
+                return
+            if dir not in cls._entries:
+                cls._order = None
+            count, last = cls._entries.get(dir, (0, 0))
+            cls._entries[dir] = (count + 1, max(last, now))
+            if cls._lines > cls.COMPACT_RATIO * len(cls._entries) + 100:
+                cls._compact()
+
+    @classmethod
+    def _load(cls):
+        """ Reads the log into _entries if it has not been read yet. Must be called with _lock held """
+        if cls._entries is not None:
+            return
+        entries = {}
+        lines = 0
+        try:
+            with open(cls.path(), encoding="utf-8", errors="surrogateescape") as file:
+                for line in file:
+                    count, _, rest = line.rstrip("\n").partition("\t")
+                    last, _, dir = rest.partition("\t")
+                    try:
+                        count, last = float(count), int(last)
+                    except ValueError:
+                        continue
+                    old = entries.get(dir, (0, 0))
+                    entries[dir] = (old[0] + count, max(old[1], last))
+                    lines += 1
+        except FileNotFoundError:
+            pass
+        cls._entries = entries
+        cls._lines = lines
+        cls._order = None
+        if lines > cls.COMPACT_RATIO * len(entries) + 100:
+            cls._compact()
+
+    @classmethod
+    def _compact(cls):
+        """ Rewrites the log with one line per path, aging the counts if needed. Must be called with _lock held """
+        entries = cls._entries
+        total = sum(count for count, last in entries.values())
+        if total > cls.MAX_TOTAL:
+            factor = 0.9 * cls.MAX_TOTAL / total
+            entries = {dir: (count * factor, last) for dir, (count, last) in entries.items() if count * factor >= 1}
+            cls._order = None
+        try:
+            with open(cls.path() + ".tmp", "w", encoding="utf-8", errors="surrogateescape") as file:
+                file.writelines(f"{count:g}\t{last}\t{dir}\n" for dir, (count, last) in entries.items())
+            os.replace(cls.path() + ".tmp", cls.path())
+        except OSError as error:
+            LOGGER.warning(f"Could not compact the frecency log - {error}")
+            return
+        cls._entries = entries
+        cls._lines = len(entries)
+        LOGGER.info(f"Compacted the frecency log to {len(entries)} paths")
+
+    @classmethod
+    def forget(cls, dir):
+        """ Forgets a directory (for instance, one which no longer exists), until it is visited again
+
+        Args:
+            dir (str): Filepath of the directory
+        """
+        with cls._lock:
+            cls._load()
+            if cls._entries.pop(dir, None) is not None:
+                cls._order = None
+                cls._compact()
+
+    @classmethod
+    def score(cls, count, last, now):
+        """ Returns the frecency of a path
+
+        Args:
+            count (float): Number of visits
+            last (int): Time of the last visit
+            now (float): Current time
+
+        Returns:
+            float: The frecency
+        """
+        age = now - last
+        for seconds, weight in cls.RECENCY:
+            if age <= seconds:
+                return count * weight
+        return count * 0.25
+
+    @classmethod
+    def _ordered(cls, now):
+        """ Returns the search order of the paths, rebuilding it if needed. Must be called with _lock held """
+        if cls._order is None or abs(now - cls._order["now"]) > cls.ORDER_SECONDS:
+            paths = sorted(cls._entries, key=lambda dir: cls.score(*cls._entries[dir], now), reverse=True)
+            lower = [dir.lower() for dir in paths]
+            bases = [os.path.basename(dir) for dir in lower]
+            cls._order = {"now": now, "paths": paths, "lower": lower}
+            for key, lines in (("full", lower), ("base", bases)):
+                starts = list(itertools.accumulate((len(line) + 1 for line in lines), initial=1))
+                cls._order[key] = ("\n" + "\n".join(lines) + "\n", starts)
+        return cls._order
+
+    @staticmethod
+    def _scan(blob, starts, word, lower, words, limit):
+        """ Returns the indices of the first limit lines of blob containing word whose path contains every word """
+        found = []
+        position = blob.find(word)
+        while position != -1 and len(found) < limit:
+            index = bisect.bisect_right(starts, position + (word[0] == "\n")) - 1
+            if all(other in lower[index] for other in words):
+                found.append(index)
+            position = blob.find(word, starts[index + 1] - 1)
+        return found
+
+    @classmethod
+    def search(cls, query, limit=20, now=None):
+        """ Returns the remembered directories matching every word of query, best first
+
+        A path matches if it contains every word (ignoring case).
+        The frecency of a match is multiplied by 4 if the last word starts the basename of the path,
+            and by 2 if the basename contains it.
+        Since paths are scanned in frecency order, the results are among the first limit matches,
+            the first limit matches whose basename contains the last word and the first limit whose basename starts with it
+            (the latter two scans are skipped when there are fewer than limit matches).
+
+        Args:
+            query (str): Words separated by spaces, or "" for all directories
+            limit (int): Maximum number of results
+            now (float): Current time, or None for the current time
+
+        Returns:
+            list: Filepaths of the matching directories
+        """
+        now = time.time() if now is None else now
+        words = query.lower().split()
+        with cls._lock:
+            cls._load()
+            order = cls._ordered(now)
+            entries = cls._entries
+        if not words:
+            return order["paths"][:limit]
+        lower = order["lower"]
+        last = words[-1]
+        candidates = set(cls._scan(*order["full"], max(words, key=len), lower, words, limit))
+        if len(candidates) == limit:
+            candidates.update(cls._scan(*order["base"], last, lower, words, limit))
+            candidates.update(cls._scan(*order["base"], "\n" + last, lower, words, limit))
+        results = []
+        for index in candidates:
+            dir = order["paths"][index]
+            if dir not in entries:
+                continue
+            base = os.path.basename(lower[index])
+            frecency = cls.score(*entries[dir], now) * (4 if base.startswith(last) else 2 if last in base else 1)
+            results.append((frecency, dir))
+        results.sort(reverse=True)
+        return [dir for frecency, dir in results[:limit]]
+
+
+class Completion:
+    """ Class (container of methods) which completes the word being typed in command mode, for Tab
+
+    The first word of a command is completed from the executables on $PATH (or from the builtin commands,
+        after CommandReducer.PREFIX), and the other words from the cached listings of the directories they are in,
+        relative to the current directory.
+
+    The executables are indexed on a worker thread, into a sorted list, so completing a prefix is two bisections
+        rather than a scan, whatever the number of executables.
+    The index is kept with the mtime of each directory of $PATH. It is checked in the background when command mode is
+        entered (see warm), at most every CHECK_SECONDS, and only the directories whose mtime changed are listed again,
+        so completion never touches $PATH itself.
+    Listings come from the FileSystem cache (a directory which is not cached yet is listed once), and the names of the
+        last completed listing are kept sorted, so completing in a large directory is a bisection too.
+    """
+
+    CHECK_SECONDS = 5.0
+    """float: Minimum number of seconds between two checks of the directories of $PATH"""
+
+    LIMIT = 100
+    """int: Maximum number of completions returned"""
+
+    _dirs = {}
+    _names = None
+    _path = None
+    _checked = 0.0
+    _future = None
+    _sorted = (None, [])
+    _lock = threading.Lock()
+    _executor = None
+
+    @classmethod
+    def warm(cls):
+        """ Starts indexing the executables on $PATH in the background, unless the index was checked recently
+
+        Returns:
+            concurrent.futures.Future: Future of the indexing, or None if the index is recent enough
+        """
+        path = os.environ.get("PATH", "")
+        now = time.monotonic()
+        with cls._lock:
+            if cls._future is not None and not cls._future.done():
+                return cls._future
+            if cls._names is not None and path == cls._path and now - cls._checked < cls.CHECK_SECONDS:
+                return None
+            cls._checked = now
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sp-complete")
+            cls._future = cls._executor.submit(cls._index, path)
+            return cls._future
+
+    @classmethod
+    def _index(cls, path):
+        dirs = {}
+        for dir in dict.fromkeys(dir for dir in path.split(os.pathsep) if dir):
+            try:
+                mtime = os.stat(dir).st_mtime_ns
+            except OSError:
+                continue
+            cached = cls._dirs.get(dir)
+            if cached is not None and cached[0] == mtime:
+                dirs[dir] = cached
+                continue
+            names = []
+            try:
+                with os.scandir(dir) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_file() and os.access(entry.path, os.X_OK):
+                                names.append(entry.name)
+                        except OSError:
+                            pass
+            except OSError:
+                continue
+            dirs[dir] = (mtime, names)
+        changed = cls._names is None or list(dirs) != list(cls._dirs) or any(dirs[dir] is not cls._dirs[dir] for dir in dirs)
+        names = sorted(set(itertools.chain.from_iterable(names for mtime, names in dirs.values()))) if changed else cls._names
+        with cls._lock:
+            cls._dirs = dirs
+            cls._path = path
+            cls._names = names
+        LOGGER.debug(f"Indexed {len(names)} executables on PATH")
+
+    @staticmethod
+    def _prefixed(names, prefix):
+        """ Returns the names of a sorted list which start with prefix, at most LIMIT of them """
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + "\U0010ffff", start)
+        return names[start:min(end, start + Completion.LIMIT)]
+
+    @classmethod
+    def executables(cls, prefix):
+        """ Returns the executables on $PATH whose name starts with prefix (none until the index is built, see warm) """
+        return cls._prefixed(cls._names or [], prefix)
+
+    @classmethod
+    def paths(cls, directory, word):
+        """ Returns the paths which complete word, a path relative to directory (or absolute, or starting with ~)
+
+        Args:
+            directory (str): Filepath of the current directory
+            word (str): Path being typed
+
+        Returns:
+            list: Completed paths, in the form of word, with a trailing slash for directories
+        """
+        head, tail = os.path.split(word)
+        dir = os.path.join(directory, os.path.expanduser(head))
+        listing = FileSystem.cachedListing(dir)
+        if listing is None:
+            try:
+                FileSystem.listDir(dir)
+            except OSError:
+                return []
+            listing = FileSystem.cachedListing(dir)
+            if listing is None:
+                return []
+        with cls._lock:
+            if cls._sorted[0] is not listing:
+                cls._sorted = (listing, sorted(listing["names"]))
+            names = cls._sorted[1]
+        return [os.path.join(head, name) + ("/" if listing["kinds"].get(name) == "dir" else "")
+                for name in cls._prefixed(names, tail) if tail.startswith(".") or not name.startswith(".")]
+
+    @classmethod
+    def complete(cls, directory, command):
+        """ Returns the completions of the last word of a command
+
+        Args:
+            directory (str): Filepath of the current directory
+            command (str): Command typed so far (without the prompt)
+
+        Returns:
+            tuple: (index in command of the start of the last word, list of the texts which could replace that word)
+                Completed names of files and commands end with a space, names of directories with a slash.
+        """
+        start = command.rfind(" ") + 1
+        word = command[start:]
+        if start != 0 or os.sep in word:
+            return start, [path if path.endswith("/") else path + " " for path in cls.paths(directory, word)]
+        if word.startswith(CommandReducer.PREFIX):
+            return start, [CommandReducer.PREFIX + name + " " for name in cls._prefixed(CommandReducer.names(), word[len(CommandReducer.PREFIX):])]
+        prefix = Launcher.SHELL_PREFIX if word.startswith(Launcher.SHELL_PREFIX) else ""
+        return start, [prefix + name + " " for name in cls.executables(word[len(prefix):])]
+
+
+class CommandHistory:
+    """ Class (container of methods) which remembers the commands typed in command mode, for Up/Down and Control-R
+
+    Every command run (see KeyBindReducer.returnKey) is recorded: it is appended to a log at path(),
+        one command per line, on a worker thread of its own (so the commands are appended in order),
+        and Enter never waits on the disk.
+    The log is only read at the first recall or search, and a command typed again is moved to the end of the history
+        rather than kept twice. The history holds the MAX_ENTRIES most recent commands, and the log is compacted
+        to those once it holds many more lines, atomically, like the Frecency log.
+
+    Commands are numbered from the oldest (0) to the newest (count() - 1).
+    Recalling the commands which start with a prefix (see previous and next) bisects a sorted list of the commands,
+        and searching for the newest command containing a query (see search) scans a single string of the commands,
+        newest first, with str.find - both are rebuilt only when the history changes.
+    """
+
+    MAX_ENTRIES = 5000
+    """int: Maximum number of commands remembered"""
+
+    COMPACT_RATIO = 2
+    """int: The log is compacted when it holds more than this many lines per command"""
+
+    _entries = None
+    _unwritten = []
+    _lines = 0
+    _index = None
+    _lock = threading.Lock()
+    _executor = None
+
+    @staticmethod
+    def path():
+        """ Returns the filepath of the log
+
+        Returns:
+            str: Filepath of the log (which may not exist)
+        """
+        return os.path.join(FileSystem.cacheDir(), "commands.log")
+
+    @classmethod
+    def record(cls, command):
+        """ Adds a command to the history, and appends it to the log in the background
+
+        Args:
+            command (str): Command typed in command mode
+        """
+        command = command.strip()
+        if not command or "\n" in command:
+            return
+        with cls._lock:
+            cls._unwritten.append(command)
+            if cls._entries is not None:
+                cls._add(command)
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sp-history")
+        cls._executor.submit(cls._append, command)
+
+    @classmethod
+    def _add(cls, command):
+        """ Moves or appends command to the end of _entries, within MAX_ENTRIES. Must be called with _lock held """
+        if command in cls._index["positions"]:
+            cls._entries.remove(command)
+        cls._entries.append(command)
+        del cls._entries[:-cls.MAX_ENTRIES]
+        cls._reindex()
+
+    @classmethod
+    def _append(cls, command):
+        with cls._lock:
+            try:
+                os.makedirs(os.path.dirname(cls.path()), exist_ok=True)
+                with open(cls.path(), "a", encoding="utf-8", errors="surrogateescape") as file:
+                    file.write(command + "\n")
+            except OSError as error:
+                LOGGER.warning(f"Could not record command - {error}")
+                return
+            finally:
+                cls._unwritten.remove(command)
+            cls._lines += 1
+            if cls._entries is not None and cls._lines > cls.COMPACT_RATIO * len(cls._entries) + 100:
+                cls._compact()
+
+    @classmethod
+    def _load(cls):
+        """ Reads the log into _entries (with the commands not written yet) if it has not been read yet. Must be called with _lock held """
+        if cls._entries is not None:
+            return
+        commands = []
+        try:
+            with open(cls.path(), encoding="utf-8", errors="surrogateescape") as file:
+                commands = [line.rstrip("\n") for line in file if line.strip()]
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            LOGGER.warning(f"Could not read the command history - {error}")
+        cls._lines = len(commands)
+        entries = list(dict.fromkeys(reversed(commands + cls._unwritten)))[:cls.MAX_ENTRIES]
+        entries.reverse()
+        cls._entries = entries
+        cls._reindex()
+        if cls._lines > cls.COMPACT_RATIO * len(entries) + 100:
+            cls._compact()
+
+    @classmethod
+    def _compact(cls):
+        """ Rewrites the log with the commands of _entries which were written already. Must be called with _lock held """
+        unwritten = set(cls._unwritten)
+        commands = [command for command in cls._entries if command not in unwritten]
+        try:
+            with open(cls.path() + ".tmp", "w", encoding="utf-8", errors="surrogateescape") as file:
+                file.writelines(command + "\n" for command in commands)
+            os.replace(cls.path() + ".tmp", cls.path())
+        except OSError as error:
+            LOGGER.warning(f"Could not compact the command history - {error}")
+            return
+        cls._lines = len(commands)
+        LOGGER.info(f"Compacted the command history to {len(commands)} commands")
+
+    @classmethod
+    def _reindex(cls):
+        """ Rebuilds the prefix and substring indices of _entries. Must be called with _lock held """
+        entries = cls._entries
+        newest = entries[::-1]
+        cls._index = {
+            "positions": {command: position for position, command in enumerate(entries)},
+            "sorted": sorted(entries),
+            "blob": "\n".join(newest) + "\n",
+            "starts": list(itertools.accumulate((len(command) + 1 for command in newest), initial=0)),
+        }
+
+    @classmethod
+    def count(cls):
+        """ Returns the number of commands in the history, reading the log if needed """
+        with cls._lock:
+            cls._load()
+            return len(cls._entries)
+
+    @classmethod
+    def get(cls, position):
+        """ Returns the command at a position (see count) """
+        with cls._lock:
+            cls._load()
+            return cls._entries[position]
+
+    @classmethod
+    def _prefixed(cls, prefix):
+        """ Returns the positions of the commands starting with prefix, in any order. Must be called with _lock held """
+        commands = cls._index["sorted"]
+        start = bisect.bisect_left(commands, prefix)
+        end = bisect.bisect_left(commands, prefix + "\U0010ffff", start)
+        positions = cls._index["positions"]
+        return (positions[command] for command in commands[start:end])
+
+    @classmethod
+    def previous(cls, prefix, before):
+        """ Returns the position of the newest command before position before which starts with prefix, or None
+
+        Args:
+            prefix (str): Text the command must start with
+            before (int): Position after the commands looked at (count() to look at all of them)
+
+        Returns:
+            int: Position of the command, or None if there is none
+        """
+        with cls._lock:
+            cls._load()
+            if not prefix:
+                return before - 1 if before > 0 else None
+            return max((position for position in cls._prefixed(prefix) if position < before), default=None)
+
+    @classmethod
+    def next(cls, prefix, after):
+        """ Returns the position of the oldest command after position after which starts with prefix, or None
+
+        Args:
+            prefix (str): Text the command must start with
+            after (int): Position before the commands looked at
+
+        Returns:
+            int: Position of the command, or None if there is none
+        """
+        with cls._lock:
+            cls._load()
+            if not prefix:
+                return after + 1 if after + 1 < len(cls._entries) else None
+            return min((position for position in cls._prefixed(prefix) if position > after), default=None)
+
+    @classmethod
+    def search(cls, query, before):
+        """ Returns the position of the newest command before position before which contains query, or None
+
+        Args:
+            query (str): Text the command must contain
+            before (int): Position after the commands looked at (count() to look at all of them)
+
+        Returns:
+            int: Position of the command, or None if there is none
+        """
+        with cls._lock:
+            cls._load()
+            count = len(cls._entries)
+            if before <= 0 or "\n" in query:
+                return None
+            starts = cls._index["starts"]
+            found = cls._index["blob"].find(query, starts[count - min(before, count)])
+            if found == -1:
+                return None
+            return count - bisect.bisect_right(starts, found)
+
+
+class Headless:
+    """ Class (container of methods) which runs listing, searching and disk usage without the GUI
+
+    main runs it for --headless COMMAND PATH, which prints one JSON object per line (NDJSON) to stdout,
+        so that scripts can use the same FileSystem backends, Archive browsing and DiskUsage walks as the application.
+    Neither this class nor the engine it uses needs tkinter, which is only imported when a window is created.
+
+    Every command is a generator of records, written as they are produced:
+        entries are read with scandir one at a time, and directories are walked depth first
+        with one open scandir iterator per level, so memory stays bounded by the depth of the tree
+        rather than by the number of entries, and output starts right away even for millions of entries.
+    An entry which cannot be read is reported as a record with an "error" key, and the command goes on.
+    """
+
+    COMMANDS = ("list", "search", "du")
+
+    KINDS = {stat.S_IFDIR: "dir", stat.S_IFREG: "file", stat.S_IFLNK: "symlink"}
+
+    @classmethod
+    def _entries(cls, dir):
+        """ Yields a tuple (path, st_size, st_mtime, st_mode, link), or (path, error) for every child of dir
+
+        link is (st_dev, st_ino) for a file with several hard links, so it can be counted once, and None otherwise.
+        The children of a directory inside an archive are taken from the member list of the archive (see Archive).
+        """
+        located = Archive.locate(dir)
+        if located is not None:
+            archive, member = located
+            for name in Archive.listDir(archive, member)[0]:
+                try:
+                    yield (os.path.join(dir, name),) + Archive.lstat(archive, posixpath.join(member, name)) + (None,)
+                except Archive.ERRORS as error:
+                    yield os.path.join(dir, name), str(error)
+            return
+        backend = FileSystem.backendOf(dir)
+        for entry in backend.scandir(dir):
+            path = os.path.join(dir, entry.name)
+            try:
+                st = backend.lstat(path)
+            except OSError as error:
+                yield path, str(error)
+                continue
+            yield path, st.st_size, st.st_mtime, st.st_mode, ((st.st_dev, st.st_ino) if st.st_nlink > 1 else None)
+
+    @classmethod
+    def _record(cls, entry):
+        """ Returns the JSON record of an entry yielded by _entries """
+        if len(entry) == 2:
+            return {"path": entry[0], "error": entry[1]}
+        path, size, mtime, mode, link = entry
+        kind = cls.KINDS.get(stat.S_IFMT(mode), "other")
+        return {"path": path, "name": os.path.basename(path), "kind": kind, "size": size, "mtime": round(mtime, 3)}
+
+    @classmethod
+    def _walk(cls, dir):
+        """ Yields the entries (see _entries) of everything beneath dir, depth first, without following symlinks """
+        stack = [(dir, cls._entries(dir))]
+        while stack:
+            try:
+                entry = next(stack[-1][1])
+            except StopIteration:
+                stack.pop()
+                continue
+            except (OSError, *Archive.ERRORS) as error:
+                yield stack.pop()[0], str(error)
+                continue
+            yield entry
+            if len(entry) == 5 and stat.S_ISDIR(entry[3]):
+                stack.append((entry[0], cls._entries(entry[0])))
+
+    @classmethod
+    def _subtree(cls, dir):
+        """ Returns (size, links) of the subtree at dir, like DiskUsage._subtree, for directories walked in this process """
+        size = 0
+        links = {}
+        for entry in cls._walk(dir):
+            if len(entry) == 2 or stat.S_ISDIR(entry[3]):
+                continue
+            if entry[4] is not None:
+                links[entry[4]] = entry[1]
+            else:
+                size += entry[1]
+        return size + sum(links.values()), links
+
+    @classmethod
+    def list(cls, dir):
+        """ Yields the record of every child of dir
+
+        Args:
+            dir (str): Filepath of a directory
+
+        Yields:
+            dict: Records with keys "path", "name", "kind" ('dir', 'file', 'symlink' or 'other'), "size" and "mtime"
+        """
+        for entry in cls._entries(dir):
+            yield cls._record(entry)
+
+    @classmethod
+    def search(cls, dir, text):
+        """ Yields the record of everything beneath dir whose filename contains text (case-insensitively)
+
+        Args:
+            dir (str): Filepath of a directory
+            text (str): Substring to search for
+
+        Yields:
+            dict: Records (see list)
+        """
+        text = text.lower()
+        for entry in cls._walk(dir):
+            if len(entry) == 2 or text in os.path.basename(entry[0]).lower():
+                yield cls._record(entry)
+
+    @classmethod
+    def du(cls, dir):
+        """ Yields the recursive size of every child of dir, as it is measured, and then the total size of dir
+
+        Like DiskUsage, child directories of a local directory are walked in parallel by the DiskUsage process pool,
+            so the records of directories come in the order they finish.
+        Directories of other backends and of archives are walked in this process.
+        Files with several hard links are only counted once in the total.
+
+        Args:
+            dir (str): Filepath of a directory
+
+        Yields:
+            dict: Records with keys "path" and "size", and lastly a record with keys "path", "size" and "total" (True)
+        """
+        results = []
+        local = FileSystem.backendOf(dir) is FileSystem.LOCAL and Archive.locate(dir) is None
+        futures = {}
+        for entry in cls._entries(dir):
+            if len(entry) == 2:
+                yield cls._record(entry)
+                continue
+            path, size, mtime, mode, link = entry
+            if stat.S_ISDIR(mode) and local:
+                futures[DiskUsage._getPool().submit(DiskUsage._subtree, path)] = path
+                continue
+            links = {link: size} if link is not None else {}
+            if stat.S_ISDIR(mode):
+                size, links = cls._subtree(path)
+            results.append((size, links))
+            yield {"path": path, "size": size}
+        for future in as_completed(futures):
+            size, links = future.result()
+            results.append((size, links))
+            yield {"path": futures[future], "size": size}
+        yield {"path": dir, "size": DiskUsage._total(results), "total": True}
+
+    @classmethod
+    def run(cls, command, dir, text=None, out=None):
+        """ Runs a command, writing its records to out as JSON lines
+
+        If out is closed by the reader (for instance by head in a shell pipeline), the command stops quietly.
+
+        Args:
+            command (str): One of COMMANDS
+            dir (str): Filepath of a directory
+            text (str): Substring to search for, for the search command
+            out (file): File to write to, or None for sys.stdout
+
+        Returns:
+            int: Exit status - 0, or 1 if dir cannot be read
+        """
+        out = out or sys.stdout
+        dir = os.path.abspath(dir)
+        records = cls.search(dir, text or "") if command == "search" else getattr(cls, command)(dir)
+        try:
+            for record in records:
+                out.write(json.dumps(record) + "\n")
+            out.flush()
+        except BrokenPipeError:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+        except (OSError, *Archive.ERRORS) as error:
+            print(f"{dir}: {error}", file=sys.stderr)
+            return 1
+        return 0
+
+
+class BasicReducer:
+    """Class of reducers (class methods) that make simple changes to state
+    
+    BasicReducer holds reducer functions that make basic changes to the state dictionary.
+    The reducers in this class are meant to be simple, changing only a few key values.
+    The reducers assume the input state dictionary has all the necessary keys and does not sanitize the inputs.
+    (The KeyBindReducer class will have the more complicated reducers)
+    """
+
+    @staticmethod
+    def getInitState(children=None, dir=None):
+        """ Returns a state dictionary which is the initial state of application
+        
+        This is a special reducer called in the very beginning of runtime
+            which sets the initial state of the application.
+        Therefore it does not have any state input, but it returns a state dictionary as output.
+
+        Args:
+            children (list): Children of the current directory listed so far, 
+                or None to list them all (see Application.__init__)
+            dir (str): Directory to start in, or None for the current directory
+
+        Returns:
+            dict: A state dictionary representing initial state of application  
+        """
+        newState = {}
+        newState["directory"] = dir or FileSystem.currentDir()
+        if children is None:
+            children = FileSystem.listDir(newState["directory"])
+        newState["children"] = children
+        newState["selected"] = newState["children"][0:1]
+        newState["scroll_data"] = {
+            "list_size": 25,
+            "list_width": 100,
+            "scroll_trigger": 3,
+            "scroll_top": 0
+        }
+        newState["prompt_data"] = {
+            "cmd_prompt": "(Command):",
+            "brs_prompt": "(Browse) "
+        }
+        newState["mode"] = "browse"
+        newState["text"] = newState["prompt_data"]["brs_prompt"] + "SP File Explorer"
+        newState["du"] = False
+        newState["sizes"] = {}
+        newState["compared"] = None
+        newState["columns"] = []
+        newState["preview"] = True
+        newState["marks"] = IntervalSet()
+        newState["history"] = History()
+        newState["tree"] = False
+        newState["stale"] = False
+        newState["completion"] = None
+        newState["recall"] = None
+        newState["cursor"] = 0
+        LOGGER.debug(f"Generated initial app state for {newState['directory']} with {len(children)} children")
+        return newState
+    
+    SHARED_KEYS = ("children", "selected", "sizes", "compared", "columns")
+    """tuple: Keys of the state whose values are shared between copies instead of deep copied"""
+
+    @staticmethod
+    def sameState(state):
+        """ A reducer which returns a copy of the input state
+
+        This reducer makes a deep copy of the input state dictionary
+        and returns it, to indicate that the state has not changed.
+        The values of SHARED_KEYS are shared with the input state rather than copied,
+            so copying a state does not cost time or memory proportional to the number of children,
+            and History can keep many states cheaply.
+        Reducers must therefore never change those values in place, but replace them.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary which represents nothing being changed
+        """
+        memo = {id(state[key]): state[key] for key in BasicReducer.SHARED_KEYS if key in state}
+        return copy.deepcopy(state, memo)
+
+    @classmethod
+    def setModeToBrowse(cls, state, text):
+        """ A reducer which sets the application to browse mode, and displays text
+        
+        This reducer takes in an input state and a string.
+        It first makes a deep copy of the input state.
+        Then, it sets the state['mode'] to 'browse' and sets state['text'] 
+            to the concatenation of state['prompt_data']['brs_prompt'] and the input text.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            text (str): Text to be displayed in text widget (after brs_prompt) 
+ 
+        Returns:
+            dict: State dictionary which represents browse mode to be activated and text message to be displayed
+        """
+        newState = cls.sameState(state)
+        newState["mode"] = "browse"
+        newState["text"] = newState["prompt_data"]["brs_prompt"] + text
+        #LOGGER.info(f"Changed app state to browse mode")
+        #LOGGER.debug(f"changed {state} to {newState}")
+        return newState
+
+    @classmethod
+    def setModeToCommand(cls, state, text):
+        """ A reducer which sets the application to command mode and displays text
+
+        This reducer takes in an input state and a string.
+        It first makes a deep copy of the input state.
+        Then, it sets the state['mode'] to 'command' and sets state['text']
+            to the concatenation of state['prompt_data']['cmd_prompt'] and the input text.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            text (str): Text to be displayed in text widget (after cmd_prompt) 
+ 
+        Returns:
+            dict: State dictionary which represents command mode to be activated and text message to be displayed
+        """
+        newState = cls.sameState(state)
+        newState["mode"] = "command"
+        newState["text"] = newState["prompt_data"]["cmd_prompt"] + text
+        #LOGGER.info(f"Changed app state to command mode")
+        #LOGGER.debug(f"changed {state} to {newState}")
+        return newState
+
+    @classmethod
+    def deleteText(cls, state):
+        """ A reducer which deletes a character from state["text"]
+
+        The reducer takes in an input state.
+        It first makes a deep copy of the input state,
+            and then sets state["text"] to state["text"][0:len(state["text"])-1],
+            i.e. it deletes the last character from state["text"].
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            
+        Returns:
+            dict: State dictionary which represents a character being deleted from displayed text 
+        
+        Note:
+            This reducer assumes state["text"] is not the empty string.
+            This reducer will break if state["text"] is empty.
+        """
+        newState = cls.sameState(state)
+        cmd_length = len(state["text"])
+        newState["text"] = state["text"][0:cmd_length-1]
+        return newState
+
+    @classmethod
+    def addText(cls, state, char):
+        """ A reducer which adds a character to state["text"]
+
+        This reducer takes in an input state and a string.
+        It first makes a deep copy of the input state,
+            and appends the input string to  state["text"].
+        
+        Args:
+            state (dict): State dictionary of application at previous moment
+            text (str): Character to be appended to the displayed text 
+
+        Returns:
+            dict: State dictionary which represents a character appended to displayed text
+
+        Note:
+            This reducer assumes char has length 1, 
+                and that is how the reducer will be used generally,
+                but it won't break if char has a different length.
+        """
+        newState = cls.sameState(state)
+        newState["text"] += char
+        return newState 
+
+    @staticmethod
+    def _recalling(state):
+        """ Returns state["recall"] if the text is still the command recalled (or searched for), otherwise None """
+        recall = state["recall"]
+        return recall if recall is not None and recall["shown"] == state["text"] else None
+
+    @classmethod
+    def searchQuery(cls, state):
+        """ Returns the query of the reverse search of the command history in progress (see searchCommands), or None """
+        recall = cls._recalling(state)
+        return None if recall is None else recall["query"]
+
+    @classmethod
+    def recallCommand(cls, state, step):
+        """ A reducer which replaces the command text with an older (step -1) or newer (step 1) command of CommandHistory
+
+        Only the commands starting with the text typed before the first recall are recalled,
+            and going newer than the newest of them brings that text back.
+        The recall in progress is kept in state["recall"], until the text is edited.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            step (int): -1 for the previous (older) command, 1 for the next (newer) one
+
+        Returns:
+            dict: State dictionary which represents the recalled command, or the input state itself if there is none
+        """
+        prompt = state["prompt_data"]["cmd_prompt"]
+        count = CommandHistory.count()
+        recall = cls._recalling(state)
+        if recall is None:
+            recall = {"prefix": state["text"][len(prompt):], "position": count, "query": None}
+        if step < 0:
+            position = CommandHistory.previous(recall["prefix"], recall["position"])
+        else:
+            position = CommandHistory.next(recall["prefix"], recall["position"])
+            if position is None:
+                position = count
+        if position is None or position == recall["position"]:
+            return state
+        newState = cls.sameState(state)
+        newState["text"] = prompt + (CommandHistory.get(position) if position < count else recall["prefix"])
+        newState["recall"] = dict(recall, position=position, shown=newState["text"])
+        return newState
+
+    @classmethod
+    def searchCommands(cls, state, query, older=False):
+        """ A reducer which searches the command history backwards for the newest command containing query
+
+        While searching, the text shows the query and the command found, which acceptSearch turns into the command text.
+        A query extending the previous one is searched from the command found (inclusive),
+            and other queries from the newest command; with older set, the search goes on from the command before the one found.
+        If nothing is found, the previous command found is kept, and the search is shown as failed.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            query (str): Text to search for
+            older (bool): Whether to look for an older command containing query (Control-R pressed again)
+
+        Returns:
+            dict: State dictionary which represents the command found
+        """
+        prompt = state["prompt_data"]["cmd_prompt"]
+        count = CommandHistory.count()
+        recall = cls._recalling(state)
+        if recall is None or recall["query"] is None:
+            typed = state["text"][len(prompt):]
+            recall = {"prefix": typed, "position": count, "query": "", "match": typed}
+        failed = False
+        if not query:
+            position, match = count, recall["prefix"]
+        else:
+            if older:
+                before = recall["position"]
+            elif recall["query"] and query.startswith(recall["query"]):
+                before = recall["position"] + 1
+            else:
+                before = count
+            position = CommandHistory.search(query, before)
+            failed = position is None
+            if failed:
+                position, match = recall["position"], recall["match"]
+            else:
+                match = CommandHistory.get(position)
+        newState = cls.sameState(state)
+        newState["text"] = f"({'failed ' if failed else ''}reverse-i-search)'{query}': {match}"
+        newState["recall"] = dict(recall, position=position, query=query, match=match, shown=newState["text"])
+        return newState
+
+    @classmethod
+    def acceptSearch(cls, state):
+        """ A reducer which ends the reverse search in progress, if any, making the command found the command text
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary which represents the command found, or the input state itself if no search is in progress
+        """
+        if cls.searchQuery(state) is None:
+            return state
+        recall = state["recall"]
+        newState = cls.sameState(state)
+        newState["text"] = state["prompt_data"]["cmd_prompt"] + recall["match"]
+        newState["recall"] = dict(recall, prefix="", query=None, shown=newState["text"])
+        return newState
+
+    @classmethod
+    def completeText(cls, state):
+        """ A reducer which completes the last word of the command in state["text"] (see Completion)
+
+        A single completion replaces the word. Several completions extend the word to their common prefix,
+            and if there is none to extend it with, the word is replaced by the first completion,
+            and each further call (as long as the text was not edited) replaces it by the next one, cycling through them.
+        The completions being cycled through are kept in state["completion"].
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary which represents the completed command, or the input state itself if there is no completion
+        """
+        previous = state["completion"]
+        if previous is not None and previous["shown"] == state["text"]:
+            index = (previous["index"] + 1) % len(previous["matches"])
+            newState = cls.sameState(state)
+            newState["text"] = previous["base"] + previous["matches"][index]
+            newState["completion"] = dict(previous, index=index, shown=newState["text"])
+            return newState
+        prompt = state["prompt_data"]["cmd_prompt"]
+        command = state["text"][len(prompt):]
+        start, matches = Completion.complete(state["directory"], command)
+        if len(matches) == 0:
+            return state
+        newState = cls.sameState(state)
+        base = prompt + command[:start]
+        common = os.path.commonprefix(matches)
+        if len(matches) == 1 or len(common) > len(command) - start:
+            newState["text"] = base + common
+            newState["completion"] = None
+        else:
+            newState["text"] = base + matches[0]
+            newState["completion"] = {"base": base, "matches": tuple(matches), "index": 0, "shown": newState["text"]}
+        return newState
+   
+    @classmethod
+    def moveDir(cls, state, dir):
+        """ A reducer which changes the directory and children being viewed by application.
+
+        This reducer takes in an input state and filepath to a directory.
+        It first makes a deep copy of input state,
+            and then sets the state["directory"] to dir.
+        It calls on FileSystem.quickListing to list the children of directory dir,
+            and the list is set to state["children"]
+        On a slow or hung mount, the cached listing of dir may be shown without being checked -
+            state["stale"] is then set, and the directory is listed again on TASKS (see refreshChildren).
+        If dir cannot be listed (for instance because its mount does not respond), the directory is not changed,
+            and the user is notified.
+        If the listing had to be read again (rather than served from the FileSystem cache),
+            the metadata and previews cached for dir are dropped, since the directory changed.
+        Otherwise they are kept, so entering an unchanged directory, for instance in another Pane, costs no I/O.
+        If state["du"] is set, measuring the sizes of the new children is started in the background.
+        The view being left is pushed onto state["history"], so it can be gone back to (see back).
+        The visit is recorded by Frecency, for @jump.
+        
+        Args:
+            state (dict): State dictionary of application at previous moment
+            dir (str): Filepath of directory to be viewed by application
+
+        Returns:
+            dict: State dictionary which represents a directory and its children to be viewed by the application
+
+        Note:
+            This reducer assumes dir is a filepath to a directory. 
+            This reducer will break if 
+                (1) dir is not a string filepath
+                or 
+                (2) dir is a filepath to a file that is not a directory.
+        """
+        cached = FileSystem.cachedListing(dir)
+        stale = False
+        try:
+            children, stale = FileSystem.quickListing(dir)
+            FileSystem.changeCWD(dir)
+        except OSError as error:
+            if not stale:
+                LOGGER.warning(f"Cannot open {dir} - {error}")
+                return cls.notify(state, f"Cannot open {dir} - {error.strerror}")
+            LOGGER.warning(f"Showing the cached listing of {dir} without changing to it - {error}")
+        newState = cls.sameState(state)
+        newState["history"] = state["history"].push(state)
+        newState["directory"] = dir
+        Frecency.visit(dir)
+        newState["children"] = children
+        newState["stale"] = stale
+        if stale:
+            cls.revalidate(newState)
+        if FileSystem.cachedListing(dir) is not cached:
+            Metadata.forget(dir)
+            Preview.forget(dir)
+            FileType.forget(dir)
+        newState["selected"] = []
+        newState["marks"] = IntervalSet()
+        newState["sizes"] = {}
+        newState["compared"] = None
+        if newState["du"]:
+            DiskUsage.start(newState)
+        return newState
+
+    @classmethod
+    def setChildren(cls, state, children):
+        """ A reducer which replaces the children being viewed, without changing the directory.
+
+        This reducer takes in an input state and a list of filepaths relative to state["directory"],
+            such as the results of a search.
+        It first makes a deep copy of input state,
+            and then sets state["children"] to children and clears the selection.
+        The view being replaced is pushed onto state["history"], so it can be gone back to (see back).
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            children (list): List of filepaths relative to state["directory"]
+
+        Returns:
+            dict: State dictionary which represents the given children being viewed by the application
+        """
+        newState = cls.sameState(state)
+        newState["history"] = state["history"].push(state)
+        newState["children"] = list(children)
+        newState["selected"] = []
+        newState["marks"] = IntervalSet()
+        newState["sizes"] = {}
+        newState["compared"] = None
+        return newState
+
+    @classmethod
+    def extendChildren(cls, state, dir, listed, rest):
+        """ A reducer which appends the rest of a directory listing to the children listed so far
+
+        When a directory is listed in chunks (see FileSystem.listDirChunks),
+            the first chunk is shown right away, and this reducer adds the rest once it is listed.
+        If the state no longer shows exactly the first chunk of dir, the rest is stale,
+            and the input state itself is returned, signalling that nothing changed.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            dir (str): Filepath of the listed directory
+            listed (int): Number of children in the first chunk
+            rest (list): Remaining children of dir
+
+        Returns:
+            dict: State dictionary which represents all children of dir being viewed
+        """
+        if state["directory"] != dir or len(state["children"]) != listed or len(rest) == 0:
+            return state
+        newState = cls.sameState(state)
+        newState["children"] = state["children"] + rest
+        return newState
+
+    @classmethod
+    def refreshChildren(cls, state, dir, children):
+        """ A reducer which replaces the children of dir with a fresh listing, keeping the selection by name
+
+        It is used to revalidate a listing restored from a Session snapshot, or shown stale (see moveDir).
+        If the state no longer shows dir, or its children did not change (and were not marked stale),
+            the input state itself is returned, signalling that nothing changed.
+        Otherwise, selected children which no longer exist are dropped, and the marks are cleared,
+            since they are indices into the old children.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            dir (str): Filepath of the listed directory
+            children (list): Fresh listing of dir
+
+        Returns:
+            dict: State dictionary which represents the fresh children of dir being viewed
+        """
+        if state["directory"] != dir or (state["children"] == children and not state["stale"]):
+            return state
+        newState = cls.sameState(state)
+        newState["stale"] = False
+        if state["children"] == children:
+            return newState
+        newState["children"] = list(children)
+        newState["compared"] = None
+        names = set(children)
+        newState["selected"] = [child for child in state["selected"] if child in names]
+        if len(newState["selected"]) == 0:
+            newState["selected"] = newState["children"][0:1]
+        newState["marks"] = IntervalSet()
+        top = newState["scroll_data"]["scroll_top"]
+        newState["scroll_data"]["scroll_top"] = max(0, min(top, len(children) - 1))
+        Metadata.forget(dir)
+        Preview.forget(dir)
+        FileType.forget(dir)
+        if newState["du"]:
+            newState["sizes"] = {}
+            DiskUsage.start(newState)
+        return newState
+
+    @classmethod
+    def revalidate(cls, state):
+        """ A reducer which lists the directory of a stale state again on TASKS, to be applied by refreshChildren
+
+        It is posted by Mounts when a hung mount responds again, so that the listings which could not be revalidated
+            while it was hung are revalidated then.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: The input state itself, since nothing changed yet
+        """
+        if state["stale"]:
+            dir = state["directory"]
+            TASKS.submit(FileSystem.listDir, (dir,), 
+                         reducer=lambda state, children: cls.refreshChildren(state, dir, children))
+        return state
+
+    @classmethod
+    def _splice(cls, state, start, removed, rows):
+        """ Returns a copy of state whose children from start on have removed rows replaced with rows
+
+        The marks are shifted along (see IntervalSet.splice).
+        """
+        newState = cls.sameState(state)
+        children = state["children"]
+        newState["children"] = children[:start] + rows + children[start + removed:]
+        newState["marks"] = state["marks"].splice(start, removed, len(rows))
+        return newState
+
+    @staticmethod
+    def isExpanded(state, index):
+        """ Returns whether the child at index is a directory expanded in place (see expandChild)
+
+        An expanded directory is followed by its own children, so this only compares two rows.
+        An empty directory therefore never counts as expanded.
+
+        Args:
+            state (dict): State dictionary of application
+            index (int): Index of the child in state["children"]
+
+        Returns:
+            bool: True if the next child is beneath the child at index
+        """
+        children = state["children"]
+        return index + 1 < len(children) and children[index + 1].startswith(children[index] + os.sep)
+
+    @classmethod
+    def expandChild(cls, state, index):
+        """ A reducer which expands the child directory at index in place, inserting its children after it
+
+        This is how tree mode (see CommandReducer.treeCommand) shows directories.
+        The children of the directory are only listed now, by FileSystem.listDir, so cached listings are reused.
+        They are inserted as filepaths relative to state["directory"] (like search results),
+            so selecting, marking and launching commands work on them as on any other child.
+        Only the new rows are spliced into state["children"] (see _splice),
+            so expanding costs the same however many other directories are expanded.
+        If the child is not a directory, or is already expanded, the input state itself is returned.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            index (int): Index of the child directory in state["children"]
+
+        Returns:
+            dict: State dictionary which represents the children of the directory being shown beneath it
+        """
+        child = state["children"][index]
+        path = FileSystem.pathOfChild(state["directory"], child)
+        if cls.isExpanded(state, index) or not FileSystem.isChildOpenable(path):
+            return state
+        rows = [os.path.join(child, name) for name in FileSystem.listDir(path)]
+        return cls._splice(state, index + 1, 0, rows)
+
+    @classmethod
+    def collapseChild(cls, state, index):
+        """ A reducer which collapses the expanded child directory at index, removing the rows beneath it
+
+        The rows beneath a directory are the consecutive rows after it which start with its path,
+            so only they are looked at, and spliced out of state["children"] (see _splice).
+        A selected row which is removed moves the selection to the directory.
+        If the child is not expanded, the input state itself is returned.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            index (int): Index of the child directory in state["children"]
+
+        Returns:
+            dict: State dictionary which represents the directory being collapsed
+        """
+        if not cls.isExpanded(state, index):
+            return state
+        children = state["children"]
+        prefix = children[index] + os.sep
+        end = index + 1
+        while end < len(children) and children[end].startswith(prefix):
+            end += 1
+        newState = cls._splice(state, index + 1, end - index - 1, [])
+        newState["selected"] = [child for child in state["selected"] if not child.startswith(prefix)]
+        if len(newState["selected"]) != len(state["selected"]):
+            newState["selected"] = newState["selected"] + [children[index]]
+        return newState
+
+    @staticmethod
+    def selectedIndex(state):
+        """ Returns the index in state["children"] of the last selected child
+
+        This is not a reducer, but a helper for reducers (and the Renderer) which move from the selection.
+        state["cursor"] is checked first, so this takes constant time whenever the selection was made by moveSelection,
+            and children are only searched if the cursor is stale (for instance after the children were replaced).
+
+        Args:
+            state (dict): State dictionary of application, with a non-empty selection
+
+        Returns:
+            int: Index of state["selected"][-1]
+        """
+        cursor = state["cursor"]
+        if cursor < len(state["children"]) and state["children"][cursor] == state["selected"][-1]:
+            return cursor
+        return state["children"].index(state["selected"][-1])
+
+    @classmethod
+    def moveSelection(cls, state, indices):
+        """ A reducer which changes the children files selected in application
+
+        This reducer takes in an input state and a list of indices (integers).
+        It first makes a deep copy of the input state,
+            and then sets state["selected"] to include state["children"][i]
+                for every i in the indices list.
+        
+        Args:
+            state (dict): State dictionary of application at previous moment
+            indices (str): List of indices (integers)
+
+        Returns:
+            dict: State dictionary which represents children files (indicated by indices list) which are selected in application.
+
+        Note:
+            This reducer assumes all the integers in indices
+                are between 0 and len(state["children"]) - 1 inclusive.
+            This reducer will break if that is not true.
+        """
+        newState = cls.sameState(state)
+        newState["selected"] = [newState["children"][i] for i in indices]
+        if len(indices) != 0:
+            newState["cursor"] = indices[-1]
+        return newState
+
+    @classmethod
+    def moveScrollDown(cls, state):
+        """ A reducer which moves scrolling down to match selection
+
+        This reducer takes in an input state.
         It first makes a deep copy of the input state,
-            and then sets state["text"] to state["text"][0:len(state["text"])-1],
-            i.e. it deletes the last character from state["text"].
+            and then sets the state["scroll_data"]["scroll_top"] to be such that
+            the last selected child will be T-1 rows from the *bottom* of the list window.
+        T is the state["scroll_data"]["scroll_trigger"].
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            
+        Returns:
+            dict: State dictionary which represents the list window being scrolled down appropriately.
+
+        Note:
+            This reducer assumes that state["selected"] is not empty.
+            This reducer will break if that is not true.
+        """ 
+        newState = cls.sameState(state)
+        index = BasicReducer.selectedIndex(newState) 
+        numc = len(newState["children"])
+        size = newState["scroll_data"]["list_size"]
+        trig = newState["scroll_data"]["scroll_trigger"]
+        newState["scroll_data"]["scroll_top"] = min(max(0, index-size+trig), numc-size)
+        return newState
+
+    @classmethod
+    def moveScrollUp(cls, state):
+        """ A reducer which moves scrolling up to match selection
+
+        This reducer takes in an input state.
+        It first makes a deep copy of the input state,
+            and then sets the state["scroll_data"]["scroll_top"] to be such that
+            the last selected child will be T-1 rows from the *top* of the list window.
+        T is the state["scroll_data"]["scroll_trigger"].
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            
+        Returns:
+            dict: State dictionary which represents the list window being scrolled up appropriately.
+
+        Note:
+            This reducer assumes that state["selected"] is not empty.
+            This reducer will break if that is not true.
+        """
+        newState = cls.sameState(state)
+        index = BasicReducer.selectedIndex(newState)
+        numc = len(newState["children"])
+        size = newState["scroll_data"]["list_size"]
+        trig = newState["scroll_data"]["scroll_trigger"]
+        newState["scroll_data"]["scroll_top"] = min(max(0, index-trig+1), numc-size)
+        return newState
+   
+    @classmethod
+    def setScrollDefault(cls, state):
+        """ A reducer which moves scrolling to top
+
+        This reducer takes in an input state.
+        It first makes a deep copy of the input state,
+            and then sets state["scroll_data"]["scroll_top"] to 0,
+            which will make the first child in children list to be on the first row of the visible list window.
+        This means the list scrollbar moves to the top.
+        
+        Args:
+            state (dict): State dictionary of application at previous moment
+            
+        Returns:
+            dict: State dictionary which represents the list window being scrolled to the top.
+        """
+        newState = cls.sameState(state)
+        newState["scroll_data"]["scroll_top"] = 0
+        return newState 
+ 
+    @classmethod
+    def setSizes(cls, state, dir, sizes, text):
+        """ A reducer which records measured sizes of children of dir, and displays a notice
+
+        This reducer is posted by DiskUsage as measurements come in.
+        If the application has moved away from dir since, the measurements are stale,
+            and the input state itself is returned, signalling that nothing changed.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            dir (str): Filepath of the directory whose children were measured
+            sizes (dict): Maps children to their size in bytes
+            text (str): Text to be displayed in text widget (after brs_prompt)
+
+        Returns:
+            dict: State dictionary which represents the sizes being displayed
+        """
+        if state["directory"] != dir or not state["du"]:
+            return state
+        newState = cls.notify(state, text)
+        newState["sizes"] = {**state["sizes"], **sizes}
+        return newState
+
+    @classmethod
+    def setMarks(cls, state, marks):
+        """ A reducer which sets the marked children, and displays how many are marked
+
+        The previous marks are pushed onto state["history"], so marking can be undone (see back).
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            marks (sp_file_explorer.IntervalSet): Indices (in children list) of the children to mark
+
+        Returns:
+            dict: State dictionary which represents the children being marked
+        """
+        newState = cls.notify(state, f"{len(marks)} of {len(state['children'])} marked")
+        newState["marks"] = marks
+        newState["history"] = state["history"].push(state)
+        return newState
+
+    @classmethod
+    def applyChanges(cls, state, changes):
+        """ A reducer which updates the children in place after files were added to or removed from directories
+
+        FileOperations posts this reducer, so that the listing of the current directory
+            reflects the operation without listing the directory again.
+        Removed children are dropped and added children are appended to state["children"].
+        If children were removed, the marks are cleared (since the indices shifted),
+            and a removed selection moves to the child which took its place.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            changes (dict): Maps directory filepaths to tuples (added, removed) of lists of filenames
+
+        Returns:
+            dict: State dictionary which represents the updated children, 
+                or the input state itself if the current directory did not change
+        """
+        if state["directory"] not in changes:
+            return state
+        added, removed = changes[state["directory"]]
+        removed = set(removed)
+        newState = cls.sameState(state)
+        children = state["children"]
+        index = cls.selectedIndex(state) if len(state["selected"]) != 0 else 0
+        if removed:
+            newState["children"] = [child for child in children if child not in removed]
+            newState["marks"] = IntervalSet()
+        present = set(newState["children"])
+        newState["children"] = newState["children"] + [child for child in added if child not in present]
+        newState["sizes"] = {child: size for child, size in state["sizes"].items() if child not in removed}
+        Metadata.forget(state["directory"])
+        FileType.forget(state["directory"])
+        if len(newState["children"]) == 0:
+            newState["selected"] = []
+        elif len(state["selected"]) == 0 or state["selected"][-1] in removed:
+            newState["selected"] = [newState["children"][min(index, len(newState["children"]) - 1)]]
+        return newState
+
+    @staticmethod
+    def targets(state):
+        """ Returns the filepaths which commands act on - the marked children, or else the last selected child
+
+        This is not a reducer, but a helper for reducers which act on files.
+
+        Args:
+            state (dict): State dictionary of application
+
+        Returns:
+            list: Filepaths of the children to act on (possibly empty)
+        """
+        dir = state["directory"]
+        if state["marks"]:
+            return [FileSystem.pathOfChild(dir, state["children"][index]) for index in state["marks"]]
+        return [FileSystem.pathOfChild(dir, child) for child in state["selected"][-1:]]
+
+    @classmethod
+    def _restoreView(cls, state, history, view):
+        """ Returns the state showing a view taken from history, without listing its directory
+
+        If the children of the view were a listing, they are stale, and the directory is listed again on TASKS
+            (see revalidate), which only costs a stat if its mtime did not change (see FileSystem.listDir),
+            and BasicReducer.refreshChildren applies any change.
+        """
+        dir = view["directory"]
+        try:
+            FileSystem.changeCWD(dir)
+        except OSError as error:
+            LOGGER.warning(f"Cannot return to {dir} - {error}")
+            newState = cls.notify(state, f"Cannot return to {dir}")
+            newState["history"] = history
+            return newState
+        newState = cls.sameState(state)
+        newState["history"] = history
+        newState["directory"] = dir
+        newState["children"] = view["children"]
+        newState["selected"] = view["selected"]
+        newState["marks"] = view["marks"]
+        newState["scroll_data"]["scroll_top"] = view["scroll_top"]
+        newState["compared"] = None
+        if dir != state["directory"]:
+            newState["sizes"] = {}
+            if newState["du"]:
+                DiskUsage.start(newState)
+        newState["stale"] = view["listed"]
+        return cls.revalidate(newState)
+
+    @classmethod
+    def back(cls, state):
+        """ A reducer which goes back to the previous view in state["history"]
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary which represents the previous view, 
+                or the input state itself if there is nothing to go back to
+        """
+        history, view = state["history"].undo(state)
+        if view is None:
+            return state
+        return cls._restoreView(state, history, view)
+
+    @classmethod
+    def forward(cls, state):
+        """ A reducer which goes forward to the view gone back from in state["history"]
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary which represents the next view, 
+                or the input state itself if there is nothing to go forward to
+        """
+        history, view = state["history"].redo(state)
+        if view is None:
+            return state
+        return cls._restoreView(state, history, view)
+
+    @classmethod
+    def refresh(cls, state):
+        """ A reducer which returns a copy of the input state, so that the application is rendered again
+
+        Background tasks which only filled caches read by the Renderer (such as Metadata)
+            post this reducer to have their results shown.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary which represents nothing being changed
+        """
+        return cls.sameState(state)
+
+    @classmethod
+    def notify(cls, state, text):
+        """ A reducer which displays a notice, unless the user is typing a command
+
+        Background tasks finish at arbitrary moments, so they report back with this reducer
+            rather than with setModeToBrowse, which would throw away a half typed command.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            text (str): Text to be displayed in text widget (after brs_prompt)
+
+        Returns:
+            dict: State dictionary which represents the notice being displayed
+        """
+        if state["mode"] == "browse":
+            return cls.setModeToBrowse(state, text)
+        return cls.sameState(state)
+
+    @classmethod
+    def quit(cls, state):
+        """ A reducer which set application to quit mode.
+
+        This reducer takes in an input state.
+        It first makes a deep copy, and sets state["mode"] to "quit".
+        When the output state is passed to Renderer, the Renderer will immediately destroy the application.
+        
+        Args:
+            state (dict): State dictionary of application at previous moment
+            
+        Returns:
+            dict: State dictionary which represents the application to be quit.
+        """
+        newState = cls.sameState(state)
+        newState["mode"] = "quit"
+        DiskUsage.shutdown()
+        Compare.cancel()
+        Duplicates.shutdown()
+        return newState
+
+        
+class KeyBindReducer:
+    """ Class of reducers (class methods) which make more complicated changes to state
+
+    KeyBindReducer holds reducer functions that make more complicated changes to state
+        but *not directly* - they do so by calling a composition of BasicReducer methods.
+    KeyBindReducer methods oftentimes check the previous state keys to see what changes are needed to the state,
+        resulting in these reducers having a lot of if-else conditionals compared to BasicReducer methods.
+    KeyBindReducer methods are often directly used in application event callbacks (which is not the case for BasicReducer methods)   
+    """
+
+    @staticmethod
+    def backSpaceKey(state):
+        """ Reducer associated with backspace keypress event callback
+
+        If user is in browse mode and the user presses BackSpace, this reducer does not do anything.
+        If the user is in command mode, and there is no command text, the reducer reverts the state back to browse mode.
+        Finally, if the user is in command mode, and there is a command text, the reducer will delete a character
+            (of the query, during a reverse search of the command history).
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing backspace
+        """
+        if state["mode"] == "command" and BasicReducer.searchQuery(state) is not None:
+            return BasicReducer.searchCommands(state, BasicReducer.searchQuery(state)[:-1])
+        if state["mode"] == "command" and state["text"] == state["prompt_data"]["cmd_prompt"]:
+            return BasicReducer.setModeToBrowse(state, "SP File Explorer")
+        elif state["mode"] == "command":
+            return BasicReducer.deleteText(state)
+        else: 
+            return BasicReducer.sameState(state)
+
+    @staticmethod
+    def key(state, event):
+        """ Reducer associated with character keypress event callback 
+        
+        If user is in command mode and presses a key, this reducer will add the character to command text,
+            or to the query of the reverse search of the command history in progress (see BasicReducer.searchCommands).
+        Otherwise, this reducer does nothing.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            event (tkinter.Event): KeyPress Event object
+
+        Returns:
+            dict: State dictionary representing the effect of pressing a character key
+        """
+        if state["mode"] == "command":
+            query = BasicReducer.searchQuery(state)
+            if query is not None:
+                return BasicReducer.searchCommands(state, query + event.char)
+            return BasicReducer.addText(state, event.char)
+        else:
+            return BasicReducer.sameState(state) 
+
+    @staticmethod
+    def upKey(state):
+        """ Reducer associated with up arrow keypress event callback
+
+        If user is in browse mode, and presses up, this reducer will move 
+        the selection up the list of children files (unless already at the top), 
+            and scrolling will be adjusted accordingly.
+        If user is in command mode, the previous command is recalled from the history (see BasicReducer.recallCommand).
+        If there are no children in the directory, the reducer does nothing.       
+ 
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing up arrow key
+        """
+        if state["mode"] == "command":
+            return BasicReducer.recallCommand(BasicReducer.acceptSearch(state), -1)
+        if state["mode"] == "browse" and len(state["selected"]) != 0:
+            index = BasicReducer.selectedIndex(state)
+            newState = BasicReducer.setModeToBrowse(state, "Moved Selection Up")
+            if index != 0:
+                newIndex = index - 1
+                newState = BasicReducer.moveSelection(newState, [newIndex])
+                wIndex = newIndex - newState["scroll_data"]["scroll_top"]
+                trig = newState["scroll_data"]["scroll_trigger"]  
+                if wIndex < trig - 1:
+                    newState = BasicReducer.moveScrollUp(newState)
+            return newState
+        else:
+            return BasicReducer.sameState(state) 
+            
+    @staticmethod
+    def downKey(state):
+        """ Reducer associated with down arrow keypress event callback
+        
+        If user is in browse mode and presses down, this reducer will make 
+            the selection move down the list of children files (unless already at the bottom),
+            and scrolling will be adjusted accordingly.
+        If user is in command mode, the next command is recalled from the history (see BasicReducer.recallCommand).
+        If there are no children in the directory, the reducer does nothing.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing down arrow key 
+        """ 
+        if state["mode"] == "command":
+            return BasicReducer.recallCommand(BasicReducer.acceptSearch(state), 1)
+        if state["mode"] == "browse" and len(state["selected"]) != 0:
+            index = BasicReducer.selectedIndex(state) 
+            numc = len(state["children"])
+            newState = BasicReducer.setModeToBrowse(state, "Moved Selection Down")
+            if index != numc-1:
+                newIndex = index + 1
+                wIndex = newIndex - newState["scroll_data"]["scroll_top"]
+                numw = state["scroll_data"]["list_size"]
+                trig = state["scroll_data"]["scroll_trigger"]  
+                newState = BasicReducer.moveSelection(newState, [newIndex])
+                if wIndex > numw - trig:
+                    newState = BasicReducer.moveScrollDown(newState)
+            return newState
+        else:
+            return BasicReducer.sameState(state) 
+
+    @staticmethod
+    def shiftUpKey(state):
+        """ Reducer associated with Shift-Up keypress event callback
+
+        If the user is in browse mode and presses Shift-Up, this reducer will make the application ascend to the parent directory.
+        The parent's children files will be shown, and selection/scrolling will be set to top.
+        Otherwise, this reducer will do nothing.
+        
+        Args:
+            state (dict): State dictionary of application at previous moment.
+
+        Returns:
+            dict: State dictionary representing the effect of pressing Shift-Up arrow key
+        """
+        if state["mode"] == "browse":
+            parent = FileSystem.parent(state["directory"])
+            LOGGER.debug(f"\t parent is {parent}")
+            newState = BasicReducer.moveDir(state, parent)
+            if newState["directory"] != parent:
+                return newState
+            newState = BasicReducer.setModeToBrowse(newState, "Moved Up Directory")
+            if len(newState["children"]) > 0:
+                newState = BasicReducer.moveSelection(newState, [0])
+                newState = BasicReducer.moveScrollUp(newState) 
+            else:
+                newState = BasicReducer.setScrollDefault(newState)
+            return newState 
+   
+    @staticmethod
+    def shiftDownKey(state):
+        """ Reducer associated with down arrow keypress event callback
+
+        If the user is in browse mode, selection is on a child directory, 
+            and the user presses Shift-Down, this reducer will make the application descend down the child directory.
+        The directory's children files will be shown, and selection/scrolling will be set to top.
+        Otherwise, this reducer does nothing.
+        
+        Args:
+            state (dict): State dictionary of application at previous moment.
+
+        Returns:
+            dict: State dictionary representing the effect of pressing Shift-Down arrow key 
+        """
+        if state["mode"] == "browse" and len(state["selected"]) > 0:
+            child_path = FileSystem.pathOfChild(state["directory"], state["selected"][-1])
+            openable = FileSystem.isChildOpenable(child_path)
+            if openable:
+                newState = BasicReducer.moveDir(state, child_path)
+                if newState["directory"] != child_path:
+                    return newState
+                newState = BasicReducer.setModeToBrowse(newState, "Moved Down Directory")
+                if len(newState["children"]) > 0:
+                    newState = BasicReducer.moveSelection(newState, [0])
+                    newState = BasicReducer.moveScrollUp(newState) 
+                else:
+                    newState = BasicReducer.setScrollDefault(newState)
+                return newState
+            else:
+                return BasicReducer.sameState(state)          
+        else:
+            return BasicReducer.sameState(state) 
+    
+    @staticmethod
+    def spaceKey(state, event):
+        """ Reducer associated with space keypress event callback
+
+        If user is in browse mode and presses space, the mark of the last selected child is toggled,
+            and the selection moves down.
+        If user is in command mode, a space is added to the command text like any other character.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            event (tkinter.Event): KeyPress Event object
+
+        Returns:
+            dict: State dictionary representing the effect of pressing space
+        """
+        if state["mode"] == "browse" and len(state["selected"]) != 0:
+            index = BasicReducer.selectedIndex(state)
+            newState = KeyBindReducer.downKey(state)
+            return BasicReducer.setMarks(newState, state["marks"].toggle(index))
+        return KeyBindReducer.key(state, event)
+
+    @staticmethod
+    def controlDownKey(state):
+        """ Reducer associated with Control-Down keypress event callback
+
+        If user is in browse mode, the last selected child and the one below it are marked,
+            and the selection moves down, so holding Control-Down marks a range.
+        Otherwise, this reducer does nothing.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing Control-Down
+        """
+        if state["mode"] == "browse" and len(state["selected"]) != 0:
+            index = BasicReducer.selectedIndex(state)
+            newState = KeyBindReducer.downKey(state)
+            newIndex = BasicReducer.selectedIndex(newState)
+            return BasicReducer.setMarks(newState, state["marks"].add(index, newIndex + 1))
+        return BasicReducer.sameState(state)
+
+    @staticmethod
+    def controlUpKey(state):
+        """ Reducer associated with Control-Up keypress event callback
+
+        If user is in browse mode, the last selected child and the one above it are marked,
+            and the selection moves up, so holding Control-Up marks a range.
+        Otherwise, this reducer does nothing.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing Control-Up
+        """
+        if state["mode"] == "browse" and len(state["selected"]) != 0:
+            index = BasicReducer.selectedIndex(state)
+            newState = KeyBindReducer.upKey(state)
+            newIndex = BasicReducer.selectedIndex(newState)
+            return BasicReducer.setMarks(newState, state["marks"].add(newIndex, index + 1))
+        return BasicReducer.sameState(state)
+
+    @staticmethod
+    def returnKey(state):
+        """ Reducer associated with Return keypress event callback
+
+        If the user is in command mode, types in a command, and presses Enter,
+            this reducer launches the command on the selected file in the background (see Launcher), 
+            and sets the application will to browse mode.
+        If some children are marked, the command is launched once, with all marked files as arguments.
+        Commands starting with CommandReducer.PREFIX are builtin commands, and are handed to CommandReducer.run instead.
+        Every command is recorded in the CommandHistory (in the background), and a reverse search in progress
+            runs the command found.
+        Other commands cannot be run inside an archive, since its members do not exist on disk (see Archive).
+        In other cases, the reducer will do nothing.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effects of pressing Shift-Down arrow key
+        """
+        if state["mode"] == "command":
+            state = BasicReducer.acceptSearch(state)
+            length = len(state["prompt_data"]["cmd_prompt"])
+            command = state["text"][length:]
+            CommandHistory.record(command)
+            if command.startswith(CommandReducer.PREFIX):
+                return CommandReducer.run(state, command)
+            if Archive.locate(state["directory"]) is not None:
+                return BasicReducer.setModeToBrowse(state, "Cannot run commands on files inside an archive")
+            paths = BasicReducer.targets(state)
+            if len(paths) != 0:
+                FileSystem.open(command, *paths)
+            newState = BasicReducer.setModeToBrowse(state, "SP File Explorer")
+            return newState
+        else:
+            return BasicReducer.sameState(state) 
+            
+
+    @staticmethod
+    def altLeftKey(state):
+        """ Reducer associated with Alt-Left keypress event callback
+
+        If the user is in browse mode, goes back to the previous directory (see BasicReducer.back).
+        Otherwise, this reducer does nothing.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing Alt-Left arrow key
+        """
+        if state["mode"] == "browse":
+            newState = BasicReducer.back(state)
+            if newState is not state:
+                return BasicReducer.setModeToBrowse(newState, f"Back to {newState['directory']}")
+        return BasicReducer.sameState(state)
+
+    @staticmethod
+    def altRightKey(state):
+        """ Reducer associated with Alt-Right keypress event callback
+
+        If the user is in browse mode, goes forward to the directory gone back from (see BasicReducer.forward).
+        Otherwise, this reducer does nothing.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing Alt-Right arrow key
+        """
+        if state["mode"] == "browse":
+            newState = BasicReducer.forward(state)
+            if newState is not state:
+                return BasicReducer.setModeToBrowse(newState, f"Forward to {newState['directory']}")
+        return BasicReducer.sameState(state)
+
+    @staticmethod
+    def rightKey(state):
+        """ Reducer associated with Right arrow keypress event callback
+
+        If the user is in browse mode with tree mode on (see CommandReducer.treeCommand),
+            the last selected directory is expanded in place (see BasicReducer.expandChild),
+            or if it is already expanded, the selection moves down to its first child.
+        Otherwise, this reducer does nothing.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing Right arrow key
+        """
+        if state["mode"] == "browse" and state["tree"] and len(state["selected"]) != 0:
+            index = BasicReducer.selectedIndex(state)
+            if BasicReducer.isExpanded(state, index):
+                return KeyBindReducer.downKey(state)
+            newState = BasicReducer.expandChild(state, index)
+            if newState is not state:
+                count = len(newState["children"]) - len(state["children"])
+                return BasicReducer.setModeToBrowse(newState, f"Expanded {state['selected'][-1]} ({count} children)")
+        return BasicReducer.sameState(state)
+
+    @staticmethod
+    def leftKey(state):
+        """ Reducer associated with Left arrow keypress event callback
+
+        If the user is in browse mode with tree mode on (see CommandReducer.treeCommand),
+            the last selected directory is collapsed if it is expanded (see BasicReducer.collapseChild),
+            and otherwise the selection moves up to the directory it is shown beneath.
+        Otherwise, this reducer does nothing.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing Left arrow key
+        """
+        if state["mode"] == "browse" and state["tree"] and len(state["selected"]) != 0:
+            index = BasicReducer.selectedIndex(state)
+            if BasicReducer.isExpanded(state, index):
+                newState = BasicReducer.collapseChild(state, index)
+                return BasicReducer.setModeToBrowse(newState, f"Collapsed {state['selected'][-1]}")
+            parent = os.path.dirname(state["children"][index])
+            for newIndex in range(index - 1, -1, -1):
+                if state["children"][newIndex] == parent:
+                    newState = BasicReducer.setModeToBrowse(state, f"Moved Selection to {parent}")
+                    newState = BasicReducer.moveSelection(newState, [newIndex])
+                    if newIndex - newState["scroll_data"]["scroll_top"] < newState["scroll_data"]["scroll_trigger"] - 1:
+                        newState = BasicReducer.moveScrollUp(newState)
+                    return newState
+        return BasicReducer.sameState(state)
+
+    @staticmethod
+    def colonKey(state):
+        """ Reducer associated with Colon keypress event callback
+
+        If the user is in browse mode and presses the colon key,
+            the application switches to command mode,
+            and the index of executables used by Tab completion is checked in the background (see Completion.warm).
+        Otherwise, this reducer does nothing 
+        
+        Args:
+            state (dict): State dictionary of application at previous moment
+    
+        Returns:
+            dict: State dictionary representing the effect of pressing colon key
+        """
+        if state["mode"] == "browse":
+            Completion.warm()
+            return BasicReducer.setModeToCommand(state, "")
+        else:
+            return BasicReducer.sameState(state)
+
+    @staticmethod
+    def tabKey(state):
+        """ Reducer associated with Tab keypress event callback in the command text
+
+        If user is in command mode and presses Tab, the last word of the command is completed (see BasicReducer.completeText).
+        Otherwise, this reducer does nothing.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing Tab
+        """
+        if state["mode"] == "command":
+            return BasicReducer.completeText(BasicReducer.acceptSearch(state))
+        return BasicReducer.sameState(state)
+
+    @staticmethod
+    def controlRKey(state):
+        """ Reducer associated with Control-R keypress event callback
+
+        If user is in command mode, a reverse search of the command history is started,
+            or if one is in progress, it goes on to an older command (see BasicReducer.searchCommands).
+        Otherwise, this reducer does nothing.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing Control-R
+        """
+        if state["mode"] != "command":
+            return BasicReducer.sameState(state)
+        query = BasicReducer.searchQuery(state)
+        if query is None:
+            return BasicReducer.searchCommands(state, "")
+        return BasicReducer.searchCommands(state, query, older=True)
+
+    @staticmethod
+    def escapeSelectKeys(state):
+        """ Reducer associated with mouse select and Escape Keypress event callbacks
+        
+        This reducer will set the application to browse mode.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+
+        Returns:
+            dict: State dictionary representing the effect of pressing escape or clicking the mouse.
+        """
+        return BasicReducer.setModeToBrowse(state, "SP File Explorer")
+
+class CommandReducer:
+    """ Class of reducers (class methods) implementing the builtin commands of command mode
+
+    Normally, the text typed in command mode is a command which is launched on the selected file.
+    If the text starts with PREFIX, it is a builtin command instead, such as
+
+        :@find report
+
+    run() splits the text into a command name and an argument string,
+        and calls the class method named after the command with a "Command" suffix (here findCommand).
+    Every builtin command is a reducer taking the state and the argument string.
+    Slow builtin commands start their work on the module level TaskQueue (TASKS) and return immediately.
+    """
+
+    PREFIX = "@"
+
+    @classmethod
+    def run(cls, state, command):
+        """ Reducer which runs a builtin command
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            command (str): Text typed in command mode, starting with PREFIX
+
+        Returns:
+            dict: State dictionary representing the effect of the command
+        """
+        name, _, arg = command[len(cls.PREFIX):].strip().partition(" ")
+        method = getattr(cls, name + "Command", None)
+        if method is None:
+            return BasicReducer.setModeToBrowse(state, f"Unknown command {cls.PREFIX}{name}")
+        LOGGER.info(f"Running builtin command {name} with argument '{arg}'")
+        return method(state, arg.strip())
+
+    @classmethod
+    def names(cls):
+        """ Returns the sorted names of the builtin commands (without PREFIX) """
+        return sorted(name[:-len("Command")] for name in dir(cls) if name.endswith("Command"))
+
+    @staticmethod
+    def _showResults(state, paths, text):
+        """ Shows a list of paths (relative to state["directory"]) in place of the children, selecting the first """
+        newState = BasicReducer.setChildren(state, paths)
+        newState = BasicReducer.setModeToBrowse(newState, text)
+        if len(newState["children"]) > 0:
+            newState = BasicReducer.moveSelection(newState, [0])
+            newState = BasicReducer.moveScrollUp(newState)
+        else:
+            newState = BasicReducer.setScrollDefault(newState)
+        return newState
+
+    @classmethod
+    def indexCommand(cls, state, arg):
+        """ Builtin command which indexes the current directory in the background
+
+        If the directory is beneath an indexed root the index is refreshed,
+            otherwise the directory is added to the index as a new root.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            arg (str): Unused
+
+        Returns:
+            dict: State dictionary representing the indexing to have started
+        """
+        TASKS.submit(FileIndex.shared().update, (state["directory"],), BasicReducer.notify)
+        return BasicReducer.setModeToBrowse(state, f"Indexing {state['directory']} ...")
+
+    @classmethod
+    def duCommand(cls, state, arg):
+        """ Builtin command which toggles displaying the recursive sizes of the children
+
+        While it is on, the sizes are measured in the background whenever the directory changes.
 
         Args:
             state (dict): State dictionary of application at previous moment
-            
+            arg (str): Unused
+
         Returns:
-            dict: State dictionary which represents a character being deleted from displayed text 
-        
-        Note:
-            This reducer assumes state["text"] is not the empty string.
-            This reducer will break if state["text"] is empty.
+            dict: State dictionary representing sizes being measured, or hidden
         """
-        newState = cls.sameState(state)
-        cmd_length = len(state["text"])
-        newState["text"] = state["text"][0:cmd_length-1]
+        if state["du"]:
+            DiskUsage.cancel()
+            newState = BasicReducer.setModeToBrowse(state, "Disk usage off")
+            newState["du"] = False
+            newState["sizes"] = {}
+            return newState
+        newState = BasicReducer.setModeToBrowse(state, "Disk usage on")
+        newState["du"] = True
+        DiskUsage.start(newState)
         return newState
 
     @classmethod
-    def addText(cls, state, char):
-        """ A reducer which adds a character to state["text"]
+    def columnsCommand(cls, state, arg):
+        """ Builtin command which chooses the metadata columns shown next to the children
+
+        The argument is a space separated list of column names (see Metadata.COLUMNS),
+            e.g. "size mtime perm owner". Without an argument, all columns are hidden.
 
-        This reducer takes in an input state and a string.
-        It first makes a deep copy of the input state,
-            and appends the input string to  state["text"].
-        
         Args:
             state (dict): State dictionary of application at previous moment
-            text (str): Character to be appended to the displayed text 
+            arg (str): Space separated column names
 
         Returns:
-            dict: State dictionary which represents a character appended to displayed text
-
-        Note:
-            This reducer assumes char has length 1, 
-                and that is how the reducer will be used generally,
-                but it won't break if char has a different length.
+            dict: State dictionary representing the columns being shown
         """
-        newState = cls.sameState(state)
-        newState["text"] += char
-        return newState 
-   
+        columns = arg.split()
+        unknown = [column for column in columns if column not in Metadata.COLUMNS]
+        if unknown:
+            return BasicReducer.setModeToBrowse(state, f"Unknown columns {' '.join(unknown)} - choose from {' '.join(Metadata.COLUMNS)}")
+        newState = BasicReducer.setModeToBrowse(state, f"Showing columns {' '.join(columns)}" if columns else "Hiding columns")
+        newState["columns"] = columns
+        return newState
+
     @classmethod
-    def moveDir(cls, state, dir):
-        """ A reducer which changes the directory and children being viewed by application.
+    def previewCommand(cls, state, arg):
+        """ Builtin command which toggles the preview pane
 
-        This reducer takes in an input state and filepath to a directory.
-        It first makes a deep copy of input state,
-            and then sets the state["directory"] to dir.
-        It calls on FileSystem.listDir to list the children of directory dir,
-            and the list is set to state["children"]
-        
         Args:
             state (dict): State dictionary of application at previous moment
-            dir (str): Filepath of directory to be viewed by application
+            arg (str): Unused
 
         Returns:
-            dict: State dictionary which represents a directory and its children to be viewed by the application
-
-        Note:
-            This reducer assumes dir is a filepath to a directory. 
-            This reducer will break if 
-                (1) dir is not a string filepath
-                or 
-                (2) dir is a filepath to a file that is not a directory.
+            dict: State dictionary representing the preview pane being shown, or hidden
         """
-        newState = cls.sameState(state)
-        newState["directory"] = dir
-        FileSystem.changeCWD(dir)
-        newState["children"] = FileSystem.listDir(dir)
-        newState["selected"] = []
+        newState = BasicReducer.setModeToBrowse(state, "Preview off" if state["preview"] else "Preview on")
+        newState["preview"] = not state["preview"]
         return newState
 
     @classmethod
-    def moveSelection(cls, state, indices):
-        """ A reducer which changes the children files selected in application
+    def treeCommand(cls, state, arg):
+        """ Builtin command which toggles tree mode
+
+        In tree mode, Right expands the selected directory in place and Left collapses it
+            (see KeyBindReducer.rightKey and KeyBindReducer.leftKey),
+            and children are shown indented beneath their directory.
+        Turning tree mode off collapses every expanded directory.
 
-        This reducer takes in an input state and a list of indices (integers).
-        It first makes a deep copy of the input state,
-            and then sets state["selected"] to include state["children"][i]
-                for every i in the indices list.
-        
         Args:
             state (dict): State dictionary of application at previous moment
-            indices (str): List of indices (integers)
+            arg (str): Unused
 
         Returns:
-            dict: State dictionary which represents children files (indicated by indices list) which are selected in application.
+            dict: State dictionary representing tree mode being turned on, or off
+        """
+        newState = BasicReducer.setModeToBrowse(state, "Tree off" if state["tree"] else "Tree on")
+        newState["tree"] = not state["tree"]
+        if not state["tree"]:
+            return newState
+        present = set(state["children"])
+        children = [child for child in state["children"] if os.path.dirname(child) not in present]
+        if len(children) == len(state["children"]):
+            return newState
+        selected = []
+        for child in state["selected"]:
+            while os.path.dirname(child) in present:
+                child = os.path.dirname(child)
+            if child not in selected:
+                selected.append(child)
+        newState["children"] = children
+        newState["selected"] = selected
+        newState["marks"] = IntervalSet()
+        if len(selected) == 0:
+            return BasicReducer.setScrollDefault(newState)
+        return BasicReducer.moveScrollUp(newState)
 
-        Note:
-            This reducer assumes all the integers in indices
-                are between 0 and len(state["children"]) - 1 inclusive.
-            This reducer will break if that is not true.
+    @classmethod
+    def eachCommand(cls, state, arg):
+        """ Builtin command which runs a command once for every marked file (or the selected file), in parallel
+
+        The argument is the command, optionally preceded by -j N to run at most N commands at once, e.g.
+
+            :@each -j 8 gzip -9
+
+        Progress is shown as the commands finish (see Batch).
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            arg (str): Options and command
+
+        Returns:
+            dict: State dictionary representing the batch to have started
         """
-        newState = cls.sameState(state)
-        newState["selected"] = [newState["children"][i] for i in indices]
-        return newState
+        jobs, max_args, command = Batch.parseOptions(arg)
+        return cls._startBatch(state, command, jobs, 1)
 
     @classmethod
-    def moveScrollDown(cls, state):
-        """ A reducer which moves scrolling down to match selection
+    def xargsCommand(cls, state, arg):
+        """ Builtin command which runs a command over the marked files (or the selected file), many files at a time
 
-        This reducer takes in an input state.
-        It first makes a deep copy of the input state,
-            and then sets the state["scroll_data"]["scroll_top"] to be such that
-            the last selected child will be T-1 rows from the *bottom* of the list window.
-        T is the state["scroll_data"]["scroll_trigger"].
+        Like xargs, the files are passed to the command in chunks as large as fit on one command line,
+            or of at most N files with -n N. Chunks run in parallel, at most N at once with -j N, e.g.
+
+            :@xargs -n 100 -j 4 chmod go-w
 
         Args:
             state (dict): State dictionary of application at previous moment
-            
+            arg (str): Options and command
+
         Returns:
-            dict: State dictionary which represents the list window being scrolled down appropriately.
+            dict: State dictionary representing the batch to have started
+        """
+        jobs, max_args, command = Batch.parseOptions(arg)
+        return cls._startBatch(state, command, jobs, max_args)
 
-        Note:
-            This reducer assumes that state["selected"] is not empty.
-            This reducer will break if that is not true.
-        """ 
-        newState = cls.sameState(state)
-        index = newState["children"].index(newState["selected"][-1]) 
-        numc = len(newState["children"])
-        size = newState["scroll_data"]["list_size"]
-        trig = newState["scroll_data"]["scroll_trigger"]
-        newState["scroll_data"]["scroll_top"] = min(max(0, index-size+trig), numc-size)
-        return newState
+    @staticmethod
+    def _startBatch(state, command, jobs, max_args):
+        paths = BasicReducer.targets(state)
+        if not command.strip() or len(paths) == 0:
+            return BasicReducer.setModeToBrowse(state, "Nothing to run")
+        batch = Batch.start(command, paths, jobs, max_args)
+        return BasicReducer.setModeToBrowse(state, Batch.describe(batch))
+
+    @staticmethod
+    def _parsePolicy(arg):
+        """ Splits a leading -o POLICY (conflict policy of FileOperations) from an argument string """
+        match = re.match(r"-o\s*(\w+)\s+(.*)", arg, re.DOTALL)
+        if match is None:
+            return "skip", arg
+        return match.group(1), match.group(2)
 
     @classmethod
-    def moveScrollUp(cls, state):
-        """ A reducer which moves scrolling up to match selection
+    def _startOperation(cls, state, kind, arg):
+        paths = BasicReducer.targets(state)
+        if len(paths) == 0:
+            return BasicReducer.setModeToBrowse(state, f"Nothing to {kind}")
+        dest = None
+        policy = "skip"
+        if kind in ["copy", "move"]:
+            policy, dest = cls._parsePolicy(arg)
+            if policy not in FileOperations.POLICIES:
+                return BasicReducer.setModeToBrowse(state, f"Unknown policy {policy} - choose from {' '.join(FileOperations.POLICIES)}")
+            dest = os.path.join(state["directory"], os.path.expanduser(dest.strip()))
+            if not os.path.isdir(dest):
+                return BasicReducer.setModeToBrowse(state, f"{dest} is not a directory")
+        op = FileOperations.start(kind, paths, dest, policy)
+        return BasicReducer.setModeToBrowse(state, FileOperations.describe(op))
 
-        This reducer takes in an input state.
-        It first makes a deep copy of the input state,
-            and then sets the state["scroll_data"]["scroll_top"] to be such that
-            the last selected child will be T-1 rows from the *top* of the list window.
-        T is the state["scroll_data"]["scroll_trigger"].
+    @classmethod
+    def copyCommand(cls, state, arg):
+        """ Builtin command which copies the marked files (or the selected file) into a directory
+
+        The argument is the destination directory (relative to the current directory),
+            optionally preceded by -o POLICY, which decides what happens when a destination exists
+            (skip - the default, overwrite or rename), e.g.
+
+            :@copy -o rename ../backup
 
         Args:
             state (dict): State dictionary of application at previous moment
-            
+            arg (str): Options and destination directory
+
         Returns:
-            dict: State dictionary which represents the list window being scrolled up appropriately.
+            dict: State dictionary representing the copy to have started
+        """
+        return cls._startOperation(state, "copy", arg)
 
-        Note:
-            This reducer assumes that state["selected"] is not empty.
-            This reducer will break if that is not true.
+    @classmethod
+    def moveCommand(cls, state, arg):
+        """ Builtin command which moves the marked files (or the selected file) into a directory
+
+        Takes the same argument as copyCommand.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            arg (str): Options and destination directory
+
+        Returns:
+            dict: State dictionary representing the move to have started
         """
-        newState = cls.sameState(state)
-        index = newState["children"].index(newState["selected"][-1])
-        numc = len(newState["children"])
-        size = newState["scroll_data"]["list_size"]
-        trig = newState["scroll_data"]["scroll_trigger"]
-        newState["scroll_data"]["scroll_top"] = min(max(0, index-trig+1), numc-size)
-        return newState
-   
+        return cls._startOperation(state, "move", arg)
+
     @classmethod
-    def setScrollDefault(cls, state):
-        """ A reducer which moves scrolling to top
+    def deleteCommand(cls, state, arg):
+        """ Builtin command which permanently deletes the marked files (or the selected file)
 
-        This reducer takes in an input state.
-        It first makes a deep copy of the input state,
-            and then sets state["scroll_data"]["scroll_top"] to 0,
-            which will make the first child in children list to be on the first row of the visible list window.
-        This means the list scrollbar moves to the top.
-        
         Args:
             state (dict): State dictionary of application at previous moment
-            
+            arg (str): Unused
+
         Returns:
-            dict: State dictionary which represents the list window being scrolled to the top.
+            dict: State dictionary representing the deletion to have started
         """
-        newState = cls.sameState(state)
-        newState["scroll_data"]["scroll_top"] = 0
-        return newState 
- 
+        return cls._startOperation(state, "delete", arg)
+
     @classmethod
-    def quit(cls, state):
-        """ A reducer which set application to quit mode.
+    def trashCommand(cls, state, arg):
+        """ Builtin command which moves the marked files (or the selected file) to the trash
 
-        This reducer takes in an input state.
-        It first makes a deep copy, and sets state["mode"] to "quit".
-        When the output state is passed to Renderer, the Renderer will immediately destroy the application.
-        
         Args:
             state (dict): State dictionary of application at previous moment
-            
+            arg (str): Unused
+
         Returns:
-            dict: State dictionary which represents the application to be quit.
+            dict: State dictionary representing the trashing to have started
         """
-        newState = cls.sameState(state)
-        newState["mode"] = "quit"
-        return newState
+        return cls._startOperation(state, "trash", arg)
 
-        
-class KeyBindReducer:
-    """ Class of reducers (class methods) which make more complicated changes to state
+    @classmethod
+    def cancelCommand(cls, state, arg):
+        """ Builtin command which cancels the running file operations
 
-    KeyBindReducer holds reducer functions that make more complicated changes to state
-        but *not directly* - they do so by calling a composition of BasicReducer methods.
-    KeyBindReducer methods oftentimes check the previous state keys to see what changes are needed to the state,
-        resulting in these reducers having a lot of if-else conditionals compared to BasicReducer methods.
-    KeyBindReducer methods are often directly used in application event callbacks (which is not the case for BasicReducer methods)   
-    """
+        Args:
+            state (dict): State dictionary of application at previous moment
+            arg (str): Unused
 
-    @staticmethod
-    def backSpaceKey(state):
-        """ Reducer associated with backspace keypress event callback
+        Returns:
+            dict: State dictionary representing the operations being cancelled
+        """
+        return BasicReducer.setModeToBrowse(state, f"Cancelling {FileOperations.cancel()} operations")
 
-        If user is in browse mode and the user presses BackSpace, this reducer does not do anything.
-        If the user is in command mode, and there is no command text, the reducer reverts the state back to browse mode.
-        Finally, if the user is in command mode, and there is a command text, the reducer will delete a character.
+    @classmethod
+    def dupesCommand(cls, state, arg):
+        """ Builtin command which finds the duplicate files beneath the current directory in the background (see Duplicates)
+
+        The groups of duplicates are shown with showDuplicates once they are found.
 
         Args:
             state (dict): State dictionary of application at previous moment
+            arg (str): Unused
 
         Returns:
-            dict: State dictionary representing the effect of pressing backspace
+            dict: State dictionary representing the search being started
         """
-        if state["mode"] == "command" and state["text"] == state["prompt_data"]["cmd_prompt"]:
-            return BasicReducer.setModeToBrowse(state, "SP File Explorer")
-        elif state["mode"] == "command":
-            return BasicReducer.deleteText(state)
-        else: 
-            return BasicReducer.sameState(state)
+        dir = state["directory"]
+        if FileSystem.backendOf(dir) is not FileSystem.LOCAL or Archive.locate(dir) is not None:
+            return BasicReducer.setModeToBrowse(state, "Duplicates are only found in local directories")
+        TASKS.submit(Duplicates.find, (dir,), reducer=lambda state, found: cls.showDuplicates(state, dir, *found))
+        return BasicReducer.setModeToBrowse(state, f"Duplicates - listing the files beneath {dir} ...")
 
-    @staticmethod
-    def key(state, event):
-        """ Reducer associated with character keypress event callback 
-        
-        If user is in command mode and presses a key, this reducer will add the character to command text.
-        Otherwise, this reducer does nothing.
+    @classmethod
+    def showDuplicates(cls, state, dir, groups, sizes, read):
+        """ A reducer which shows the groups of duplicate files found beneath dir, one group after the other
+
+        Every file is shown with its size, so the groups can be told apart, and every file is selectable like search results.
+        It is only applied to the pane which started the search (see TaskQueue).
+        If the pane has moved away from dir since, the input state itself is returned.
 
         Args:
             state (dict): State dictionary of application at previous moment
-            event (tkinter.Event): KeyPress Event object
+            dir (str): Filepath of the directory searched
+            groups (list): Groups of filepaths of identical files (see Duplicates.find)
+            sizes (list): File size of each group
+            read (int): Number of bytes which were hashed fully
 
         Returns:
-            dict: State dictionary representing the effect of pressing a character key
+            dict: State dictionary representing the duplicates being viewed
         """
-        if state["mode"] == "command":
-            return BasicReducer.addText(state, event.char)
-        else:
-            return BasicReducer.sameState(state) 
+        if state["directory"] != dir:
+            return state
+        paths = [os.path.relpath(path, dir) for group in groups for path in group]
+        wasted = sum(size * (len(group) - 1) for group, size in zip(groups, sizes))
+        text = f"Found {len(groups)} groups of duplicates, {DiskUsage.format(wasted)} wasted (read {DiskUsage.format(read)} fully)"
+        newState = cls._showResults(state, paths, text)
+        newState["sizes"] = {os.path.relpath(path, dir): size for group, size in zip(groups, sizes) for path in group}
+        return newState
 
-    @staticmethod
-    def upKey(state):
-        """ Reducer associated with up arrow keypress event callback
+    @classmethod
+    def compareCommand(cls, state, arg):
+        """ Builtin command which compares the current directory with another, recursively, in the background (see Compare)
+
+        The argument is the other directory (relative to the current one), optionally preceded by -c,
+            in which case the files of the same size but different mtimes are compared by their contents.
+        The paths which differ are shown in place of the children as they are found (see addCompared):
+            those found on the right side only are shown by their absolute path, the others relative to the current directory.
 
-        If user is in browse mode, and presses up, this reducer will move 
-        the selection up the list of children files (unless already at the top), 
-            and scrolling will be adjusted accordingly.
-        If the user is not in browse mode, or if there are no children in the directory,
-            the reducer does nothing.       
- 
         Args:
             state (dict): State dictionary of application at previous moment
+            arg (str): "[-c] PATH"
 
         Returns:
-            dict: State dictionary representing the effect of pressing up arrow key
+            dict: State dictionary representing the comparison being started
         """
-        if state["mode"] == "browse" and len(state["selected"]) != 0:
-            index = state["children"].index(state["selected"][-1])
-            newState = BasicReducer.setModeToBrowse(state, "Moved Selection Up")
-            if index != 0:
-                newIndex = index - 1
-                newState = BasicReducer.moveSelection(newState, [newIndex])
-                wIndex = newIndex - newState["scroll_data"]["scroll_top"]
-                trig = newState["scroll_data"]["scroll_trigger"]  
-                if wIndex < trig - 1:
-                    newState = BasicReducer.moveScrollUp(newState)
-            return newState
-        else:
-            return BasicReducer.sameState(state) 
-            
-    @staticmethod
-    def downKey(state):
-        """ Reducer associated with down arrow keypress event callback
-        
-        If user is in browse mode and presses down, this reducer will make 
-            the selection move down the list of children files (unless already at the bottom),
-            and scrolling will be adjusted accordingly.
-        If the user is not in browse mode, or if there are no children in the directory,
-            the reducer does nothing.
+        dir = state["directory"]
+        match = re.fullmatch(r"(-c\s+)?(.+)", arg)
+        if match is None or match.group(2) == "-c":
+            return BasicReducer.setModeToBrowse(state, "Usage: compare [-c] PATH")
+        other = os.path.normpath(os.path.join(dir, os.path.expanduser(match.group(2))))
+        if FileSystem.backendOf(dir) is not FileSystem.LOCAL or Archive.locate(dir) is not None:
+            return BasicReducer.setModeToBrowse(state, "Directories are only compared locally")
+        if not os.path.isdir(other) or other == dir:
+            return BasicReducer.setModeToBrowse(state, f"Cannot compare with {other}")
+        generation = Compare.start()
+        TASKS.submit(Compare.compare, (dir, other, match.group(1) is not None, generation))
+        newState = cls._showResults(state, [], f"Comparing with {other} ...")
+        newState["compared"] = {}
+        return newState
+
+    @classmethod
+    def addCompared(cls, state, dir, other, rows, counts, done):
+        """ A reducer which appends the paths found to differ by a comparison to the children
+
+        It is only applied to the pane which started the comparison (see TaskQueue).
+        If the pane no longer views the comparison - it moved away from dir, or showed other children -
+            the input state itself is returned.
+        The children are only appended to, so the rows already drawn, and the selection, stay where they are.
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            dir (str): Filepath of the directory compared
+            other (str): Filepath of the directory it is compared with
+            rows (list): (path, class) of the paths found since the last call
+            counts (dict): Number of paths of each class found so far
+            done (bool): Whether the comparison is complete
+
+        Returns:
+            dict: State dictionary representing the comparison so far
+        """
+        if state["directory"] != dir or state["compared"] is None:
+            return state
+        text = f"Compared with {other}{'' if done else ' ...'} - " + ", ".join(f"{counts[kind]} {kind}" for kind in Compare.CLASSES)
+        newState = BasicReducer.notify(state, text)
+        if len(rows) == 0:
+            return newState
+        newState["children"] = state["children"] + [path for path, kind in rows]
+        newState["compared"] = {**state["compared"], **dict(rows)}
+        if len(state["children"]) == 0:
+            newState = BasicReducer.moveSelection(newState, [0])
+            newState = BasicReducer.moveScrollUp(newState)
+        return newState
+
+    @classmethod
+    def quitCommand(cls, state, arg):
+        """ Builtin command which quits the application, saving the session snapshot
 
         Args:
             state (dict): State dictionary of application at previous moment
+            arg (str): Ignored
 
         Returns:
-            dict: State dictionary representing the effect of pressing down arrow key 
-        """ 
-        if state["mode"] == "browse" and len(state["selected"]) != 0:
-            index = state["children"].index(state["selected"][-1]) 
-            numc = len(state["children"])
-            newState = BasicReducer.setModeToBrowse(state, "Moved Selection Down")
-            if index != numc-1:
-                newIndex = index + 1
-                wIndex = newIndex - newState["scroll_data"]["scroll_top"]
-                numw = state["scroll_data"]["list_size"]
-                trig = state["scroll_data"]["scroll_trigger"]  
-                newState = BasicReducer.moveSelection(newState, [newIndex])
-                if wIndex > numw - trig:
-                    newState = BasicReducer.moveScrollDown(newState)
-            return newState
-        else:
-            return BasicReducer.sameState(state) 
+            dict: State dictionary which represents the application to be quit
+        """
+        return BasicReducer.quit(state)
 
-    @staticmethod
-    def shiftUpKey(state):
-        """ Reducer associated with Shift-Up keypress event callback
+    @classmethod
+    def jobsCommand(cls, state, arg):
+        """ Builtin command which describes the programs launched from command mode
+
+        Shows the number of running jobs and a description of the most recent one.
 
-        If the user is in browse mode and presses Shift-Up, this reducer will make the application ascend to the parent directory.
-        The parent's children files will be shown, and selection/scrolling will be set to top.
-        Otherwise, this reducer will do nothing.
-        
         Args:
-            state (dict): State dictionary of application at previous moment.
+            state (dict): State dictionary of application at previous moment
+            arg (str): Unused
 
         Returns:
-            dict: State dictionary representing the effect of pressing Shift-Up arrow key
+            dict: State dictionary representing the description being displayed
         """
-        if state["mode"] == "browse":
-            parent = FileSystem.parent(state["directory"])
-            LOGGER.debug(f"\t parent is {parent}")
-            newState = BasicReducer.moveDir(state, parent)
-            newState = BasicReducer.setModeToBrowse(newState, "Moved Up Directory")
-            if len(newState["children"]) > 0:
-                newState = BasicReducer.moveSelection(newState, [0])
-                newState = BasicReducer.moveScrollUp(newState) 
-            else:
-                newState = BasicReducer.setScrollDefault(newState)
-            return newState 
-   
+        jobs = list(Launcher.jobs)
+        if not jobs:
+            return BasicReducer.setModeToBrowse(state, "No jobs launched yet")
+        running = sum(1 for job in jobs if job["status"] is None)
+        return BasicReducer.setModeToBrowse(state, f"{running} of {len(jobs)} jobs running - last {Launcher.describe(jobs[-1])}")
+
     @staticmethod
-    def shiftDownKey(state):
-        """ Reducer associated with down arrow keypress event callback
+    def _matching(state, pattern):
+        """ Returns the IntervalSet of the indices of the children matching a glob pattern """
+        return IntervalSet.fromIndices(i for i, child in enumerate(state["children"]) if fnmatch.fnmatch(child, pattern))
+
+    @classmethod
+    def markCommand(cls, state, arg):
+        """ Builtin command which marks the children matching a glob pattern, in addition to those already marked
 
-        If the user is in browse mode, selection is on a child directory, 
-            and the user presses Shift-Down, this reducer will make the application descend down the child directory.
-        The directory's children files will be shown, and selection/scrolling will be set to top.
-        Otherwise, this reducer does nothing.
-        
         Args:
-            state (dict): State dictionary of application at previous moment.
+            state (dict): State dictionary of application at previous moment
+            arg (str): Glob pattern, e.g. "*.txt" (all children if empty)
 
         Returns:
-            dict: State dictionary representing the effect of pressing Shift-Down arrow key 
+            dict: State dictionary representing the children being marked
         """
-        if state["mode"] == "browse" and len(state["selected"]) > 0:
-            child_path = FileSystem.pathOfChild(state["directory"], state["selected"][-1])
-            openable = FileSystem.isChildOpenable(child_path)
-            if openable:
-                newState = BasicReducer.moveDir(state, child_path)
-                newState = BasicReducer.setModeToBrowse(newState, "Moved Down Directory")
-                if len(newState["children"]) > 0:
-                    newState = BasicReducer.moveSelection(newState, [0])
-                    newState = BasicReducer.moveScrollUp(newState) 
-                else:
-                    newState = BasicReducer.setScrollDefault(newState)
-                return newState
-            else:
-                return BasicReducer.sameState(state)          
-        else:
-            return BasicReducer.sameState(state) 
-    
-    @staticmethod
-    def returnKey(state):
-        """ Reducer associated with Return keypress event callback
+        marks = state["marks"].union(cls._matching(state, arg or "*"))
+        return BasicReducer.setMarks(BasicReducer.setModeToBrowse(state, ""), marks)
 
-        If the user is in command mode, types in a command, and presses Enter,
-            this reducer executes the command in a shell, and sets the application will to browse mode.
-        In other cases, the reducer will do nothing.
+    @classmethod
+    def unmarkCommand(cls, state, arg):
+        """ Builtin command which unmarks the children matching a glob pattern
 
         Args:
             state (dict): State dictionary of application at previous moment
+            arg (str): Glob pattern, e.g. "*.txt" (all children if empty)
 
         Returns:
-            dict: State dictionary representing the effects of pressing Shift-Down arrow key
+            dict: State dictionary representing the children being unmarked
         """
-        if state["mode"] == "command":
-            length = len(state["prompt_data"]["cmd_prompt"])
-            command = state["text"][length:]
-            if len(state["selected"]) != 0:
-                child = state["selected"][-1]
-                path = FileSystem.pathOfChild(state["directory"], child)
-                FileSystem.open(command + " " + path + " &")
-            newState = BasicReducer.setModeToBrowse(state, "SP File Explorer")
-            return newState
-        else:
-            return BasicReducer.sameState(state) 
-            
+        marks = state["marks"].difference(cls._matching(state, arg or "*"))
+        return BasicReducer.setMarks(BasicReducer.setModeToBrowse(state, ""), marks)
 
-    @staticmethod
-    def colonKey(state):
-        """ Reducer associated with Colon keypress event callback
+    @classmethod
+    def invertCommand(cls, state, arg):
+        """ Builtin command which marks exactly the children which were not marked
 
-        If the user is in browse mode and presses the colon key,
-            the application switches to command mode.
-        Otherwise, this reducer does nothing 
-        
         Args:
             state (dict): State dictionary of application at previous moment
-    
+            arg (str): Unused
+
         Returns:
-            dict: State dictionary representing the effect of pressing colon key
+            dict: State dictionary representing the marks being inverted
         """
-        if state["mode"] == "browse":
-            return BasicReducer.setModeToCommand(state, "")
-        else:
-            return BasicReducer.sameState(state)
+        marks = state["marks"].invert(len(state["children"]))
+        return BasicReducer.setMarks(BasicReducer.setModeToBrowse(state, ""), marks)
 
-    @staticmethod
-    def escapeSelectKeys(state):
-        """ Reducer associated with mouse select and Escape Keypress event callbacks
-        
-        This reducer will set the application to browse mode.
+    @classmethod
+    def jumpCommand(cls, state, arg):
+        """ Builtin command which moves to the most frecent visited directory matching the words of arg
+
+        The directory is listed through the FileSystem cache, so jumping to a recently listed directory costs a stat.
+        Matches which no longer exist are forgotten, while those which cannot be checked
+            (on a mount which does not respond, or not accessible) are skipped but kept.
+        Without arg, the most frecent directories are listed instead, to be entered with Shift-Down.
 
         Args:
             state (dict): State dictionary of application at previous moment
+            arg (str): Words which the path of the directory must contain
 
         Returns:
-            dict: State dictionary representing the effect of pressing escape or clicking the mouse.
+            dict: State dictionary representing the directory being viewed
         """
-        return BasicReducer.setModeToBrowse(state, "SP File Explorer")
+        if not arg:
+            paths = Frecency.search("", limit=100)
+            return cls._showResults(state, paths, f"{len(paths)} most frecent directories")
+        for dir in Frecency.search(arg):
+            if dir == state["directory"]:
+                continue
+            if not FileSystem.isChildOpenable(dir):
+                if FileSystem.isMissing(dir):
+                    Frecency.forget(dir)
+                continue
+            newState = BasicReducer.moveDir(state, dir)
+            if newState["directory"] != dir:
+                return newState
+            newState = BasicReducer.setModeToBrowse(newState, f"Jumped to {dir}")
+            if len(newState["children"]) > 0:
+                newState = BasicReducer.moveSelection(newState, [0])
+                return BasicReducer.moveScrollUp(newState)
+            return BasicReducer.setScrollDefault(newState)
+        return BasicReducer.setModeToBrowse(state, f"No visited directory matches '{arg}'")
+
+    @classmethod
+    def findCommand(cls, state, arg):
+        """ Builtin command which lists the indexed files beneath the current directory whose name contains arg
+
+        Args:
+            state (dict): State dictionary of application at previous moment
+            arg (str): Text to search for
+
+        Returns:
+            dict: State dictionary representing the search results being viewed
+        """
+        index = FileIndex.shared()
+        dir = state["directory"]
+        if index.rootOf(dir) is None:
+            return BasicReducer.setModeToBrowse(state, f"{dir} is not indexed - run {cls.PREFIX}index first")
+        results = index.search(arg, under=dir)
+        paths = [os.path.relpath(path, dir) for path, kind in results]
+        return cls._showResults(state, paths, f"Found {len(paths)} matches for '{arg}'")
+
 
 class Renderer:
     """ Class which is responsible for rendering the application from state dictionary  
@@ -756,9 +6451,11 @@ class Renderer:
 
         This helper function changes the text of the label widget 
             to state["directory"].
+        It is marked as stale while its children are a cached listing being revalidated (see state["stale"]),
+            and as slow if it is on a slow mount, whose children are shown by name only (see Mounts).
 
         Args:
-            app (sp_file_explorer.Application): application instance
+            app (sp_file_explorer.Pane): pane being rendered
             state (dict): State dictionary to be rendered
 
         Note:
@@ -767,58 +6464,121 @@ class Renderer:
         """
         dir = state["directory"]
         LOGGER.debug(f"Rendering application - Setting Label to current directory")
-        app.label.configure(text=dir)
+        text = dir
+        if state["stale"]:
+            text += "  (stale - revalidating)"
+        if Mounts.isSlow(FileSystem.deviceOf(dir)):
+            text += "  (slow mount - names only)"
+        app.label.configure(text=text)
         LOGGER.debug(f"Rendering application - current directory is {dir}")
     
+    @staticmethod
+    def _row_name(state, child, dirorfile):
+        """ Returns the filename of child with a trailing slash for directories - in tree mode, its basename indented by depth """
+        if state["tree"]:
+            depth = child.count(os.sep)
+            child = "  " * depth + os.path.basename(child)
+        return child if dirorfile == "file" else child + "/"
+
+    @staticmethod
+    def _row_cells(state, child, dirorfile):
+        """ Returns the cells of the row of child
+
+        The cells are the filename (see _row_name), followed by the metadata columns in state["columns"],
+            by the size measured by DiskUsage if any size is measured, and by the class of the child in a comparison.
+        Columns whose metadata (or size) has not been computed yet are left blank.
+        """
+        name = Renderer._row_name(state, child, dirorfile)
+        columns = state["columns"]
+        if not state["sizes"] and not columns and not state["compared"]:
+            return (name,)
+        meta = (Metadata.get(state["directory"], child) or {}) if columns else {}
+        cells = [name] + [str(meta.get(column, "")) for column in columns]
+        if state["sizes"]:
+            cells.append(DiskUsage.format(state["sizes"][child]) if child in state["sizes"] else "")
+        if state["compared"]:
+            cells.append(state["compared"].get(child, ""))
+        return tuple(cells)
+
+    @staticmethod
+    def _rows(state, start, end):
+        """ Returns the (cells, class) of the rows of state["children"] from start to end - the rows drawn by the ListCanvas
+
+        Only the drawn rows are looked at: their metadata is requested from Metadata (and their classes from FileType),
+            and until they are computed, the columns are left blank and the rows colored by the class of their extension
+            (see FileType.fast), which costs no I/O.
+        So scrolling through a large directory only ever stats what has been visible.
+
+        Args:
+            state (dict): State dictionary being rendered
+            start (int): Index of the first row
+            end (int): Index after the last row
+
+        Returns:
+            list: Tuples (cells, class) of the rows
+        """
+        dir = state["directory"]
+        children = state["children"][start:end]
+        if state["columns"]:
+            Metadata.request(dir, children)
+        FileType.request(dir, children)
+        rows = []
+        for child in children:
+            dirorfile = FileSystem.dirOrFile(FileSystem.pathOfChild(dir, child))
+            kind = FileType.get(dir, child) or FileType.fast(child, dirorfile)
+            rows.append((Renderer._row_cells(state, child, dirorfile), kind))
+        return rows
+
     @staticmethod
     def _render_listbox_items(app, state):
-        """ Sets listbox widget to show state["children"]
+        """ Sets the list widget to show state["children"]
 
-        This helper function deletes the contents of listbox
-            and inserts the members of state["children"].
-        There is special yellow highlighting if child file is not a directory. 
+        The rows are not handed to the widget, only their number and the function which computes them (see _rows),
+            so the cost of a render does not depend on the number of children,
+            whether they are listed anew, appended (see BasicReducer.extendChildren) or spliced (see BasicReducer._splice).
+        The widget draws the visible rows - between scroll_top and scroll_top+list_size - in its next frame,
+            and only redraws those whose cells, class or selection changed (see ListCanvas).
 
         Args:
-            app (sp_file_explorer.Application): application instance
+            app (sp_file_explorer.Pane): pane being rendered
             state (dict): State dictionary to be rendered
 
         Note:
             This method assumes state dictionary has at least the "children" key.
             This method will break if that is not the case 
         """
-        dir = state["directory"]
-        num_children = len(state["children"])
-        LOGGER.debug(f"Rendering application - Setting Listbox to contain children")
-        app.listbox.delete(0, END)
-        LOGGER.debug(f"Rendering application - children list is {state['children']} of length {num_children}")
-        for child in state["children"]:
-            path = FileSystem.pathOfChild(dir, child)
-            dirorfile = FileSystem.dirOrFile(path) 
-            if dirorfile == "file":
-                LOGGER.debug(f"{child} is a file")
-                app.listbox.insert(END, child)
-                app.listbox.itemconfig(END, background="yellow", selectbackground="orange")
-            else:
-                LOGGER.debug(f"{child}/ is a directory")
-                app.listbox.insert(END, child + "/") 
+        columns = [Metadata.COLUMNS[column] for column in state["columns"]]
+        if state["sizes"]:
+            columns.append(8)
+        if state["compared"]:
+            columns.append(10)
+        LOGGER.debug(f"Rendering application - Setting list to contain {len(state['children'])} children")
+        app.listbox.setColumns(columns)
+        app.listbox.setRows(len(state["children"]), lambda start, end: Renderer._rows(state, start, end))
 
     @staticmethod
     def _select_selected_children(app, state):
-        """ Sets selection on elements of state["selected"] 
+        """ Sets selection on elements of state["selected"], or on the marked children
 
-        This helper function clears the selection and set the list selection highlight
-            on the selected children according to state["selected"]
+        This helper function sets the selection highlight of the list widget
+            on the selected children according to state["selected"].
+        If some children are marked, the selection highlight is set on them instead, by the ranges of state["marks"].
+        The last selected child is shown as the active (outlined) row.
 
         Args:
-            app (sp_file_explorer.Application): application instance
+            app (sp_file_explorer.Pane): pane being rendered
             state (dict): State dictionary to be rendered
         """
         LOGGER.debug(f"Rendering application - selecting children")
-        LOGGER.debug(f"Rendering application - selected children list is {state['selected']}")
-        app.listbox.selection_clear(0, END)
-        for child in state["selected"]:
-            index = state["children"].index(child)
-            app.listbox.selection_set(index)
+        LOGGER.debug(f"Rendering application - selected children list is {state['selected']}, {len(state['marks'])} marked")
+        active = BasicReducer.selectedIndex(state) if len(state["selected"]) != 0 else None
+        if state["marks"]:
+            app.listbox.select(state["marks"], active)
+            return
+        indices = [state["children"].index(child) for child in state["selected"][:-1]]
+        if active is not None:
+            indices.append(active)
+        app.listbox.select(IntervalSet.fromIndices(indices), active)
          
     @staticmethod
     def _set_scroll_position(app, state):
@@ -826,17 +6586,14 @@ class Renderer:
 
         This helper function sets the scroll position so that
             the child file of index state["scroll_data"]["scroll_top"]
-            occupies the top row of visible listbox
+            occupies the top row of the list widget
 
         Args:
-            app (sp_file_explorer.Application): application instance
+            app (sp_file_explorer.Pane): pane being rendered
             state (dict): State dictionary to be rendered
         """
-        num_children = len(state["children"])
-        LOGGER.debug(f"Rendering application - setting scroll")
-        fraction = state["scroll_data"]["scroll_top"] / (num_children + 1)
-        app.listbox.yview_moveto(fraction)
-        LOGGER.debug(f"Rendering application - scroll fraction is {fraction}")
+        LOGGER.debug(f"Rendering application - setting scroll to {state['scroll_data']['scroll_top']}")
+        app.listbox.scrollTo(state["scroll_data"]["scroll_top"])
             
     @staticmethod
     def _render_text(app, state):
@@ -847,7 +6604,7 @@ class Renderer:
             so that the user cannot edit the text.
 
         Args:
-            app (sp_file_explorer.Application): application instance
+            app (sp_file_explorer.Pane): pane being rendered
             state (dict): State dictionary to be rendered
         """
         LOGGER.debug(f"Rendering application - Setting text")
@@ -862,41 +6619,74 @@ class Renderer:
         else:
             app.text.focus_set()    
 
+    @staticmethod
+    def _render_preview(app, state):
+        """ Shows the preview of the last selected child in the preview pane
+
+        The preview pane is hidden if state["preview"] is not set.
+        If the last selected child is a file whose preview is not cached yet,
+            the pane is cleared and reading the preview is requested from Preview,
+            which has the application rendered again once it is read.
+        A cached preview is shown right away, and revalidated by Preview in case the file changed.
+        The text widget is only touched when the text to show changes.
+
+        Args:
+            app (sp_file_explorer.Pane): pane being rendered
+            state (dict): State dictionary to be rendered
+        """
+        if not state["preview"]:
+            app.preview.grid_remove()
+            return
+        app.preview.grid()
+        text = ""
+        if len(state["selected"]) != 0:
+            path = FileSystem.pathOfChild(state["directory"], state["selected"][-1])
+            if FileSystem.dirOrFile(path) == "file":
+                text = Preview.get(path) or ""
+                Preview.request(path)
+        if getattr(app, "previewed", None) != text:
+            LOGGER.debug(f"Rendering application - Setting preview")
+            app.preview.configure(state=NORMAL)
+            app.preview.delete("1.0", END)
+            app.preview.insert(END, text)
+            app.preview.configure(state=DISABLED)
+            app.previewed = text
+
     @staticmethod
     def _save_state_in_app(app, state):
         """ Saves the state dictionary as a property of application
 
         Args:
-            app (sp_file_explorer.Application): application instance
+            app (sp_file_explorer.Pane): pane being rendered
             state (dict): State dictionary to be rendered
         """
         LOGGER.debug(f"Rendering application - Saving state dictionary")
         app.state = state
-        LOGGER.debug(f"Rendering application - State: {app.state}")
 
     @staticmethod
     def _set_sizes_of_listbox(app, state):
-        """ Sets the size of listbox according to state["scroll_data"]["list_width"]  and state["scroll_data"]["list_size"]
+        """ Sets the size of the list widget according to state["scroll_data"]["list_width"]  and state["scroll_data"]["list_size"]
 
         Args:
-            app (sp_file_explorer.Application): application instance
+            app (sp_file_explorer.Pane): pane being rendered
             state (dict): State dictionary to be rendered
         """
-        LOGGER.debug(f"Rendering application - Sizing listbox widget")
-        app.listbox.configure(width=state["scroll_data"]["list_width"], height=state["scroll_data"]["list_size"])
+        LOGGER.debug(f"Rendering application - Sizing list widget")
+        app.listbox.resize(state["scroll_data"]["list_width"], state["scroll_data"]["list_size"])
         LOGGER.debug(f"Rendering application - Listbox width is {state['scroll_data']['list_width']} characters") 
         LOGGER.debug(f"Rendering application - Listbox height is {state['scroll_data']['list_size']} lines")
 
     @staticmethod
     def _check_quit_mode(app, state):
-        """ Quits the application if state["mode"] is "quit"
+        """ Quits the application if state["mode"] is "quit", saving a Session snapshot first
         
         Args:
-            app (sp_file_explorer.Application): application instance
+            app (sp_file_explorer.Pane): pane being rendered
             state (dict): State dictionary to be rendered
         """
         if state["mode"] == "quit":
             LOGGER.info(f"Quitting Application")
+            Session.save(state)
             app.root.destroy()
             sys.exit(0)
 
@@ -904,117 +6694,620 @@ class Renderer:
     def render(cls, app, state):
         """ Calls all the helper functions in this class one by one to render the application.
 
+        A pane which is not visible is not rendered at all - only its state is saved,
+            and it is rendered from that state once it is shown again (see Pane.show).
+
         Args:
-            app (sp_file_explorer.Application): application instance
+            app (sp_file_explorer.Pane): pane being rendered
             state (dict): State dictionary to be rendered
         """
         LOGGER.debug(f"Rendering application")
         cls._check_quit_mode(app, state)
         cls._save_state_in_app(app, state)
+        if not getattr(app, "visible", True):
+            return
         cls._set_sizes_of_listbox(app, state)
         cls._render_label(app, state)
         cls._render_listbox_items(app, state)
         cls._select_selected_children(app, state)
         cls._set_scroll_position(app, state)
+        cls._render_preview(app, state)
         cls._render_text(app, state)
         
     
+class ListCanvas:
+    """ Class of the list widget of a pane - a tkinter Canvas which draws only the visible rows
+
+    The rows are not stored in the widget: setRows() gives it the number of rows, and a function
+        which returns the (cells, class) of the rows from start to end (see Renderer._rows),
+        so showing a directory of any size costs the same, and so does splicing rows in tree mode.
+    The cells of a row are its name, followed by the cells of the columns (see setColumns), right-aligned.
+    Its colors are those of its FileType class, or DEFAULT_COLORS for the classes mapped to None.
+
+    The canvas holds one background rectangle and one text item per cell for each visible row, created once
+        per size and then only configured, and only where what is drawn in them changes -
+        so scrolling by a row configures the items in place instead of creating new ones,
+        and moving the selection by a row only configures the two rows concerned.
+
+    Every change only schedules a redraw, and changes made within the same frame (FRAME_MS)
+        are drawn by a single redraw, so many rows updated by background loaders (Metadata, FileType, DiskUsage)
+        cost one redraw per frame, not one per update.
+    The scrollbar (if any) is set by the redraw, and scrolls the widget through yview(), as the mouse wheel does.
+    """
+
+    FRAME_MS = 16
+    """int: Minimum number of milliseconds between two redraws"""
+
+    DEFAULT_COLORS = ("white", "gray76")
+    """tuple: (background, selectbackground) of the rows whose FileType class has no colors"""
+
+    def __init__(self, canvas, char_width=8, line_height=16, font="TkFixedFont"):
+        """ Wraps canvas in a list widget
+
+        Args:
+            canvas (tkinter.Canvas): Canvas to draw the rows on
+            char_width (int): Width in pixels of a character of font (which must be fixed width)
+            line_height (int): Height in pixels of a row
+            font (str): Font of the rows
+        """
+        self.canvas = canvas
+        self.char_width = char_width
+        self.line_height = line_height
+        self.font = font
+        self.width = 0
+        self.height = 0
+        self.columns = []
+        self.count = 0
+        self.source = lambda start, end: []
+        self.top = 0
+        self.marked = IntervalSet()
+        self.active = None
+        self.scrollbar = None
+        self.slots = []
+        self.drawn = []
+        self.scrolled = None
+        self.redraws = 0
+        self._scheduled = False
+        self._last = 0.0
+
+    def grid(self, **options):
+        """ Lays out the canvas (see tkinter grid) """
+        self.canvas.grid(**options)
+
+    def grid_remove(self):
+        """ Removes the canvas from the layout (see tkinter grid_remove) """
+        self.canvas.grid_remove()
+
+    def resize(self, width, height):
+        """ Sets the size of the widget, creating the items of the rows again if it changed
+
+        Args:
+            width (int): Width in characters
+            height (int): Number of visible rows
+        """
+        if (width, height) == (self.width, self.height):
+            return
+        self.width, self.height = width, height
+        self.canvas.configure(width=width * self.char_width, height=height * self.line_height)
+        self._createSlots()
+
+    def setColumns(self, columns):
+        """ Sets the widths in characters of the columns after the names, creating the items of the rows again if they changed
+
+        Args:
+            columns (list): Widths of the columns, from left to right
+        """
+        if list(columns) != self.columns:
+            self.columns = list(columns)
+            self._createSlots()
+
+    def setRows(self, count, source):
+        """ Sets the rows of the widget
+
+        Args:
+            count (int): Number of rows
+            source (function): Returns the list of (cells, class) of the rows from start to end, given start and end
+        """
+        self.count = count
+        self.source = source
+        self._schedule()
+
+    def select(self, marked, active):
+        """ Sets the selected rows, and the active one (drawn with an outline)
+
+        Args:
+            marked (sp_file_explorer.IntervalSet): Indices of the selected rows
+            active (int): Index of the active row, or None
+        """
+        self.marked = marked
+        self.active = active
+        self._schedule()
+
+    def scrollTo(self, top):
+        """ Scrolls the widget so that the row of index top is the top visible row """
+        self.top = top
+        self._schedule()
+
+    def yview(self, *args):
+        """ Scrolls the widget from the arguments of a scrollbar command - ("moveto", fraction) or ("scroll", number, what) """
+        if args[0] == "moveto":
+            top = round(float(args[1]) * self.count)
+        else:
+            top = self.top + int(args[1]) * (self.height if args[2] == "pages" else 1)
+        self.scrollTo(max(min(top, self.count - self.height), 0))
+
+    def _createSlots(self):
+        """ Deletes the items of the rows, and creates them again for the current size and columns """
+        canvas = self.canvas
+        for items in self.slots:
+            canvas.delete(*items)
+        self.slots = []
+        right = self.width * self.char_width
+        edges = []
+        for width in reversed(self.columns):
+            edges.append(right - 2)
+            right -= (width + 1) * self.char_width
+        edges.reverse()
+        for slot in range(self.height):
+            top = slot * self.line_height
+            items = [canvas.create_rectangle(0, top, self.width * self.char_width, top + self.line_height - 1, width=1)]
+            items.append(canvas.create_text(2, top, anchor="nw", font=self.font))
+            items.extend(canvas.create_text(edge, top, anchor="ne", font=self.font) for edge in edges)
+            self.slots.append(items)
+        self.drawn = [None] * self.height
+        self._schedule()
+
+    def _schedule(self):
+        """ Schedules a redraw, unless one is already scheduled - in the next frame at the earliest """
+        if self._scheduled:
+            return
+        self._scheduled = True
+        wait = int(self.FRAME_MS - (time.perf_counter() - self._last) * 1000)
+        if wait > 0:
+            self.canvas.after(wait, self.redraw)
+        else:
+            self.canvas.after_idle(self.redraw)
+
+    def redraw(self):
+        """ Draws the visible rows, configuring only the items of the rows (and cells) whose contents changed """
+        self._scheduled = False
+        self._last = time.perf_counter()
+        self.redraws += 1
+        self.top = max(min(self.top, self.count - self.height), 0)
+        rows = self.source(self.top, min(self.top + self.height, self.count)) if self.count else []
+        names = max(self.width - sum(width + 1 for width in self.columns), 1)
+        for slot, items in enumerate(self.slots):
+            index = self.top + slot
+            if slot < len(rows):
+                cells, kind = rows[slot]
+                cells = (cells[0][:names],) + tuple(cells[1:])
+                drawn = (cells, kind, index in self.marked, index == self.active)
+            else:
+                drawn = ((), None, False, False)
+            if drawn != self.drawn[slot]:
+                self._drawSlot(items, drawn, self.drawn[slot])
+                self.drawn[slot] = drawn
+        scrolled = (self.top / self.count, (self.top + len(rows)) / self.count) if self.count else (0.0, 1.0)
+        if self.scrollbar is not None and scrolled != self.scrolled:
+            self.scrollbar.set(*scrolled)
+        self.scrolled = scrolled
+
+    def _drawSlot(self, items, drawn, previous):
+        """ Configures the items of a visible row to draw drawn - (cells, class, selected, active) - over previous """
+        cells, kind, selected, active = drawn
+        if previous is None or previous[1:] != drawn[1:]:
+            background, selectbackground = FileType.COLORS.get(kind) or self.DEFAULT_COLORS
+            fill = selectbackground if selected else background
+            self.canvas.itemconfigure(items[0], fill=fill, outline="black" if active else fill)
+        old = previous[0] if previous is not None else None
+        for index, item in enumerate(items[1:]):
+            text = cells[index] if index < len(cells) else ""
+            if old is None or (old[index] if index < len(old) else "") != text:
+                self.canvas.itemconfigure(item, text=text)
+
+
+class Pane:
+    """ Class of the panes of the application - independent views, each with its own widgets and state
+
+    A pane is what the Renderer renders: it holds the label, list (see ListCanvas), scrollbar, preview and text widgets of a view,
+        its state dictionary, and what the Renderer remembers of its last render.
+    Pane number n occupies the grid columns 3n to 3n+2 of the root window, so panes are split left/right.
+
+    The panes share everything else: the FileSystem listing cache, the Metadata and Preview caches,
+        DiskUsage and the worker pool of TASKS are all module or class level,
+        so a directory shown by one pane is shown by another without listing or stat-ing it again.
+    A hidden pane is not rendered (see Renderer.render), though background reducers keep its state up to date.
+    """
+
+    def __init__(pane, root, column, state):
+        """ Creates the widgets of a pane and lays them out
+
+        Args:
+            root (tkinter.Tk): Root "widget" of the application
+            column (int): Number of the pane, from left to right
+            state (dict): Initial state dictionary of the pane
+        """
+        from tkinter import Canvas, Label, Scrollbar, Text
+        from tkinter.font import Font
+        LOGGER.debug(f"Initializing User Interface - Creating pane {column}")
+        pane.root = root
+        pane.state = state
+        pane.visible = True
+        first = 3 * column
+
+        LOGGER.debug("Initializing User Interface - Creating scrollable list which expands horizontally and vertically with root window")
+        font = Font(root, font="TkFixedFont")
+        canvas = Canvas(root, background="white", highlightthickness=0, takefocus=0)
+        pane.listbox = ListCanvas(canvas, font.measure("0"), font.metrics("linespace"), "TkFixedFont")
+        pane.listbox.grid(row=1, column=first, sticky=N+S+E+W) 
+        
+        pane.scrollbar = Scrollbar(root, orient=VERTICAL, takefocus=0, command=pane.listbox.yview)
+        pane.scrollbar.grid(row=1, column=first+1, sticky=N+S) 
+        pane.listbox.scrollbar = pane.scrollbar
+
+        canvas.bind("<MouseWheel>", lambda event: pane.listbox.yview("scroll", -1 if event.delta > 0 else 1, "units"))
+        canvas.bind("<Button-4>", lambda event: pane.listbox.yview("scroll", -1, "units"))
+        canvas.bind("<Button-5>", lambda event: pane.listbox.yview("scroll", 1, "units"))
+        
+        LOGGER.debug("Initializing User Interface - Creating top label which expands horizontally with root window")
+        pane.label = Label(root, height=1, background="white", takefocus=0)
+        pane.label.grid(row=0, column=first, columnspan=3, sticky=W+E)
+         
+        LOGGER.debug("Initializing User Interface - Creating top text which expands horizontally with root window")
+        pane.text = Text(root, height=1, background="white", wrap=NONE, takefocus=0)
+        pane.text.grid(row=2, column=first, columnspan=3, sticky=W+E)
+
+        LOGGER.debug("Initializing User Interface - Creating preview pane to the right of the listbox")
+        pane.preview = Text(root, width=80, height=1, background="white", wrap=NONE, takefocus=0, font="TkFixedFont", state=DISABLED)
+        pane.preview.grid(row=1, column=first+2, sticky=N+S+E+W)
+
+    def widgets(pane):
+        """ Returns the widgets of the pane
+
+        Returns:
+            list: The widgets of the pane
+        """
+        return [pane.label, pane.listbox, pane.scrollbar, pane.preview, pane.text]
+
+    def hide(pane):
+        """ Removes the pane from the window. It is not rendered until it is shown again. """
+        pane.visible = False
+        for widget in pane.widgets():
+            widget.grid_remove()
+
+    def show(pane):
+        """ Puts the pane back into the window, and renders its current state """
+        pane.visible = True
+        for widget in pane.widgets():
+            widget.grid()
+        Renderer.render(pane, pane.state)
+
+    def setFocus(pane, focused):
+        """ Shows whether the pane has the keyboard focus, by the color of its label
+
+        Args:
+            focused (bool): Whether the pane has the focus
+        """
+        pane.label.configure(background="light blue" if focused else "white")
+
+
 class Application:
-    """ Class which holds the application widgets and sets callback functions.
+    """ Class which holds the application panes and sets callback functions.
 
     Application is a class which can be instantiated. 
     This is in contrast to all the other classes in this module 
         which serve as containers for their methods.  
-    An application instance holds the tkinter widgets and sets callback functions
+    An application instance holds the panes (see Pane) and sets callback functions
         on keypress and other events.
+    Key presses are handled by the pane which has the focus (app.pane).
     """
 
-    def initUI(app, root):
+    def initUI(app, root, state):
         """ Initializes the application widgets and sets basic layout
 
         Takes in a Tk object, which acts as the root of the application,
-            and instantiates tkinter widgets as children of the root.
-        Uses the tkinter grid geometry manager to arrange the widgets in a basic layout. 
+            and creates the first pane, with the widgets of the application, as children of the root.
         Also sets the title of the window.
 
         Args:
             root (tkinter.Tk): Root "widget" of the application. All other widgets are children of root.
+            state (dict): Initial state dictionary of the first pane
         """
         LOGGER.info("Initializing User Interface")
         app.root = root 
         app.root.wm_title("Simple Python File Explorer")
         app.root.resizable(False, False)
-        #app.root.rowconfigure(1, weight=1)
-        #app.root.columnconfigure(0, weight=1)
+        app.panes = [Pane(app.root, 0, state)]
+        app.focus = 0
 
-        LOGGER.debug("Initializing User Interface - Creating scrollable listbox which expands horizontally and vertically with root window")
-        app.listbox = Listbox(app.root, background="white", activestyle="dotbox", takefocus=0)
-        app.listbox.grid(row=1, column=0, sticky=N+S+E+W) 
-        
-        app.scrollbar = Scrollbar(app.root, orient=VERTICAL, takefocus=0)
-        app.scrollbar.grid(row=1, column=1, sticky=N+S) 
-        
-        app.listbox.configure(yscrollcommand=app.scrollbar.set)
-        #app.scrollbar["command"] = app.listbox.yview
-        
-        LOGGER.debug("Initializing User Interface - Creating top label which expands horizontally with root window")
-        app.label = Label(app.root, height=1, background="white", takefocus=0)
-        app.label.grid(row=0, columnspan=2, sticky=W+E)
-         
-        LOGGER.debug("Initializing User Interface - Creating top text which expands horizontally with root window")
-        app.text = Text(app.root, height=1, background="white", wrap=NONE, takefocus=0)
-        app.text.grid(row=2, columnspan=2, sticky=W+E)
+    @property
+    def pane(app):
+        """sp_file_explorer.Pane: The pane which has the focus"""
+        return app.panes[app.focus]
+
+    @property
+    def state(app):
+        """dict: State dictionary of the pane which has the focus"""
+        return app.pane.state
+
+    def dispatch(app, reducer, *args):
+        """ Applies reducer to the state of the focused pane, and renders the pane
+
+        Args:
+            reducer (callable): Reducer taking the state followed by args
+            args: Remaining arguments of the reducer
+        """
+        pane = app.pane
+        with TASKS.onBehalfOf(app.focus):
+            Renderer.render(pane, reducer(pane.state, *args))
 
+    def switchFocus(app):
+        """ Moves the focus to the next visible pane, in browse mode
+
+        The working directory follows the focus, so commands run in the directory of the focused pane.
+        """
+        visible = [index for index, pane in enumerate(app.panes) if pane.visible]
+        if app.state["mode"] != "browse" or len(visible) < 2:
+            return
+        app._focusPane(visible[(visible.index(app.focus) + 1) % len(visible)])
+
+    def _focusPane(app, index):
+        app.pane.setFocus(False)
+        app.focus = index
+        app.pane.setFocus(len([pane for pane in app.panes if pane.visible]) > 1)
+        try:
+            FileSystem.changeCWD(app.state["directory"])
+        except OSError as error:
+            LOGGER.warning(f"Cannot change to {app.state['directory']} - {error}")
+
+    def toggleSplit(app):
+        """ Splits the window into two panes, or hides the second pane if it is already split
+
+        The second pane starts as a copy of the focused pane, sharing its children (see BasicReducer.sameState),
+            so splitting costs no listing at all.
+        Hiding it keeps its state, and showing it again renders that state.
+        """
+        if len(app.panes) == 1:
+            state = BasicReducer.sameState(app.state)
+            state["history"] = History()
+            app.panes.append(Pane(app.root, 1, state))
+            Renderer.render(app.panes[1], state)
+            app._focusPane(app.focus)
+        elif app.panes[1].visible:
+            app.panes[1].hide()
+            app._focusPane(0)
+        else:
+            app.panes[1].show()
+            app._focusPane(app.focus)
 
     def bindCallbacks(app):
         """ Bind event callback functions to keypress events.
 
         Binds event callback functions to trigger whenever the user presses a key or clicks something.
         Each callback function is a lambda function which does two things.
-            It first call a method from KeyBindReducer to change the state appropriately.
-            It then passes the new state to Renderer.render(). 
+            It first call a method from KeyBindReducer to change the state of the focused pane appropriately.
+            It then passes the new state to Renderer.render() (see dispatch). 
         """
         LOGGER.info(f"Binding Callbacks")
-        #app.root.bind("-", lambda event: app.render(Reducers.moveUpDir(app.state)))
-        #app.root.bind("<Return>", lambda event: app.render(Reducers.moveDownDir(app.state)))
-        LOGGER.debug(f"Binding virtual event of listbox selection with mouse to changeModeToBrowse reducer - so the mouse does not affect selection")
-        app.root.bind("<<ListboxSelect>>", lambda event: Renderer.render(app, KeyBindReducer.escapeSelectKeys(app.state)))
-        app.root.bind("<Escape>", lambda event: Renderer.render(app, KeyBindReducer.escapeSelectKeys(app.state)))
-        app.root.bind("<BackSpace>", lambda event: Renderer.render(app, KeyBindReducer.backSpaceKey(app.state)))
-        app.root.bind("<Key>", lambda event: Renderer.render(app, KeyBindReducer.key(app.state, event)))
-        app.root.bind("<Return>", lambda event: Renderer.render(app, KeyBindReducer.returnKey(app.state)))
+        app.root.bind("<Escape>", lambda event: app.dispatch(KeyBindReducer.escapeSelectKeys))
+        app.root.bind("<BackSpace>", lambda event: app.dispatch(KeyBindReducer.backSpaceKey))
+        app.root.bind("<Key>", lambda event: app.dispatch(KeyBindReducer.key, event))
+        app.root.bind("<Return>", lambda event: app.dispatch(KeyBindReducer.returnKey))
+        app.root.bind("<Control-r>", lambda event: app.dispatch(KeyBindReducer.controlRKey))
          
-        app.root.bind("<Up>", lambda event: Renderer.render(app, KeyBindReducer.upKey(app.state)))
-        app.root.bind("<Down>", lambda event: Renderer.render(app, KeyBindReducer.downKey(app.state)))
+        app.root.bind("<Up>", lambda event: app.dispatch(KeyBindReducer.upKey))
+        app.root.bind("<Down>", lambda event: app.dispatch(KeyBindReducer.downKey))
         
-        app.root.bind("<Shift-Up>", lambda event: Renderer.render(app, KeyBindReducer.shiftUpKey(app.state)))
-        app.root.bind("<Shift-Down>", lambda event: Renderer.render(app, KeyBindReducer.shiftDownKey(app.state)))
+        app.root.bind("<Shift-Up>", lambda event: app.dispatch(KeyBindReducer.shiftUpKey))
+        app.root.bind("<Shift-Down>", lambda event: app.dispatch(KeyBindReducer.shiftDownKey))
+
+        app.root.bind("<space>", lambda event: app.dispatch(KeyBindReducer.spaceKey, event))
+        app.root.bind("<Control-Up>", lambda event: app.dispatch(KeyBindReducer.controlUpKey))
+        app.root.bind("<Control-Down>", lambda event: app.dispatch(KeyBindReducer.controlDownKey))
+        app.root.bind("<Alt-Left>", lambda event: app.dispatch(KeyBindReducer.altLeftKey))
+        app.root.bind("<Alt-Right>", lambda event: app.dispatch(KeyBindReducer.altRightKey))
+        app.root.bind("<Right>", lambda event: app.dispatch(KeyBindReducer.rightKey))
+        app.root.bind("<Left>", lambda event: app.dispatch(KeyBindReducer.leftKey))
         
         LOGGER.debug(f"Binding ':' key to changeModeToCommand reducer")
-        app.root.bind(":", lambda event: Renderer.render(app, KeyBindReducer.colonKey(app.state)))
-        
-        #app.root.bind("<Down>", lambda event: app.render(Reducers.moveDownSelection(app.state)))
-        #app.listbox.bind("<Up>", lambda event: app.render(Reducers.moveTopSelection(app.state)))
-        #app.root.bind("<Up>", lambda event: app.render(Reducers.moveUpSelection(app.state)))
-        #app.root.bind("g", lambda event: app.render(Reducers.moveTopSelection(app.state)))
-        #app.root.bind("<Shift-KeyPress-G>", lambda event: app.render(Reducers.moveBottomSelection(app.state)))
-        #app.root.bind("q", lambda event: app.render(Reducers.quit(app.state)))
-
-    def __init__(app, root):
+        app.root.bind(":", lambda event: app.dispatch(KeyBindReducer.colonKey))
+
+        LOGGER.debug(f"Binding F2 to splitting the window, and Tab to switching the focused pane - or to completion in the command text")
+        app.root.bind("<F2>", lambda event: app.toggleSplit())
+        app.root.bind("<Tab>", lambda event: app.switchFocus())
+        app.root.bind_class("Text", "<Tab>", lambda event: app.dispatch(KeyBindReducer.tabKey) or "break")
+
+        LOGGER.debug(f"Binding closing the window to quit reducer - so the session snapshot is saved")
+        app.root.protocol("WM_DELETE_WINDOW", lambda: app.dispatch(BasicReducer.quit))
+
+    def pollTasks(app):
+        """ Applies the reducers queued by background tasks to every pane, renders those which changed, then reschedules itself.
+
+        See the TaskQueue class for how background tasks report back to the application.
+        """
+        states = TASKS.drainAll([pane.state for pane in app.panes])
+        for pane, state in zip(app.panes, states):
+            if state is not pane.state:
+                Renderer.render(pane, state)
+        app.root.after(TaskQueue.POLL_MS, app.pollTasks)
+
+    FIRST_ROWS = 64
+    """int: Number of children listed before the window is first rendered"""
+
+    def __init__(app, root, restore=True, dir=None):
         """ Gets and renders the initial state of the application, initializes widgets and binds callback functions
 
+        If restore is set and a Session snapshot was saved on the last quit, the last view is restored from it
+            without listing anything, and the directory is listed again on TASKS to revalidate it
+            (see BasicReducer.refreshChildren).
+        Otherwise, only the first FIRST_ROWS children of the current directory are listed before the first render,
+            so the window shows a screenful right away, even for huge directories or slow mounts.
+        The rest of the listing continues on TASKS, and is appended by BasicReducer.extendChildren.
+        app.listing is the future of the background listing.
+
         Args:
             root (tkinter.Tk): Root "widget" of the application. All other widgets are children of root.
+            restore (bool): Whether to restore the Session snapshot
+            dir (str): Directory to start in when not restoring, or None for the current directory
         """
-        app.state = BasicReducer.getInitState()
-        app.initUI(root)
-        Renderer.render(app, app.state)
+        snapshot = Session.load() if restore else None
+        state = Session.restore(snapshot) if snapshot is not None else None
+        if state is not None:
+            dir = state["directory"]
+            listing = lambda: FileSystem.listDir(dir)
+            reducer = lambda state, children: BasicReducer.refreshChildren(state, dir, children)
+        else:
+            dir = dir or FileSystem.currentDir()
+            chunks = FileSystem.listDirChunks(dir, Application.FIRST_ROWS)
+            first = next(chunks)
+            state = BasicReducer.getInitState(first, dir)
+            listing = lambda: [name for chunk in chunks for name in chunk]
+            reducer = lambda state, rest: BasicReducer.extendChildren(state, dir, len(first), rest)
+        app.initUI(root, state)
+        Renderer.render(app.pane, state)
         app.bindCallbacks()
+        app.pollTasks()
+        app.listing = TASKS.submit(listing, reducer=reducer)
+
+    @staticmethod
+    def benchmarkStartup(restore=True, dir=None):
+        """ Starts the application, measures how long it takes to start, and quits
+
+        Measures the time to import the module, to paint the first screenful (first paint),
+            and to list and render the whole current directory (interactive),
+            all counted from when the module started importing.
+
+        Args:
+            restore (bool): Whether to restore the Session snapshot (see Application.__init__)
+            dir (str): Directory to start in when not restoring, or None for the current directory
+
+        Returns:
+            dict: Milliseconds taken until "import", "first_paint" and "interactive"
+        """
+        from tkinter import Tk
+        times = {"import": time.perf_counter() - STARTED}
+        root = Tk()
+        app = Application(root, restore, dir)
+        root.update()
+        times["first_paint"] = time.perf_counter() - STARTED
+        while not app.listing.done() or not TASKS._pending.empty():
+            root.update()
+            time.sleep(0.001)
+        Renderer.render(app.pane, TASKS.drain(app.state))
+        root.update()
+        times["interactive"] = time.perf_counter() - STARTED
+        root.destroy()
+        return {key: round(seconds * 1000, 1) for key, seconds in times.items()}
+
+
+SYNTHETIC_ROOT = os.sep + "synthetic"
+"""str: Path at which the in-memory directory of --synthetic is mounted"""
+
+
+def mountSynthetic(count, latency):
+    """ Mounts a MemoryBackend holding a directory of synthetic files at SYNTHETIC_ROOT
+
+    It lets startup and browsing be measured on directories of any size, and on slow mounts, reproducibly.
+
+    Args:
+        count (int): Number of files in the directory
+        latency (float): Milliseconds every operation takes
+
+    Returns:
+        sp_file_explorer.MemoryBackend: The mounted backend
+    """
+    backend = MemoryBackend(SYNTHETIC_ROOT, latency / 1000)
+    backend.synthesize(SYNTHETIC_ROOT, count, size=1024)
+    FileSystem.mount(backend)
+    return backend
+
+
+def parseArgs(argv):
+    """ Parses the command line arguments of the application
+
+    Args:
+        argv (list): Command line arguments, without the program name
+
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog="sp_file_explorer.py", description="Simple Python File Explorer")
+    parser.add_argument("--index-db", metavar="PATH", help="location of the file index database")
+    index = parser.add_mutually_exclusive_group()
+    index.add_argument("--index-build", metavar="ROOT", nargs="+", help="add directories to the file index, without starting the GUI")
+    index.add_argument("--index-refresh", action="store_true", help="refresh the file index, without starting the GUI")
+    index.add_argument("--index-search", metavar="TEXT", help="print indexed paths whose name contains TEXT, without starting the GUI")
+    index.add_argument("--index-prefix", metavar="PREFIX", help="print indexed paths whose name starts with PREFIX, without starting the GUI")
+    parser.add_argument("--under", metavar="DIR", help="restrict index searches to paths beneath DIR")
+    parser.add_argument("--limit", type=int, default=1000, help="maximum number of search results (default 1000)")
+    parser.add_argument("--benchmark-startup", action="store_true", help="start the GUI, print how long starting took, and quit")
+    parser.add_argument("--no-restore", action="store_true", help="start in the current directory instead of restoring the last session")
+    parser.add_argument("--synthetic", metavar="COUNT", type=int, help=f"start in an in-memory directory of COUNT files at {SYNTHETIC_ROOT}")
+    parser.add_argument("--latency", metavar="MS", type=float, default=0.0, help="milliseconds every operation on the in-memory directory takes")
+    parser.add_argument("--headless", choices=Headless.COMMANDS, 
+                        help="list PATH, search beneath PATH for --match, or measure the disk usage of PATH, "
+                             "printing JSON lines, without starting the GUI (or importing tkinter)")
+    parser.add_argument("--match", metavar="TEXT", help="substring of the filenames --headless search looks for")
+    parser.add_argument("path", metavar="PATH", nargs="?", help="directory of --headless (default: the current directory)")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    """ Entry point of the application
+
+    Without arguments, instantiates a Tk object, an Application object and runs the main event loop.
+    Logging is only set up once the window is painted, since it is not needed to show the window.
+    The --index-* arguments instead work on the file index and print to stdout, without starting the GUI,
+        and --headless runs a Headless command.
+
+    Args:
+        argv (list): Command line arguments, without the program name
+
+    Returns:
+        int: Exit status
+    """
+    args = parseArgs(argv)
+    dir = None
+    if args.synthetic is not None:
+        dir = mountSynthetic(args.synthetic, args.latency).root
+    restore = not args.no_restore and dir is None
+    if args.benchmark_startup:
+        for key, milliseconds in Application.benchmarkStartup(restore, dir).items():
+            print(f"{key}: {milliseconds} ms")
+        return 0
+    if args.headless is not None:
+        initLogging(__name__, LOGFILE)
+        if args.headless == "search" and args.match is None:
+            print("--headless search needs --match TEXT", file=sys.stderr)
+            return 2
+        return Headless.run(args.headless, args.path or dir or os.curdir, args.match)
+    if args.index_db is None and args.index_build is None and not args.index_refresh \
+            and args.index_search is None and args.index_prefix is None:
+        from tkinter import Tk
+        root = Tk()
+        app = Application(root, restore, dir)
+        app.root.after_idle(lambda: initLogging(__name__, LOGFILE).info("Started Application"))
+        app.root.mainloop()
+        return 0
+    initLogging(__name__, LOGFILE)
+    if args.index_db is not None:
+        FileIndex._shared = FileIndex(args.index_db)
+    index = FileIndex.shared()
+    under = os.path.abspath(args.under) if args.under else None
+    if args.index_build:
+        for root in args.index_build:
+            print(f"{root}: {index.build(root)} entries")
+    elif args.index_refresh:
+        print(f"{index.refresh()} directories changed")
+    elif args.index_search is not None or args.index_prefix is not None:
+        if args.index_search is not None:
+            results = index.search(args.index_search, under=under, limit=args.limit)
+        else:
+            results = index.searchPrefix(args.index_prefix, under=under, limit=args.limit)
+        for path, kind in results:
+            print(path)
+    return 0
 
 
 if __name__ == "__main__":
-    """ Instantiate a Tk object, an Application object and run the main event loop. """
-    LOGGER.info("Starting Application")
-    ROOT = Tk()
-    APP = Application(ROOT)
-    APP.root.mainloop()
+    sys.exit(main(sys.argv[1:]))
@@ -1,14 +1,54 @@
 import sp_file_explorer
 from logging import INFO, DEBUG, WARN, getLogger
 from unittest import TestCase, main
+from unittest.mock import patch
 from os import getcwd, listdir
 from os.path import isfile, isdir, join, dirname
 from pathlib import Path 
 import string
 import random
+import tempfile
+import tarfile
+import zipfile
+import time
+import os
+import io
+import json
+import sys
+import subprocess
+import threading
+import tracemalloc
+
+os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp(prefix="sp_file_explorer_test_cache")
 
 class RandomState: 
 
+    ROOT = "/memfs"
+    BACKEND = None
+
+    @classmethod
+    def getBackend(cls):
+        """ Returns the in-memory tree the random states browse, building and mounting it on first use """
+        if cls.BACKEND is None:
+            generator = random.Random(39)
+            cls.BACKEND = sp_file_explorer.MemoryBackend(cls.ROOT)
+            pending = [(cls.ROOT, 0)]
+            while pending:
+                dir, depth = pending.pop()
+                cls.BACKEND.makeDirs(dir)
+                for i in range(generator.randint(10, 30)):
+                    if depth < 3 and generator.random() < 0.2:
+                        pending.append((join(dir, f"dir{i}"), depth + 1))
+                    else:
+                        cls.BACKEND.writeFile(join(dir, f"file{i}.txt"), b"x" * generator.randint(0, 100))
+        if sp_file_explorer.FileSystem.backendOf(cls.ROOT) is not cls.BACKEND:
+            sp_file_explorer.FileSystem.mount(cls.BACKEND)
+        return cls.BACKEND
+
+    @classmethod
+    def listDir(cls, dir):
+        return [entry.name for entry in cls.getBackend().scandir(dir)]
+
     @classmethod
     def getRandomString(cls):
         length = random.randint(0, 20)
@@ -19,18 +59,15 @@ class RandomState:
     @classmethod
     def getRandomDir(cls):
         num_dirs = random.randint(0,3)
-        dir = str(Path.home())
+        dir = cls.ROOT
         for i in range(num_dirs-1):
-            children = [child for child in listdir(dir) if isdir(child)]
+            children = [entry.name for entry in cls.getBackend().scandir(dir) if entry.is_dir()]
             if len(children) != 0:
                 child = random.choice(children)
                 dir = join(dir, child)
             else:
                 break
-        if len(listdir(dir)) != 0:
-            return dir
-        else:
-            return dirname(dir) 
+        return dir
 
     @classmethod
     def getRandomSubset(cls, list):
@@ -42,7 +79,7 @@ class RandomState:
     def getRandomState(cls):
         newState = {}
         newState["directory"] = cls.getRandomDir()
-        newState["children"] = listdir(newState["directory"])
+        newState["children"] = cls.listDir(newState["directory"])
         newState["selected"] = cls.getRandomSubset(newState["children"])
         newState["scroll_data"] = {
             "list_size": random.randint(0, 100),
@@ -56,6 +93,18 @@ class RandomState:
         }
         newState["mode"] = random.choice(["browse", "command"])
         newState["text"] = cls.getRandomString()
+        newState["du"] = False
+        newState["sizes"] = {}
+        newState["compared"] = None
+        newState["columns"] = []
+        newState["preview"] = False
+        newState["marks"] = sp_file_explorer.IntervalSet()
+        newState["history"] = sp_file_explorer.History()
+        newState["tree"] = False
+        newState["stale"] = False
+        newState["completion"] = None
+        newState["recall"] = None
+        newState["cursor"] = 0
         return newState
 
 
@@ -366,7 +415,7 @@ class TestBasicReducerMoveDir(TestCase):
         self.assertEqual(self.newState["directory"], self.newDir)
     
     def test_children(self):
-        for i, key in enumerate(listdir(self.newDir)):
+        for i, key in enumerate(RandomState.listDir(self.newDir)):
             self.assertIn(key, self.newState["children"])
             self.assertEqual(key, self.newState["children"][i])
     
@@ -384,7 +433,7 @@ class TestBasicReducerMoveDir(TestCase):
 
     def test_copied_other(self):
         for key in self.state:
-            if key not in ["directory", "children", "selected"]:
+            if key not in ["directory", "children", "selected", "history"]:
                 self.assertEqual(self.newState[key], self.state[key])
 
 
@@ -409,12 +458,12 @@ class BasicReducerMoveSelection(TestCase):
 
     def test_selection_1(self):
         for i in self.indices:
-            self.assertIn(self.state["children"][i], self.state["selected"])
+            self.assertIn(self.state["children"][i], self.newState["selected"])
 
     def test_selection_2(self):
         for i in range(self.num_children):         
             if i not in self.indices:
-                self.assertNotIn(self.state["children"][i], self.state["selected"])
+                self.assertNotIn(self.state["children"][i], self.newState["selected"])
 
     def test_copied_prompt_data(self):
         for key in self.state["prompt_data"]:
@@ -425,11 +474,1727 @@ class BasicReducerMoveSelection(TestCase):
             if key != "scroll_top":
                 self.assertEqual(self.newState["scroll_data"][key], self.state["scroll_data"][key])     
 
+    def test_cursor(self):
+        self.assertEqual(self.newState["cursor"], self.indices[-1])
+        self.assertEqual(sp_file_explorer.BasicReducer.selectedIndex(self.newState), self.indices[-1])
+
     def test_copied_other(self):
         for key in self.state:
-            if key not in ["selected"]:
+            if key not in ["selected", "cursor"]:
                 self.assertEqual(self.newState[key], self.state[key])
 
 
+class TestFileIndex(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = join(self.tmp.name, "root")
+        for folder in ["a/b", "c"]:
+            Path(self.root, folder).mkdir(parents=True)
+        for file in ["a/report.txt", "a/b/report2.pdf", "c/notes.md"]:
+            Path(self.root, file).write_text("x")
+        self.index = sp_file_explorer.FileIndex(join(self.tmp.name, "index.db"), processes=1)
+        self.count = self.index.build(self.root)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def test_build_count(self):
+        self.assertEqual(self.count, 6)
+
+    def test_roots(self):
+        self.assertEqual(self.index.roots(), [self.root])
+        self.assertEqual(self.index.rootOf(join(self.root, "a")), self.root)
+        self.assertIsNone(self.index.rootOf(self.tmp.name))
+
+    def test_search_substring(self):
+        paths = sorted(path for path, kind in self.index.search("port"))
+        self.assertEqual(paths, [join(self.root, "a/b/report2.pdf"), join(self.root, "a/report.txt")])
+
+    def test_search_short_substring(self):
+        paths = [path for path, kind in self.index.search("md")]
+        self.assertEqual(paths, [join(self.root, "c/notes.md")])
+
+    def test_search_prefix_under(self):
+        results = self.index.searchPrefix("rep", under=join(self.root, "a/b"))
+        self.assertEqual(results, [(join(self.root, "a/b/report2.pdf"), "file")])
+
+    def test_refresh(self):
+        Path(self.root, "c/report3").write_text("x")
+        Path(self.root, "a/b/report2.pdf").unlink()
+        Path(self.root, "a/b").rmdir()
+        self.index.refresh()
+        paths = sorted(path for path, kind in self.index.search("rep"))
+        self.assertEqual(paths, [join(self.root, "a/report.txt"), join(self.root, "c/report3")])
+
+
+class TestDiskUsage(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        Path(self.tmp.name, "a/b").mkdir(parents=True)
+        Path(self.tmp.name, "c").mkdir()
+        Path(self.tmp.name, "a/one").write_bytes(b"x" * 100)
+        Path(self.tmp.name, "a/b/two").write_bytes(b"x" * 1000)
+        Path(self.tmp.name, "c/link").hardlink_to(Path(self.tmp.name, "a/b/two"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_subtree_size(self):
+        size, links = sp_file_explorer.DiskUsage._subtree(join(self.tmp.name, "a"))
+        self.assertEqual(size, 1100)
+        self.assertEqual(list(links.values()), [1000])
+
+    def test_total_counts_hard_links_once(self):
+        results = [sp_file_explorer.DiskUsage._subtree(join(self.tmp.name, child)) for child in ["a", "c"]]
+        self.assertEqual(sp_file_explorer.DiskUsage._total(results), 1100)
+
+    def test_format(self):
+        self.assertEqual(sp_file_explorer.DiskUsage.format(512), "512B")
+        self.assertEqual(sp_file_explorer.DiskUsage.format(1536), "1.5K")
+
+    def test_set_sizes(self):
+        state = RandomState.getRandomState()
+        state["du"] = True
+        newState = sp_file_explorer.BasicReducer.setSizes(state, state["directory"], {"a": 1}, "test")
+        self.assertEqual(newState["sizes"], {"a": 1})
+        self.assertEqual(state["sizes"], {})
+
+    def test_set_sizes_stale(self):
+        state = RandomState.getRandomState()
+        state["du"] = True
+        newState = sp_file_explorer.BasicReducer.setSizes(state, state["directory"] + "x", {"a": 1}, "test")
+        self.assertIs(newState, state)
+
+
+class TestMetadata(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.children = [f"file{i}" for i in range(300)]
+        for child in self.children:
+            Path(self.tmp.name, child).write_bytes(b"x" * 10)
+
+    def tearDown(self):
+        sp_file_explorer.Metadata.forget(self.tmp.name)
+        self.tmp.cleanup()
+
+    def test_request_only_given_rows(self):
+        future = sp_file_explorer.Metadata.request(self.tmp.name, self.children[100:125])
+        future.result()
+        self.assertEqual(sp_file_explorer.Metadata.get(self.tmp.name, "file100")["size"], "10B")
+        self.assertIsNone(sp_file_explorer.Metadata.get(self.tmp.name, "file99"))
+        self.assertIsNone(sp_file_explorer.Metadata.get(self.tmp.name, "file125"))
+
+    def test_request_cached_rows(self):
+        sp_file_explorer.Metadata.request(self.tmp.name, self.children[:25]).result()
+        self.assertIsNone(sp_file_explorer.Metadata.request(self.tmp.name, self.children[:25]))
+
+    def test_edited_file_revalidated(self):
+        sp_file_explorer.Metadata.request(self.tmp.name, self.children[:1]).result()
+        Path(self.tmp.name, "file0").write_bytes(b"x" * 20)
+        self.assertIsNone(sp_file_explorer.Metadata.request(self.tmp.name, self.children[:1]))
+        with patch.object(sp_file_explorer.Metadata, "REVALIDATE_SECONDS", 0):
+            sp_file_explorer.Metadata.request(self.tmp.name, self.children[:1]).result()
+        self.assertEqual(sp_file_explorer.Metadata.get(self.tmp.name, "file0")["size"], "20B")
+
+    def test_columns_command(self):
+        state = RandomState.getRandomState()
+        newState = sp_file_explorer.CommandReducer.columnsCommand(state, "size owner")
+        self.assertEqual(newState["columns"], ["size", "owner"])
+        newState = sp_file_explorer.CommandReducer.columnsCommand(state, "colour")
+        self.assertEqual(newState["columns"], state["columns"])
+
+
+class TestPreview(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.text = join(self.tmp.name, "text.txt")
+        self.binary = join(self.tmp.name, "binary.bin")
+        Path(self.text).write_text("héllo\n" * 1000)
+        Path(self.binary).write_bytes(bytes(range(256)))
+
+    def tearDown(self):
+        sp_file_explorer.Preview.forget(self.tmp.name)
+        self.tmp.cleanup()
+
+    def test_decode_text(self):
+        self.assertEqual(sp_file_explorer.Preview.decode("héllo".encode()), "héllo")
+
+    def test_decode_cut_character(self):
+        self.assertEqual(sp_file_explorer.Preview.decode("hé".encode()[:-1]), "h")
+
+    def test_decode_binary(self):
+        lines = sp_file_explorer.Preview.decode(bytes(range(32))).split("\n")
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith("00000010  10 11 12"))
+
+    def test_request_text(self):
+        sp_file_explorer.Preview.request(self.text).result()
+        preview = sp_file_explorer.Preview.get(self.text)
+        self.assertTrue(preview.startswith("héllo\n"))
+        self.assertLessEqual(len(preview.encode()), sp_file_explorer.Preview.MAX_BYTES)
+
+    def test_edited_file_read_again(self):
+        preview = sp_file_explorer.Preview
+        preview.request(self.text).result()
+        self.assertIsNone(preview.request(self.text))
+        preview.request(self.binary).result()
+        with patch.object(preview, "_head", side_effect=AssertionError("unchanged file read again")):
+            preview.request(self.text).result()
+        Path(self.text).write_text("edited")
+        preview.request(self.binary).result()
+        preview.request(self.text).result()
+        self.assertEqual(preview.get(self.text), "edited")
+
+    def test_superseded_request(self):
+        sp_file_explorer.Preview._wanted = self.binary
+        sp_file_explorer.Preview._read(self.text)
+        self.assertIsNone(sp_file_explorer.Preview.get(self.text))
+        sp_file_explorer.Preview._wanted = None
+
+    def test_cache_bound(self):
+        limit = sp_file_explorer.Preview.CACHE_BYTES
+        sp_file_explorer.Preview.CACHE_BYTES = 100
+        try:
+            sp_file_explorer.Preview.request(self.text).result()
+            sp_file_explorer.Preview.request(self.binary).result()
+            self.assertIsNone(sp_file_explorer.Preview.get(self.text))
+            self.assertIsNotNone(sp_file_explorer.Preview.get(self.binary))
+        finally:
+            sp_file_explorer.Preview.CACHE_BYTES = limit
+
+
+class TestLauncher(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+
+    def wait(self, job):
+        deadline = time.monotonic() + 10
+        while job["status"] is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_argv(self):
+        args, shell = sp_file_explorer.Launcher.argv("xterm -e 'vim -R'", "/tmp/a b.txt")
+        self.assertEqual(args, ["xterm", "-e", "vim -R", "/tmp/a b.txt"])
+        self.assertFalse(shell)
+
+    def test_argv_shell(self):
+        args, shell = sp_file_explorer.Launcher.argv("!wc -l", "it's.txt")
+        self.assertEqual(args, "wc -l 'it'\"'\"'s.txt'")
+        self.assertTrue(shell)
+
+    def test_launch_status_and_output(self):
+        job = sp_file_explorer.Launcher.launch("echo", "a b")
+        self.wait(job)
+        self.assertEqual(job["status"], 0)
+        self.assertEqual(job["output"], b"a b\n")
+        self.assertIsNotNone(job["elapsed"])
+        self.assertIn(job, sp_file_explorer.Launcher.jobs)
+
+    def test_launch_missing_program(self):
+        job = sp_file_explorer.Launcher.launch("no-such-program-sp-file-explorer", "x")
+        self.wait(job)
+        self.assertIsInstance(job["status"], OSError)
+
+
+class TestIntervalSet(TestCase):
+
+    def setUp(self):
+        self.set = sp_file_explorer.IntervalSet([(2, 5), (8, 10)])
+
+    def test_from_indices(self):
+        self.assertEqual(sp_file_explorer.IntervalSet.fromIndices([9, 2, 3, 4, 8]), self.set)
+
+    def test_contains(self):
+        self.assertEqual([i for i in range(12) if i in self.set], [2, 3, 4, 8, 9])
+        self.assertEqual(list(self.set), [2, 3, 4, 8, 9])
+        self.assertEqual(len(self.set), 5)
+
+    def test_add_merges(self):
+        self.assertEqual(self.set.add(5, 8).ranges, ((2, 10),))
+        self.assertEqual(self.set.add(0, 1).ranges, ((0, 1), (2, 5), (8, 10)))
+
+    def test_remove_splits(self):
+        self.assertEqual(self.set.remove(3, 9).ranges, ((2, 3), (9, 10)))
+
+    def test_toggle(self):
+        self.assertEqual(self.set.toggle(4).ranges, ((2, 4), (8, 10)))
+        self.assertEqual(self.set.toggle(5).ranges, ((2, 6), (8, 10)))
+
+    def test_invert(self):
+        self.assertEqual(self.set.invert(12).ranges, ((0, 2), (5, 8), (10, 12)))
+        self.assertEqual(self.set.invert(12).invert(12), self.set)
+
+    def test_splice(self):
+        self.assertEqual(self.set.splice(3, 0, 2).ranges, ((2, 3), (5, 7), (10, 12)))
+        self.assertEqual(self.set.splice(4, 4, 0).ranges, ((2, 6),))
+        self.assertEqual(self.set.splice(0, 1, 0).ranges, ((1, 4), (7, 9)))
+
+    def test_union_difference(self):
+        for _ in range(50):
+            a = set(random.sample(range(40), random.randint(0, 30)))
+            b = set(random.sample(range(40), random.randint(0, 30)))
+            left, right = sp_file_explorer.IntervalSet.fromIndices(a), sp_file_explorer.IntervalSet.fromIndices(b)
+            self.assertEqual(left.union(right), sp_file_explorer.IntervalSet.fromIndices(a | b))
+            self.assertEqual(left.difference(right), sp_file_explorer.IntervalSet.fromIndices(a - b))
+
+    def test_deep_copy_shares(self):
+        state = {"marks": self.set}
+        self.assertIs(sp_file_explorer.BasicReducer.sameState(state)["marks"], self.set)
+
+
+class TestMarkCommands(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.state = RandomState.getRandomState()
+        self.state["children"] = ["a.txt", "b.txt", "c.pdf", "d.txt"]
+        self.state["selected"] = ["a.txt"]
+        self.state["mode"] = "browse"
+
+    def test_mark_pattern(self):
+        newState = sp_file_explorer.CommandReducer.markCommand(self.state, "*.txt")
+        self.assertEqual(newState["marks"].ranges, ((0, 2), (3, 4)))
+
+    def test_unmark_pattern(self):
+        newState = sp_file_explorer.CommandReducer.markCommand(self.state, "")
+        newState = sp_file_explorer.CommandReducer.unmarkCommand(newState, "b*")
+        self.assertEqual(list(newState["marks"]), [0, 2, 3])
+
+    def test_invert(self):
+        newState = sp_file_explorer.CommandReducer.markCommand(self.state, "*.pdf")
+        newState = sp_file_explorer.CommandReducer.invertCommand(newState, "")
+        self.assertEqual(list(newState["marks"]), [0, 1, 3])
+
+    def test_targets(self):
+        newState = sp_file_explorer.CommandReducer.markCommand(self.state, "*.pdf")
+        self.assertEqual(sp_file_explorer.BasicReducer.targets(newState), [join(self.state["directory"], "c.pdf")])
+        self.assertEqual(sp_file_explorer.BasicReducer.targets(self.state), [join(self.state["directory"], "a.txt")])
+
+    def test_mark_scales_linearly(self):
+        """ Marking and unmarking n alternating matches builds O(n) ranges in all, not a new set per range """
+        built = [0]
+        init = sp_file_explorer.IntervalSet.__init__
+        def counting(interval, ranges=()):
+            init(interval, ranges)
+            built[0] += len(interval.ranges)
+        for size in (2000, 32000):
+            state = dict(self.state, children=[f"{i}.{'txt' if i % 2 else 'pdf'}" for i in range(size)])
+            state["marks"] = sp_file_explorer.IntervalSet([(0, 1)])
+            built[0] = 0
+            with patch.object(sp_file_explorer.IntervalSet, "__init__", counting):
+                newState = sp_file_explorer.CommandReducer.markCommand(state, "*.txt")
+                newState = sp_file_explorer.CommandReducer.unmarkCommand(newState, "*.txt")
+            self.assertEqual(newState["marks"].ranges, ((0, 1),))
+            self.assertLess(built[0], 4 * size)
+
+    def test_control_down_marks_range(self):
+        newState = sp_file_explorer.KeyBindReducer.controlDownKey(self.state)
+        newState = sp_file_explorer.KeyBindReducer.controlDownKey(newState)
+        self.assertEqual(newState["marks"].ranges, ((0, 3),))
+        self.assertEqual(newState["selected"], ["c.pdf"])
+
+
+class TestBatch(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.paths = [join(self.tmp.name, f"file{i}") for i in range(20)]
+        for path in self.paths:
+            Path(path).write_text("x")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def wait(self, batch):
+        deadline = time.monotonic() + 30
+        while batch["elapsed"] is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_parse_options(self):
+        self.assertEqual(sp_file_explorer.Batch.parseOptions("-j 4 -n10 gzip -9"), (4, 10, "gzip -9"))
+        self.assertEqual(sp_file_explorer.Batch.parseOptions("gzip -n 9"), (None, None, "gzip -n 9"))
+
+    def test_chunks(self):
+        self.assertEqual(sp_file_explorer.Batch.chunks(self.paths, 1), [[path] for path in self.paths])
+        self.assertEqual(len(sp_file_explorer.Batch.chunks(self.paths, 8)), 3)
+        self.assertEqual(sp_file_explorer.Batch.chunks(self.paths), [self.paths])
+
+    def test_each(self):
+        batch = sp_file_explorer.Batch.start("rm", self.paths, jobs=4)
+        self.wait(batch)
+        self.assertEqual((batch["done"], batch["failed"]), (20, 0))
+        self.assertEqual(listdir(self.tmp.name), [])
+
+    def test_failures(self):
+        batch = sp_file_explorer.Batch.start("rm", self.paths[:5] + [join(self.tmp.name, "missing")], max_args=None)
+        self.wait(batch)
+        self.assertEqual((batch["done"], batch["failed"]), (6, 6))
+        self.assertEqual(len(batch["errors"]), 1)
+
+
+class TestFileOperations(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = join(self.tmp.name, "src")
+        self.dst = join(self.tmp.name, "dst")
+        Path(self.src, "d/e").mkdir(parents=True)
+        Path(self.dst).mkdir()
+        Path(self.src, "a.txt").write_text("new")
+        Path(self.src, "d/big").write_bytes(os.urandom(3 * 1024 * 1024))
+        Path(self.src, "d/e/link").symlink_to("../big")
+        Path(self.dst, "a.txt").write_text("old")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_op(self, *args):
+        op = sp_file_explorer.FileOperations.start(*args)
+        deadline = time.monotonic() + 30
+        while op["elapsed"] is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return op
+
+    def test_copy_file(self):
+        sp_file_explorer.FileOperations.copyFile(join(self.src, "d/big"), join(self.dst, "big"))
+        self.assertEqual(Path(self.dst, "big").read_bytes(), Path(self.src, "d/big").read_bytes())
+
+    def test_copy_tree(self):
+        op = self.run_op("copy", [join(self.src, "d")], self.dst)
+        self.assertEqual((op["files_done"], op["failed"]), (2, 0))
+        self.assertEqual(Path(self.dst, "d/big").read_bytes(), Path(self.src, "d/big").read_bytes())
+        self.assertEqual(os.readlink(join(self.dst, "d/e/link")), "../big")
+
+    def test_copy_onto_itself(self):
+        big = Path(self.src, "d/big").read_bytes()
+        op = self.run_op("copy", [join(self.src, "a.txt"), join(self.src, "d")], self.src, "overwrite")
+        self.assertEqual((op["failed"], op["files_done"]), (2, 0))
+        self.assertEqual(Path(self.src, "a.txt").read_text(), "new")
+        self.assertEqual(Path(self.src, "d/big").read_bytes(), big)
+
+    def test_copy_into_own_subtree(self):
+        op = self.run_op("copy", [join(self.src, "d"), join(self.src, "a.txt")], join(self.src, "d/e"))
+        self.assertEqual((op["failed"], op["files_done"]), (1, 1))
+        self.assertEqual(op["errors"][0][0], join(self.src, "d"))
+        self.assertEqual(sorted(listdir(join(self.src, "d/e"))), ["a.txt", "link"])
+
+    def test_copy_file_range_copying_nothing(self):
+        with patch.object(sp_file_explorer.os, "copy_file_range", lambda *args: 0, create=True):
+            sp_file_explorer.FileOperations.copyFile(join(self.src, "d/big"), join(self.dst, "big"))
+        self.assertEqual(Path(self.dst, "big").read_bytes(), Path(self.src, "d/big").read_bytes())
+
+    def test_copy_policies(self):
+        op = self.run_op("copy", [join(self.src, "a.txt")], self.dst, "skip")
+        self.assertEqual(op["skipped"], 1)
+        self.assertEqual(Path(self.dst, "a.txt").read_text(), "old")
+        self.run_op("copy", [join(self.src, "a.txt")], self.dst, "rename")
+        self.assertEqual(Path(self.dst, "a (1).txt").read_text(), "new")
+        self.run_op("copy", [join(self.src, "a.txt")], self.dst, "overwrite")
+        self.assertEqual(Path(self.dst, "a.txt").read_text(), "new")
+
+    def test_move(self):
+        op = self.run_op("move", [join(self.src, "d")], self.dst)
+        self.assertEqual(op["failed"], 0)
+        self.assertFalse(isdir(join(self.src, "d")))
+        self.assertTrue(isfile(join(self.dst, "d/big")))
+
+    def test_move_vanished_source(self):
+        op = self.run_op("move", [join(self.src, "vanished"), join(self.src, "a.txt")], join(self.dst, "sub"))
+        self.assertEqual(op["failed"], 2)
+        Path(self.dst, "sub").mkdir()
+        op = self.run_op("move", [join(self.src, "vanished"), join(self.src, "a.txt")], join(self.dst, "sub"))
+        self.assertEqual((op["failed"], op["files_done"]), (1, 1))
+        self.assertEqual(op["errors"][0][0], join(self.src, "vanished"))
+        self.assertEqual(Path(self.dst, "sub", "a.txt").read_text(), "new")
+
+    def test_delete(self):
+        self.run_op("delete", [join(self.src, "d"), join(self.src, "a.txt")])
+        self.assertEqual(listdir(self.src), [])
+
+    def test_trash(self):
+        data = os.environ.get("XDG_DATA_HOME")
+        os.environ["XDG_DATA_HOME"] = self.tmp.name
+        try:
+            self.run_op("trash", [join(self.src, "a.txt")])
+        finally:
+            if data is None:
+                del os.environ["XDG_DATA_HOME"]
+            else:
+                os.environ["XDG_DATA_HOME"] = data
+        self.assertEqual(Path(self.tmp.name, "Trash/files/a.txt").read_text(), "new")
+        self.assertIn(f"Path={join(self.src, 'a.txt')}", Path(self.tmp.name, "Trash/info/a.txt.trashinfo").read_text())
+
+    def test_apply_changes(self):
+        state = RandomState.getRandomState()
+        state["children"] = ["a", "b", "c"]
+        state["selected"] = ["b"]
+        state["marks"] = sp_file_explorer.IntervalSet([(0, 2)])
+        newState = sp_file_explorer.BasicReducer.applyChanges(state, {state["directory"]: (["d"], ["b"])})
+        self.assertEqual(newState["children"], ["a", "c", "d"])
+        self.assertEqual(newState["selected"], ["c"])
+        self.assertFalse(newState["marks"])
+        self.assertIs(sp_file_explorer.BasicReducer.applyChanges(state, {"/elsewhere": (["d"], [])}), state)
+
+
+class TestStartupListing(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        for i in range(100):
+            Path(self.tmp.name, f"file{i}").write_text("x")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_list_dir_chunks(self):
+        chunks = list(sp_file_explorer.FileSystem.listDirChunks(self.tmp.name, 30))
+        self.assertEqual([len(chunk) for chunk in chunks], [30, 70])
+        self.assertEqual(chunks[0] + chunks[1], listdir(self.tmp.name))
+
+    def test_list_dir_chunks_small_directory(self):
+        chunks = list(sp_file_explorer.FileSystem.listDirChunks(self.tmp.name, 200))
+        self.assertEqual([len(chunk) for chunk in chunks], [100])
+
+    def test_init_state_with_first_chunk(self):
+        state = sp_file_explorer.BasicReducer.getInitState(["a", "b"])
+        self.assertEqual(state["children"], ["a", "b"])
+        self.assertEqual(state["selected"], ["a"])
+
+    def test_extend_children(self):
+        state = sp_file_explorer.BasicReducer.getInitState(["a", "b"])
+        newState = sp_file_explorer.BasicReducer.extendChildren(state, state["directory"], 2, ["c"])
+        self.assertEqual(newState["children"], ["a", "b", "c"])
+        self.assertEqual(state["children"], ["a", "b"])
+
+    def test_extend_children_stale(self):
+        state = sp_file_explorer.BasicReducer.getInitState(["a", "b"])
+        self.assertIs(sp_file_explorer.BasicReducer.extendChildren(state, state["directory"], 3, ["c"]), state)
+        self.assertIs(sp_file_explorer.BasicReducer.extendChildren(state, "/elsewhere", 2, ["c"]), state)
+
+
+class TestSession(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = getcwd()
+        for name in ["a", "b", "c"]:
+            Path(self.tmp.name, name).write_text("x")
+        Path(self.tmp.name, "d").mkdir()
+        sp_file_explorer.FileSystem.changeCWD(self.tmp.name)
+
+    def tearDown(self):
+        sp_file_explorer.FileSystem.changeCWD(self.cwd)
+        self.tmp.cleanup()
+
+    def test_list_dir_cached_until_mtime_changes(self):
+        fs = sp_file_explorer.FileSystem
+        children = fs.listDir(self.tmp.name)
+        listing = fs.cachedListing(self.tmp.name)
+        self.assertEqual(sorted(listing["names"]), ["a", "b", "c", "d"])
+        listing["names"].append("cached")
+        self.assertIn("cached", fs.listDir(self.tmp.name))
+        Path(self.tmp.name, "e").write_text("x")
+        os.utime(self.tmp.name, ns=(0, listing["mtime"] + 1))
+        self.assertEqual(sorted(fs.listDir(self.tmp.name)), sorted(children + ["e"]))
+
+    def test_encode_decode(self):
+        state = sp_file_explorer.BasicReducer.getInitState()
+        state["selected"] = ["b"]
+        state["marks"] = sp_file_explorer.IntervalSet(((1, 3),))
+        snapshot = sp_file_explorer.Session.snapshot(state)
+        self.assertEqual(snapshot["listings"][0][0], self.tmp.name)
+        self.assertEqual(sp_file_explorer.Session.decode(sp_file_explorer.Session.encode(snapshot)), snapshot)
+
+    def test_decode_other_version(self):
+        data = sp_file_explorer.Session.encode({"directory": self.tmp.name})
+        self.assertIsNone(sp_file_explorer.Session.decode(b"XXXX" + data[4:]))
+        self.assertIsNone(sp_file_explorer.Session.decode(data[:4] + b"\xff\xff" + data[6:]))
+        self.assertIsNone(sp_file_explorer.Session.decode(data[:-4]))
+
+    def test_save_and_restore(self):
+        path = Path(self.tmp.name, "d", "session.bin")
+        state = sp_file_explorer.BasicReducer.getInitState()
+        state["selected"] = ["c"]
+        sp_file_explorer.Session.save(state, str(path))
+        sp_file_explorer.FileSystem._listings.clear()
+        sp_file_explorer.FileSystem.changeCWD(self.cwd)
+        restored = sp_file_explorer.Session.restore(sp_file_explorer.Session.load(str(path)))
+        self.assertEqual(restored["directory"], self.tmp.name)
+        self.assertEqual(restored["children"], state["children"])
+        self.assertEqual(restored["selected"], ["c"])
+        self.assertEqual(sp_file_explorer.FileSystem.dirOrFile(str(Path(self.tmp.name, "d"))), "dir")
+
+    def test_restore_unreachable_directory(self):
+        backend = sp_file_explorer.MemoryBackend("/hungsession")
+        backend.makeDirs("/hungsession/docs")
+        sp_file_explorer.FileSystem.mount(backend)
+        self.addCleanup(sp_file_explorer.FileSystem.unmount, "/hungsession")
+        self.addCleanup(sp_file_explorer.FileSystem._listings.pop, "/hungsession", None)
+        path = Path(self.tmp.name, "d", "session.bin")
+        sp_file_explorer.Session.save(sp_file_explorer.BasicReducer.getInitState(), str(path))
+        snapshot = sp_file_explorer.Session.load(str(path))
+        snapshot["directory"] = join(self.tmp.name, "gone")
+        self.assertIsNone(sp_file_explorer.Session.restore(snapshot))
+        backend.latency = 0.5
+        snapshot["directory"] = "/hungsession/docs"
+        with patch.object(sp_file_explorer.Mounts, "TIMEOUT_SECONDS", 0.05):
+            started = time.perf_counter()
+            self.assertIsNone(sp_file_explorer.Session.restore(snapshot))
+            snapshot["listings"] = [("/hungsession", 0, ["docs"], [sp_file_explorer.Session.KIND_CODES["dir"]])]
+            self.assertIsNone(sp_file_explorer.Session.restore(snapshot))
+            self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertEqual(getcwd(), self.tmp.name)
+
+    def test_refresh_children(self):
+        state = sp_file_explorer.BasicReducer.getInitState(["a", "b", "c"])
+        state["selected"] = ["b"]
+        self.assertIs(sp_file_explorer.BasicReducer.refreshChildren(state, state["directory"], ["a", "b", "c"]), state)
+        self.assertIs(sp_file_explorer.BasicReducer.refreshChildren(state, "/elsewhere", ["a"]), state)
+        newState = sp_file_explorer.BasicReducer.refreshChildren(state, state["directory"], ["a", "c"])
+        self.assertEqual(newState["children"], ["a", "c"])
+        self.assertEqual(newState["selected"], ["a"])
+
+
+class TestHistory(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = getcwd()
+        for name in ["a", "b"]:
+            Path(self.tmp.name, name).mkdir()
+            Path(self.tmp.name, name, "file").write_text("x")
+        sp_file_explorer.FileSystem.changeCWD(self.tmp.name)
+        self.state = sp_file_explorer.BasicReducer.getInitState()
+
+    def tearDown(self):
+        sp_file_explorer.FileSystem.changeCWD(self.cwd)
+        self.tmp.cleanup()
+
+    def test_same_state_shares_children(self):
+        newState = sp_file_explorer.BasicReducer.sameState(self.state)
+        self.assertIs(newState["children"], self.state["children"])
+        self.assertIsNot(newState["scroll_data"], self.state["scroll_data"])
+
+    def test_back_and_forward(self):
+        reducer = sp_file_explorer.BasicReducer
+        state = reducer.moveDir(self.state, join(self.tmp.name, "a"))
+        state = reducer.moveDir(state, join(self.tmp.name, "b"))
+        listed = state["children"]
+        back = reducer.back(state)
+        self.assertEqual(back["directory"], join(self.tmp.name, "a"))
+        self.assertEqual(getcwd(), join(self.tmp.name, "a"))
+        back = reducer.back(back)
+        self.assertEqual(back["directory"], self.tmp.name)
+        self.assertIs(back["children"], self.state["children"])
+        self.assertIs(reducer.back(back), back)
+        forward = reducer.forward(reducer.forward(back))
+        self.assertEqual(forward["directory"], join(self.tmp.name, "b"))
+        self.assertIs(forward["children"], listed)
+        self.assertIs(reducer.forward(forward), forward)
+
+    def test_move_clears_forward(self):
+        reducer = sp_file_explorer.BasicReducer
+        state = reducer.back(reducer.moveDir(self.state, join(self.tmp.name, "a")))
+        state = reducer.moveDir(state, join(self.tmp.name, "b"))
+        self.assertEqual(state["history"].forward, ())
+
+    def test_undo_marks(self):
+        reducer = sp_file_explorer.BasicReducer
+        state = reducer.setMarks(self.state, sp_file_explorer.IntervalSet(((0, 2),)))
+        self.assertEqual(len(reducer.back(state)["marks"]), 0)
+
+    def test_bounded_by_entries(self):
+        history = sp_file_explorer.History()
+        for i in range(sp_file_explorer.History.MAX_ENTRIES + 10):
+            history = history.push(self.state)
+        self.assertEqual(len(history), sp_file_explorer.History.MAX_ENTRIES)
+        self.assertEqual(history.nbytes(), history.back[0]["bytes"])
+
+    def test_bounded_by_bytes(self):
+        states = [dict(self.state, children=[str(i) * 100 for i in range(100)]) for i in range(10)]
+        size = sp_file_explorer.History.estimate(states[0]["children"])
+        history = sp_file_explorer.History()
+        with patch.object(sp_file_explorer.History, "MAX_BYTES", 3 * size):
+            for state in states:
+                history = history.push(state)
+        self.assertEqual(len(history), 3)
+        self.assertIs(history.back[-1]["children"], states[-1]["children"])
+
+class TestPanes(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = getcwd()
+        Path(self.tmp.name, "a").mkdir()
+        Path(self.tmp.name, "a", "file").write_text("x")
+
+    def tearDown(self):
+        sp_file_explorer.FileSystem.changeCWD(self.cwd)
+        self.tmp.cleanup()
+
+    def test_drain_all(self):
+        tasks = sp_file_explorer.TaskQueue()
+        first, second = {"directory": "/a"}, {"directory": "/b"}
+        tasks.post(lambda state, dir: dict(state, seen=True) if state["directory"] == dir else state, "/b")
+        states = tasks.drainAll([first, second])
+        self.assertIs(states[0], first)
+        self.assertEqual(states[1], {"directory": "/b", "seen": True})
+
+    def test_results_routed_to_originating_pane(self):
+        tasks = sp_file_explorer.TaskQueue()
+        first, second = {"directory": "/a"}, {"directory": "/a"}
+        seen = lambda state, text: dict(state, seen=text)
+        with tasks.onBehalfOf(1):
+            tasks.submit(lambda: "result", reducer=seen).result()
+            tasks.post(seen, "notice")
+        tasks.postTo(None, lambda state: dict(state, refreshed=True))
+        time.sleep(0.05)
+        states = tasks.drainAll([first, second])
+        self.assertEqual(states[0], {"directory": "/a", "refreshed": True})
+        self.assertEqual(states[1], {"directory": "/a", "seen": "notice", "refreshed": True})
+        self.assertIsNone(tasks.currentPane())
+
+    def test_hidden_pane_not_rendered(self):
+        class Hidden:
+            visible = False
+        pane = Hidden()
+        state = sp_file_explorer.BasicReducer.getInitState(["a"])
+        sp_file_explorer.Renderer.render(pane, state)
+        self.assertIs(pane.state, state)
+
+    def test_unchanged_directory_keeps_caches(self):
+        dir = join(self.tmp.name, "a")
+        state = sp_file_explorer.BasicReducer.getInitState(["a"])
+        sp_file_explorer.BasicReducer.moveDir(state, dir)
+        sp_file_explorer.Metadata.request(dir, ["file"]).result()
+        sp_file_explorer.BasicReducer.moveDir(state, dir)
+        self.assertIsNotNone(sp_file_explorer.Metadata.get(dir, "file"))
+        Path(dir, "other").write_text("x")
+        os.utime(dir, ns=(0, sp_file_explorer.FileSystem.cachedListing(dir)["mtime"] + 1))
+        newState = sp_file_explorer.BasicReducer.moveDir(state, dir)
+        self.assertIn("other", newState["children"])
+        self.assertIsNone(sp_file_explorer.Metadata.get(dir, "file"))
+
+
+class TestArchive(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip = join(self.tmp.name, "build.zip")
+        self.tar = join(self.tmp.name, "build.tar.gz")
+        with zipfile.ZipFile(self.zip, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("lib/app.txt", "hello")
+            archive.writestr("lib/data.bin", b"x\0y")
+            archive.writestr("README", "readme")
+        source = join(self.tmp.name, "src")
+        Path(source, "lib").mkdir(parents=True)
+        Path(source, "lib", "app.txt").write_text("hello")
+        with tarfile.open(self.tar, "w:gz") as archive:
+            archive.add(join(source, "lib"), arcname="lib")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_locate(self):
+        archive = sp_file_explorer.Archive
+        self.assertEqual(archive.locate(self.zip), (self.zip, ""))
+        self.assertEqual(archive.locate(join(self.zip, "lib", "app.txt")), (self.zip, join("lib", "app.txt")))
+        self.assertIsNone(archive.locate(self.tmp.name))
+
+    def test_locate_stalled_mount(self):
+        archive = sp_file_explorer.Archive
+        statted = []
+        realStat = os.stat
+        def stalledStat(path, *args, **kwargs):
+            statted.append(path)
+            if path.endswith("stalled.zip"):
+                time.sleep(0.5)
+            return realStat(path, *args, **kwargs)
+        with patch.object(sp_file_explorer.Mounts, "TIMEOUT_SECONDS", 0.05), patch("os.stat", stalledStat):
+            started = time.perf_counter()
+            self.assertIsNone(archive.locate(join(self.tmp.name, "stalled.zip", "member")))
+            self.assertLess(time.perf_counter() - started, 0.3)
+            self.assertIsNone(archive.locate(join(self.tmp.name, "src", "lib")))
+        self.assertEqual(statted, [join(self.tmp.name, "stalled.zip")])
+
+    def test_list_zip(self):
+        fs = sp_file_explorer.FileSystem
+        self.assertTrue(fs.isChildOpenable(self.zip))
+        self.assertEqual(sorted(fs.listDir(self.zip)), ["README", "lib"])
+        self.assertEqual(sorted(fs.listDir(join(self.zip, "lib"))), ["app.txt", "data.bin"])
+        self.assertEqual(fs.dirOrFile(join(self.zip, "lib")), "dir")
+        self.assertFalse(fs.isChildOpenable(join(self.zip, "README")))
+
+    def test_list_tar(self):
+        fs = sp_file_explorer.FileSystem
+        self.assertEqual(fs.listDir(self.tar), ["lib"])
+        self.assertEqual(fs.listDir(join(self.tar, "lib")), ["app.txt"])
+
+    def test_read_member(self):
+        archive = sp_file_explorer.Archive
+        self.assertEqual(archive.read(self.zip, join("lib", "app.txt"), 3), b"hel")
+        self.assertEqual(archive.read(self.tar, join("lib", "app.txt"), 100), b"hello")
+        self.assertEqual(archive.size(self.zip, "lib"), 8)
+
+    def test_reindex_when_changed(self):
+        self.assertEqual(sorted(sp_file_explorer.FileSystem.listDir(self.zip)), ["README", "lib"])
+        with zipfile.ZipFile(self.zip, "a") as archive:
+            archive.writestr("NEW", "new")
+        os.utime(self.zip, ns=(0, os.stat(self.zip).st_mtime_ns + 10**9))
+        self.assertIn("NEW", sp_file_explorer.FileSystem.listDir(self.zip))
+
+
+class TestMemoryBackend(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.backend = sp_file_explorer.MemoryBackend("/memtest")
+        self.backend.writeFile("/memtest/docs/readme.txt", b"hello")
+        self.backend.synthesize("/memtest/big", 200000, prefix="item", size=10)
+        sp_file_explorer.FileSystem.mount(self.backend)
+
+    def tearDown(self):
+        sp_file_explorer.FileSystem.unmount("/memtest")
+
+    def test_list_and_kinds(self):
+        fs = sp_file_explorer.FileSystem
+        self.assertEqual(fs.listDir("/memtest"), ["docs", "big"])
+        self.assertEqual(fs.dirOrFile("/memtest/docs"), "dir")
+        self.assertEqual(fs.dirOrFile("/memtest/docs/readme.txt"), "file")
+        self.assertTrue(fs.isChildOpenable("/memtest/big"))
+        self.assertFalse(fs.isChildOpenable("/memtest/docs/readme.txt"))
+
+    def test_synthetic_directory(self):
+        children = sp_file_explorer.FileSystem.listDir("/memtest/big")
+        self.assertEqual(len(children), 200000)
+        self.assertEqual(children[12345], "item12345")
+        self.assertEqual(self.backend.stat("/memtest/big/item199999").st_size, 10)
+        with self.assertRaises(FileNotFoundError):
+            self.backend.stat("/memtest/big/item200000")
+
+    def test_listing_cached_until_changed(self):
+        fs = sp_file_explorer.FileSystem
+        fs.listDir("/memtest/docs")
+        listing = fs.cachedListing("/memtest/docs")
+        fs.listDir("/memtest/docs")
+        self.assertIs(fs.cachedListing("/memtest/docs"), listing)
+        self.backend.writeFile("/memtest/docs/new.txt")
+        self.assertEqual(fs.listDir("/memtest/docs"), ["readme.txt", "new.txt"])
+
+    def test_move_dir_and_preview(self):
+        state = sp_file_explorer.BasicReducer.getInitState(["a"])
+        newState = sp_file_explorer.BasicReducer.moveDir(state, "/memtest/docs")
+        self.assertEqual(newState["children"], ["readme.txt"])
+        self.assertEqual(sp_file_explorer.Preview.request("/memtest/docs/readme.txt").result(), None)
+        self.assertEqual(sp_file_explorer.Preview.get("/memtest/docs/readme.txt"), "hello")
+        self.assertEqual(sp_file_explorer.Metadata._lstat("/memtest/docs/readme.txt")["size"], "5B")
+
+    def test_latency(self):
+        self.backend.latency = 0.05
+        started = time.perf_counter()
+        sp_file_explorer.FileSystem.listDir("/memtest/docs")
+        self.assertGreaterEqual(time.perf_counter() - started, 0.1)
+
+
+class TestMounts(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.backend = sp_file_explorer.MemoryBackend("/slowmount")
+        self.backend.writeFile("/slowmount/docs/readme.txt", b"hello")
+        sp_file_explorer.FileSystem.mount(self.backend)
+        sp_file_explorer.FileSystem.listDir("/slowmount")
+        sp_file_explorer.FileSystem.listDir("/slowmount/docs")
+        self.addCleanup(sp_file_explorer.Mounts._latency.pop, self.backend.device, None)
+        self.addCleanup(sp_file_explorer.FileSystem.unmount, "/slowmount")
+        for name, value in (("TIMEOUT_SECONDS", 0.1), ("SLOW_SECONDS", 0.02)):
+            patcher = patch.object(sp_file_explorer.Mounts, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def hang(self):
+        """ Makes the mount take a second per call, and waits at cleanup until it responds again """
+        self.backend.latency = 1.0
+        self.addCleanup(self.waitResponding)
+
+    def waitResponding(self):
+        deadline = time.perf_counter() + 2
+        while self.backend.device in sp_file_explorer.Mounts._hung and time.perf_counter() < deadline:
+            time.sleep(0.05)
+
+    def test_latency_tracking(self):
+        mounts = sp_file_explorer.Mounts
+        self.assertEqual(sp_file_explorer.FileSystem.deviceOf("/slowmount/docs"), self.backend.device)
+        self.assertFalse(mounts.isSlow(self.backend.device))
+        self.backend.latency = 0.03
+        for _ in range(8):
+            sp_file_explorer.FileSystem.listDir("/slowmount/docs")
+        self.assertTrue(mounts.isSlow(self.backend.device))
+        self.assertIsNone(sp_file_explorer.Metadata.request("/slowmount/docs", ["readme.txt"]))
+        self.assertIsNone(sp_file_explorer.FileType.request("/slowmount/docs", ["readme.txt"]))
+
+    def test_timeout(self):
+        self.hang()
+        started = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            sp_file_explorer.FileSystem.listDir("/slowmount/docs")
+        with self.assertRaises(TimeoutError):
+            sp_file_explorer.FileSystem.listDir("/slowmount")
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertTrue(sp_file_explorer.Mounts.isSlow(self.backend.device))
+
+    def test_large_listing_timed_per_chunk(self):
+        class SlowEntries(sp_file_explorer.MemoryBackend):
+            def scandir(self, path):
+                for entry in super().scandir(path):
+                    time.sleep(0.005)
+                    yield entry
+        backend = SlowEntries("/largemount")
+        for i in range(60):
+            backend.writeFile(f"/largemount/file{i}")
+        sp_file_explorer.FileSystem.mount(backend)
+        self.addCleanup(sp_file_explorer.FileSystem.unmount, "/largemount")
+        with patch.object(sp_file_explorer.FileSystem, "LISTING_CHUNK", 5):
+            self.assertEqual(len(sp_file_explorer.FileSystem.listDir("/largemount")), 60)
+        self.assertNotIn(backend.device, sp_file_explorer.Mounts._hung)
+
+    def test_hung_preview(self):
+        self.hang()
+        started = time.perf_counter()
+        sp_file_explorer.Preview.request("/slowmount/docs/readme.txt").result()
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertTrue(sp_file_explorer.Preview.get("/slowmount/docs/readme.txt").startswith("Cannot preview"))
+        sp_file_explorer.Preview.forget("/slowmount/docs")
+
+    def test_stale_listing_revalidated(self):
+        self.hang()
+        state = sp_file_explorer.BasicReducer.getInitState(["a"], "/slowmount")
+        state = sp_file_explorer.BasicReducer.moveDir(state, "/slowmount/docs")
+        self.assertEqual(state["children"], ["readme.txt"])
+        self.assertTrue(state["stale"])
+        self.backend.latency = 0
+        self.backend.writeFile("/slowmount/docs/new.txt")
+        for _ in range(100):
+            time.sleep(0.02)
+            state = sp_file_explorer.TASKS.drain(state)
+            if not state["stale"]:
+                break
+        self.assertEqual(state["children"], ["readme.txt", "new.txt"])
+
+    def test_hung_uncached_directory(self):
+        self.backend.makeDirs("/slowmount/other")
+        self.hang()
+        state = sp_file_explorer.BasicReducer.getInitState(["a"], "/slowmount")
+        newState = sp_file_explorer.KeyBindReducer.shiftDownKey(sp_file_explorer.BasicReducer.moveSelection(state, [0]))
+        self.assertEqual(newState["directory"], "/slowmount")
+
+
+class TestFrecency(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = getcwd()
+        for dir in ["projects/alpha", "projects/beta", "music/alpha"]:
+            Path(self.tmp.name, dir).mkdir(parents=True)
+        self.frecency = sp_file_explorer.Frecency
+        self.frecency._entries = None
+        if os.path.exists(self.frecency.path()):
+            os.remove(self.frecency.path())
+        self.now = 1000000000
+
+    def tearDown(self):
+        sp_file_explorer.FileSystem.changeCWD(self.cwd)
+        self.frecency._entries = None
+        self.tmp.cleanup()
+
+    def visit(self, dir, times=1, age=0):
+        for i in range(times):
+            self.frecency._append(join(self.tmp.name, dir), self.now - age)
+
+    def test_ranking(self):
+        self.visit("projects/alpha", 3, age=10**6)
+        self.visit("music/alpha", 2)
+        self.visit("projects/beta", 5)
+        self.assertEqual(self.frecency.search("alpha", now=self.now), 
+                         [join(self.tmp.name, "music/alpha"), join(self.tmp.name, "projects/alpha")])
+        self.assertEqual(self.frecency.search("proj alpha", now=self.now), [join(self.tmp.name, "projects/alpha")])
+        self.assertEqual(self.frecency.search("", now=self.now)[0], join(self.tmp.name, "projects/beta"))
+
+    def test_persistent(self):
+        self.visit("projects/beta", 2)
+        self.frecency._entries = None
+        self.assertEqual(self.frecency.search("beta", now=self.now), [join(self.tmp.name, "projects/beta")])
+        self.assertEqual(self.frecency._entries[join(self.tmp.name, "projects/beta")], (2, self.now))
+
+    def test_compaction(self):
+        self.frecency.search("")
+        self.visit("projects/beta", 150)
+        with open(self.frecency.path()) as file:
+            self.assertLess(len(file.readlines()), 150)
+        self.frecency._entries = None
+        self.frecency.search("")
+        self.assertEqual(self.frecency._entries[join(self.tmp.name, "projects/beta")][0], 150)
+
+    def test_aging(self):
+        with patch.object(self.frecency, "MAX_TOTAL", 100):
+            self.frecency.search("")
+            self.visit("projects/beta", 150)
+            self.visit("projects/alpha")
+            self.frecency._compact()
+        self.assertNotIn(join(self.tmp.name, "projects/alpha"), self.frecency._entries)
+        self.assertLess(self.frecency._entries[join(self.tmp.name, "projects/beta")][0], 100)
+
+    def test_search_many_paths(self):
+        os.makedirs(os.path.dirname(self.frecency.path()), exist_ok=True)
+        with open(self.frecency.path(), "w") as file:
+            for i in range(30000):
+                file.write(f"1\t{self.now}\t/home/user/src/project{i}/module{i % 97}\n")
+        self.frecency.search("", now=self.now)
+        started = time.perf_counter()
+        results = self.frecency.search("project123 module", limit=1000, now=self.now)
+        self.assertLess(time.perf_counter() - started, 0.05)
+        self.assertEqual(len(results), 111)
+
+    def test_jump_command(self):
+        self.visit("projects/alpha")
+        self.visit(join(self.tmp.name, "gone"))
+        state = sp_file_explorer.BasicReducer.getInitState(["a"])
+        newState = sp_file_explorer.CommandReducer.jumpCommand(state, "alpha")
+        self.assertEqual(newState["directory"], join(self.tmp.name, "projects/alpha"))
+        newState = sp_file_explorer.CommandReducer.jumpCommand(state, "gone")
+        self.assertIs(newState["directory"], state["directory"])
+        self.assertNotIn(join(self.tmp.name, "gone"), self.frecency._entries)
+
+    def test_jump_keeps_unreachable(self):
+        backend = sp_file_explorer.MemoryBackend("/hungmount")
+        backend.makeDirs("/hungmount/alpha")
+        sp_file_explorer.FileSystem.mount(backend)
+        self.addCleanup(sp_file_explorer.FileSystem.unmount, "/hungmount")
+        self.frecency._append("/hungmount/alpha", self.now)
+        backend.latency = 0.5
+        state = sp_file_explorer.BasicReducer.getInitState(["a"])
+        with patch.object(sp_file_explorer.Mounts, "TIMEOUT_SECONDS", 0.05):
+            newState = sp_file_explorer.CommandReducer.jumpCommand(state, "hungmount")
+        self.assertEqual(newState["directory"], state["directory"])
+        self.assertIn("/hungmount/alpha", self.frecency._entries)
+
+
 if __name__ == "__main__":
     main(verbosity=2)
+
+
+class Canvas:
+    """ Stand-in for a tkinter Canvas, keeping the options of its items, counting its calls and holding back scheduled calls """
+
+    def __init__(self):
+        self.items = {}
+        self.calls = 0
+        self.pending = []
+
+    def create_rectangle(self, *coords, **options):
+        return self.create_text(*coords, **options)
+
+    def create_text(self, *coords, **options):
+        self.calls += 1
+        self.items[len(self.items) + 1] = dict(options)
+        return len(self.items)
+
+    def itemconfigure(self, item, **options):
+        self.calls += 1
+        self.items[item].update(options)
+
+    def after(self, ms, function):
+        self.pending.append(function)
+
+    def after_idle(self, function):
+        self.pending.append(function)
+
+    def flush(self):
+        """ Runs the scheduled calls, and returns how many there were """
+        pending, self.pending = self.pending, []
+        for function in pending:
+            function()
+        return len(pending)
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls += 1
+        return call
+
+
+class TestListCanvas(TestCase):
+
+    def setUp(self):
+        self.canvas = Canvas()
+        self.list = sp_file_explorer.ListCanvas(self.canvas)
+        self.list.resize(20, 5)
+        self.asked = []
+        self.list.setRows(100000, self.source)
+        self.canvas.flush()
+
+    def source(self, start, end):
+        self.asked.append((start, end))
+        return [((f"row{index}", str(index)), "text" if index % 2 else "dir") for index in range(start, end)]
+
+    def texts(self, column=1):
+        return [self.canvas.items[items[column]].get("text") for items in self.list.slots]
+
+    def test_draws_visible_rows(self):
+        self.assertEqual(self.asked, [(0, 5)])
+        self.assertEqual(self.texts(), ["row0", "row1", "row2", "row3", "row4"])
+        self.assertEqual(self.canvas.items[self.list.slots[1][0]]["fill"], "yellow")
+
+    def test_columns(self):
+        self.list.setColumns([6])
+        self.canvas.flush()
+        self.assertEqual(self.texts(2), ["0", "1", "2", "3", "4"])
+        self.list.setColumns([16])
+        self.canvas.flush()
+        self.assertEqual(self.texts(), ["row", "row", "row", "row", "row"])
+
+    def test_scroll_reuses_items(self):
+        created = len(self.canvas.items)
+        self.canvas.calls = 0
+        self.list.scrollTo(50000)
+        self.canvas.flush()
+        self.assertEqual(len(self.canvas.items), created)
+        self.assertEqual(self.texts(), [f"row{index}" for index in range(50000, 50005)])
+        self.assertLessEqual(self.canvas.calls, 5 * 2)
+        self.canvas.calls = 0
+        self.list.scrollTo(self.list.count)
+        self.canvas.flush()
+        self.assertEqual(self.list.top, self.list.count - 5)
+
+    def test_selection_configures_changed_rows(self):
+        self.list.select(sp_file_explorer.IntervalSet([(1, 2)]), 1)
+        self.canvas.flush()
+        self.canvas.calls = 0
+        self.list.select(sp_file_explorer.IntervalSet([(2, 3)]), 2)
+        self.canvas.flush()
+        self.assertEqual(self.canvas.calls, 2)
+        self.assertEqual(self.canvas.items[self.list.slots[2][0]]["fill"], sp_file_explorer.ListCanvas.DEFAULT_COLORS[1])
+
+    def test_batches_updates(self):
+        for top in range(100):
+            self.list.scrollTo(top)
+            self.list.setRows(100000, self.source)
+        self.assertEqual(self.canvas.flush(), 1)
+        self.assertEqual(self.list.redraws, 2)
+        self.assertEqual(self.texts()[0], "row99")
+
+
+class TestTree(TestCase):
+
+    class Widget:
+
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: None
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.backend = sp_file_explorer.MemoryBackend("/tree")
+        for i in range(50):
+            self.backend.writeFile(f"/tree/dir{i:02}/file", b"x")
+        self.backend.writeFile("/tree/dir00/sub/deep", b"x")
+        sp_file_explorer.FileSystem.mount(self.backend)
+        state = sp_file_explorer.BasicReducer.getInitState(dir="/tree")
+        self.state = sp_file_explorer.CommandReducer.treeCommand(state, "")
+
+    def tearDown(self):
+        sp_file_explorer.FileSystem.unmount("/tree")
+
+    def test_expand_collapse(self):
+        state = sp_file_explorer.KeyBindReducer.rightKey(self.state)
+        self.assertEqual(state["children"][:4], ["dir00", "dir00/file", "dir00/sub", "dir01"])
+        state = sp_file_explorer.KeyBindReducer.rightKey(state)
+        self.assertEqual(state["selected"], ["dir00/file"])
+        state = sp_file_explorer.BasicReducer.expandChild(state, 2)
+        self.assertEqual(state["children"][3], "dir00/sub/deep")
+        state = sp_file_explorer.KeyBindReducer.leftKey(state)
+        self.assertEqual(state["selected"], ["dir00"])
+        state = sp_file_explorer.KeyBindReducer.leftKey(state)
+        self.assertEqual(state["children"], self.state["children"])
+        self.assertEqual(state["selected"], ["dir00"])
+
+    def test_marks_follow_rows(self):
+        state = sp_file_explorer.BasicReducer.setMarks(self.state, sp_file_explorer.IntervalSet([(1, 3)]))
+        state = sp_file_explorer.BasicReducer.expandChild(state, 0)
+        self.assertEqual([state["children"][i] for i in state["marks"]], ["dir01", "dir02"])
+        state = sp_file_explorer.BasicReducer.collapseChild(state, 0)
+        self.assertEqual([state["children"][i] for i in state["marks"]], ["dir01", "dir02"])
+
+    def test_tree_off_collapses(self):
+        state = sp_file_explorer.BasicReducer.expandChild(self.state, 0)
+        state = sp_file_explorer.BasicReducer.expandChild(state, 2)
+        state = sp_file_explorer.BasicReducer.moveSelection(state, [3])
+        state = sp_file_explorer.CommandReducer.treeCommand(state, "")
+        self.assertEqual(state["children"], self.state["children"])
+        self.assertEqual(state["selected"], ["dir00"])
+
+    def test_render_rows(self):
+        pane = sp_file_explorer.Pane.__new__(sp_file_explorer.Pane)
+        pane.listbox = sp_file_explorer.ListCanvas(Canvas())
+        for name in ("label", "text", "preview", "root"):
+            setattr(pane, name, self.Widget())
+        state = self.state
+        for index in range(49, -1, -1):
+            state = sp_file_explorer.BasicReducer.expandChild(state, index)
+        state = sp_file_explorer.BasicReducer.expandChild(state, 2)
+        sp_file_explorer.Renderer.render(pane, state)
+        pane.listbox.canvas.flush()
+        self.assertEqual([drawn[0][0] for drawn in pane.listbox.drawn[:5]], ["dir00/", "  file", "  sub/", "    deep", "dir01/"])
+        pane.listbox.canvas.calls = 0
+        sp_file_explorer.Renderer.render(pane, sp_file_explorer.BasicReducer.collapseChild(state, 0))
+        pane.listbox.canvas.flush()
+        self.assertEqual([drawn[0][0] for drawn in pane.listbox.drawn[:2]], ["dir00/", "dir01/"])
+        self.assertLessEqual(pane.listbox.canvas.calls, 2 * state["scroll_data"]["list_size"] + 1)
+
+
+class TestCompletion(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.bin = Path(self.tmp.name, "bin")
+        self.bin.mkdir()
+        for name in ("grep", "git", "gzip", "notexec"):
+            Path(self.bin, name).write_text("")
+            Path(self.bin, name).chmod(0o644 if name == "notexec" else 0o755)
+        self.work = Path(self.tmp.name, "work")
+        (self.work / "alps").mkdir(parents=True)
+        for name in ("alpha.txt", "alpine.md", ".alias", "beta"):
+            Path(self.work, name).write_text("")
+        for name, value in (("_names", None), ("_dirs", {}), ("_future", None), ("CHECK_SECONDS", 0)):
+            patcher = patch.object(sp_file_explorer.Completion, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        environ = patch.dict(os.environ, {"PATH": str(self.bin)})
+        environ.start()
+        self.addCleanup(environ.stop)
+        sp_file_explorer.Completion.warm().result()
+
+    def command(self, text):
+        state = sp_file_explorer.BasicReducer.getInitState(["a"], str(self.work))
+        return sp_file_explorer.BasicReducer.setModeToCommand(state, text)
+
+    def typed(self, state):
+        return state["text"][len(state["prompt_data"]["cmd_prompt"]):]
+
+    def test_executables(self):
+        self.assertEqual(sp_file_explorer.Completion.executables("g"), ["git", "grep", "gzip"])
+        self.assertEqual(sp_file_explorer.Completion.complete("/", "!gr"), (0, ["!grep "]))
+        self.assertEqual(sp_file_explorer.Completion.complete("/", "@ju"), (0, ["@jump "]))
+
+    def test_index_follows_mtimes(self):
+        cached = sp_file_explorer.Completion._dirs[str(self.bin)]
+        sp_file_explorer.Completion.warm().result()
+        self.assertIs(sp_file_explorer.Completion._dirs[str(self.bin)], cached)
+        Path(self.bin, "gawk").write_text("")
+        Path(self.bin, "gawk").chmod(0o755)
+        os.utime(self.bin, ns=(cached[0] + 10**9, cached[0] + 10**9))
+        sp_file_explorer.Completion.warm().result()
+        self.assertEqual(sp_file_explorer.Completion.executables("ga"), ["gawk"])
+
+    def test_paths(self):
+        self.assertEqual(sp_file_explorer.Completion.complete(str(self.work), "vim al"), (4, ["alpha.txt ", "alpine.md ", "alps/"]))
+        self.assertEqual(sp_file_explorer.Completion.complete(str(self.work), "vim .a")[1], [".alias "])
+        self.assertEqual(sp_file_explorer.Completion.complete(self.tmp.name, "cat work/b")[1], ["work/beta "])
+
+    def test_complete_and_cycle(self):
+        state = sp_file_explorer.BasicReducer.completeText(self.command("vim al"))
+        self.assertEqual(self.typed(state), "vim alp")
+        state = sp_file_explorer.BasicReducer.completeText(state)
+        self.assertEqual(self.typed(state), "vim alpha.txt ")
+        state = sp_file_explorer.BasicReducer.completeText(state)
+        self.assertEqual(self.typed(state), "vim alpine.md ")
+        state = sp_file_explorer.BasicReducer.completeText(sp_file_explorer.BasicReducer.addText(state, "al"))
+        self.assertEqual(self.typed(state), "vim alpine.md alp")
+        state = self.command("vim zz")
+        self.assertIs(sp_file_explorer.BasicReducer.completeText(state), state)
+
+    def test_many_executables(self):
+        names = sorted(f"cmd{i:05}" for i in range(20000))
+        with patch.object(sp_file_explorer.Completion, "_names", names):
+            started = time.perf_counter()
+            for _ in range(100):
+                sp_file_explorer.Completion.complete("/", "cmd1234")
+            self.assertLess((time.perf_counter() - started) / 100, 0.005)
+            self.assertEqual(len(sp_file_explorer.Completion.complete("/", "cmd1234")[1]), 10)
+
+
+class TestCommandHistory(TestCase):
+
+    class Event:
+
+        def __init__(self, char):
+            self.char = char
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.history = sp_file_explorer.CommandHistory
+        self.history._entries = None
+        if os.path.exists(self.history.path()):
+            os.remove(self.history.path())
+        self.addCleanup(setattr, self.history, "_entries", None)
+
+    def record(self, *commands):
+        """ Records commands and waits until they are written """
+        for command in commands:
+            self.history.record(command)
+        for _ in range(200):
+            if not self.history._unwritten:
+                break
+            time.sleep(0.01)
+
+    def command(self, text=""):
+        state = sp_file_explorer.BasicReducer.getInitState(["a"], "/")
+        return sp_file_explorer.BasicReducer.setModeToCommand(state, text)
+
+    def typed(self, state):
+        return state["text"][len(state["prompt_data"]["cmd_prompt"]):]
+
+    def test_lazy_load_and_dedup(self):
+        self.record("vim a", "ls -l", "vim b", "ls -l", "")
+        self.assertIsNone(self.history._entries)
+        self.assertEqual(self.history.count(), 3)
+        self.assertEqual([self.history.get(i) for i in range(3)], ["vim a", "vim b", "ls -l"])
+        self.record("make")
+        self.assertEqual(self.history.get(3), "make")
+        self.history._entries = None
+        self.assertEqual(self.history.count(), 4)
+
+    def test_capped(self):
+        with patch.object(self.history, "MAX_ENTRIES", 3):
+            self.record("a", "b", "c", "d")
+            self.assertEqual([self.history.get(i) for i in range(self.history.count())], ["b", "c", "d"])
+            self.record(*[str(i) for i in range(200)])
+            self.assertLess(self.history._lines, 200)
+            self.history._entries = None
+            self.assertEqual([self.history.get(i) for i in range(3)], ["197", "198", "199"])
+
+    def test_recall(self):
+        self.record("vim a", "ls -l", "vim b")
+        state = self.command("vim")
+        state = sp_file_explorer.KeyBindReducer.upKey(state)
+        self.assertEqual(self.typed(state), "vim b")
+        state = sp_file_explorer.KeyBindReducer.upKey(state)
+        self.assertEqual(self.typed(state), "vim a")
+        self.assertIs(sp_file_explorer.KeyBindReducer.upKey(state), state)
+        state = sp_file_explorer.KeyBindReducer.downKey(state)
+        self.assertEqual(self.typed(state), "vim b")
+        state = sp_file_explorer.KeyBindReducer.downKey(state)
+        self.assertEqual(self.typed(state), "vim")
+        state = sp_file_explorer.KeyBindReducer.upKey(self.command())
+        self.assertEqual(self.typed(state), "vim b")
+
+    def test_reverse_search(self):
+        self.record("ls -la", "vim notes.txt", "ls -l", "make")
+        state = sp_file_explorer.KeyBindReducer.controlRKey(self.command())
+        for char in "ls":
+            state = sp_file_explorer.KeyBindReducer.key(state, self.Event(char))
+        self.assertEqual(state["text"], "(reverse-i-search)'ls': ls -l")
+        state = sp_file_explorer.KeyBindReducer.controlRKey(state)
+        self.assertEqual(state["text"], "(reverse-i-search)'ls': ls -la")
+        state = sp_file_explorer.KeyBindReducer.controlRKey(state)
+        self.assertEqual(state["text"], "(failed reverse-i-search)'ls': ls -la")
+        state = sp_file_explorer.KeyBindReducer.backSpaceKey(state)
+        self.assertEqual(state["text"], "(reverse-i-search)'l': ls -l")
+        state = sp_file_explorer.BasicReducer.acceptSearch(state)
+        self.assertEqual(self.typed(state), "ls -l")
+        state = sp_file_explorer.KeyBindReducer.upKey(state)
+        self.assertEqual(self.typed(state), "vim notes.txt")
+
+    def test_return_records_without_waiting(self):
+        state = self.command("@jobs")
+        with patch.object(self.history, "_append", side_effect=lambda command: time.sleep(0.3)):
+            started = time.perf_counter()
+            sp_file_explorer.KeyBindReducer.returnKey(state)
+            self.assertLess(time.perf_counter() - started, 0.2)
+            self.assertEqual(self.history.get(self.history.count() - 1), "@jobs")
+        self.history._unwritten.clear()
+
+    def test_search_many_commands(self):
+        self.history._entries = [f"command {i} --flag" for i in range(5000)]
+        self.history._reindex()
+        started = time.perf_counter()
+        for i in range(100):
+            self.assertEqual(self.history.search(f"command {i} ", 5000), i)
+            self.assertEqual(self.history.previous(f"command {i}", 5000), max(j for j in range(5000) if str(j).startswith(str(i))))
+        self.assertLess((time.perf_counter() - started) / 100, 0.005)
+
+
+class TestHeadless(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        Path(self.tmp.name, "a", "b").mkdir(parents=True)
+        Path(self.tmp.name, "a", "b", "Report.txt").write_text("x" * 10)
+        Path(self.tmp.name, "top.txt").write_text("x" * 5)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_command(self, command, dir, text=None):
+        out = io.StringIO()
+        self.assertEqual(sp_file_explorer.Headless.run(command, dir, text, out), 0)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_list(self):
+        records = sorted(self.run_command("list", self.tmp.name), key=lambda record: record["name"])
+        self.assertEqual([(record["name"], record["kind"]) for record in records], [("a", "dir"), ("top.txt", "file")])
+        self.assertEqual(records[1]["size"], 5)
+
+    def test_search(self):
+        records = self.run_command("search", self.tmp.name, "report")
+        self.assertEqual([record["path"] for record in records], [join(self.tmp.name, "a", "b", "Report.txt")])
+
+    def test_du(self):
+        records = self.run_command("du", self.tmp.name)
+        self.assertEqual(records[-1], {"path": self.tmp.name, "size": 15, "total": True})
+        self.assertIn({"path": join(self.tmp.name, "a"), "size": 10}, records)
+
+    def test_du_hard_links_counted_once(self):
+        os.link(join(self.tmp.name, "a", "b", "Report.txt"), join(self.tmp.name, "link.txt"))
+        records = self.run_command("du", self.tmp.name)
+        self.assertIn({"path": join(self.tmp.name, "link.txt"), "size": 10}, records)
+        self.assertEqual(records[-1], {"path": self.tmp.name, "size": 15, "total": True})
+
+    def test_streams_memory_backend(self):
+        backend = sp_file_explorer.MemoryBackend("/headless")
+        backend.synthesize("/headless", 100000)
+        sp_file_explorer.FileSystem.mount(backend)
+        try:
+            records = sp_file_explorer.Headless.list("/headless")
+            self.assertEqual(next(records)["path"], "/headless/file0")
+            self.assertEqual(sum(1 for record in records), 99999)
+        finally:
+            sp_file_explorer.FileSystem.unmount("/headless")
+
+    def test_without_tkinter(self):
+        code = ("import sys, sp_file_explorer; "
+                f"sp_file_explorer.main(['--headless', 'list', {self.tmp.name!r}]); "
+                "print('tkinter' in sys.modules)")
+        result = subprocess.run([sys.executable, "-c", code], cwd=self.tmp.name, capture_output=True, text=True,
+                                env=dict(os.environ, PYTHONPATH=dirname(os.path.abspath(sp_file_explorer.__file__))))
+        self.assertEqual(result.stdout.splitlines()[-1], "False")
+        self.assertIn('"name": "top.txt"', result.stdout)
+
+
+class TestFileType(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        Path(self.dir, "notes").write_text("plain text")
+        Path(self.dir, "picture").write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(100))
+        Path(self.dir, "blob").write_bytes(bytes(range(256)))
+        Path(self.dir, "run.sh").write_text("#!/bin/sh")
+        os.chmod(join(self.dir, "run.sh"), 0o755)
+        Path(self.dir, "sub").mkdir()
+        os.symlink(join(self.dir, "notes"), join(self.dir, "link"))
+        os.symlink(join(self.dir, "missing"), join(self.dir, "dangling"))
+        os.mkfifo(join(self.dir, "pipe"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_classify(self):
+        classes = {name: sp_file_explorer.FileType.classify(join(self.dir, name)) for name in listdir(self.dir)}
+        self.assertEqual(classes, {"notes": "text", "picture": "image", "blob": "binary", "run.sh": "exec", "sub": "dir",
+                                   "link": "symlink", "dangling": "broken", "pipe": "special"})
+
+    def test_fast_path(self):
+        self.assertEqual(sp_file_explorer.FileType.fast("photo.JPG", "file"), "image")
+        self.assertEqual(sp_file_explorer.FileType.fast("photo.JPG", "dir"), "dir")
+        self.assertEqual(sp_file_explorer.FileType.fast("README", "file"), "file")
+        with patch.object(sp_file_explorer.FileType, "_sniff") as sniff:
+            Path(self.dir, "code.py").write_bytes(bytes(10))
+            self.assertEqual(sp_file_explorer.FileType.classify(join(self.dir, "code.py")), "text")
+            sniff.assert_not_called()
+
+    def test_sniffed_once_per_inode_and_mtime(self):
+        path = join(self.dir, "notes")
+        sp_file_explorer.FileType.classify(path)
+        os.rename(path, join(self.dir, "renamed"))
+        with patch.object(sp_file_explorer.LocalBackend, "open", side_effect=OSError) as opened:
+            self.assertEqual(sp_file_explorer.FileType.classify(join(self.dir, "renamed")), "text")
+            opened.assert_not_called()
+            os.utime(join(self.dir, "renamed"), ns=(0, 10**9))
+            sp_file_explorer.FileType.classify(join(self.dir, "renamed"))
+            opened.assert_called_once()
+
+    def test_request(self):
+        sp_file_explorer.FileType.forget(self.dir)
+        sp_file_explorer.FileType.request(self.dir, ["picture", "sub"]).result()
+        self.assertEqual(sp_file_explorer.FileType.get(self.dir, "picture"), "image")
+        self.assertIsNone(sp_file_explorer.FileType.get(self.dir, "notes"))
+        self.assertIsNone(sp_file_explorer.FileType.request(self.dir, ["picture"]))
+
+
+class TestDuplicates(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        large = bytes(range(256)) * 100
+        Path(self.dir, "sub").mkdir()
+        for name in ("one", "two", "sub/three"):
+            Path(self.dir, name).write_bytes(large)
+        os.link(join(self.dir, "one"), join(self.dir, "hardlink"))
+        Path(self.dir, "middle").write_bytes(large[:10000] + b"!" + large[10001:])
+        Path(self.dir, "edges").write_bytes(b"!" + large[1:])
+        Path(self.dir, "small1").write_text("same")
+        Path(self.dir, "small2").write_text("same")
+        Path(self.dir, "unique").write_text("unique size")
+        Path(self.dir, "empty1").touch()
+        Path(self.dir, "empty2").touch()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_find(self):
+        groups, sizes, read = sp_file_explorer.Duplicates.find(self.dir)
+        relative = [[os.path.relpath(path, self.dir) for path in group] for group in groups]
+        self.assertEqual(len(relative), 2)
+        self.assertIn(relative[0], (["one", "sub/three", "two"], ["hardlink", "sub/three", "two"]))
+        self.assertEqual(relative[1], ["small1", "small2"])
+        self.assertEqual(sizes, [25600, 4])
+        self.assertEqual(read, 4 * 25600)
+
+    def test_show_duplicates(self):
+        state = sp_file_explorer.BasicReducer.getInitState([], self.dir)
+        groups = [[join(self.dir, "small1"), join(self.dir, "small2")]]
+        newState = sp_file_explorer.CommandReducer.showDuplicates(state, self.dir, groups, [4], 0)
+        self.assertEqual(newState["children"], ["small1", "small2"])
+        self.assertEqual(newState["sizes"], {"small1": 4, "small2": 4})
+        self.assertIs(sp_file_explorer.CommandReducer.showDuplicates(state, "/elsewhere", groups, [4], 0), state)
+
+
+class TestCompare(TestCase):
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.left = join(self.tmp.name, "left")
+        self.right = join(self.tmp.name, "right")
+        for side in (self.left, self.right):
+            Path(side, "sub", "deep").mkdir(parents=True)
+            Path(side, "same").write_text("same")
+            Path(side, "sub", "touched").write_text("touched")
+            Path(side, "sub", "edited").write_text("edited")
+        Path(self.left, "resized").write_text("short")
+        Path(self.right, "resized").write_text("longer")
+        Path(self.left, "sub", "deep", "left").touch()
+        Path(self.right, "onlyright").mkdir()
+        Path(self.right, "onlyright", "ignored").touch()
+        Path(self.right, "sub", "edited").write_text("EDITED")
+        for name in ("same", "resized"):
+            os.utime(join(self.right, name), ns=(0, os.stat(join(self.left, name)).st_mtime_ns))
+        for name in ("touched", "edited"):
+            os.utime(join(self.right, "sub", name), ns=(0, 0))
+        os.symlink("same", join(self.left, "link"))
+        os.symlink("none", join(self.right, "link"))
+        os.utime(join(self.right, "link"), ns=(0, 0), follow_symlinks=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def compare(self, arg):
+        state = sp_file_explorer.BasicReducer.getInitState([], self.left)
+        state = sp_file_explorer.CommandReducer.compareCommand(state, arg)
+        for _ in range(100):
+            time.sleep(0.05)
+            state = sp_file_explorer.TASKS.drain(state)
+            if "..." not in state["text"]:
+                break
+        return state
+
+    def test_pair(self):
+        classified, ambiguous, subdirs = sp_file_explorer.Compare._pair(self.left, self.right, "")
+        self.assertEqual(classified, [("link", "different"), ("onlyright", "only-right"), ("resized", "different"), ("same", "same")])
+        self.assertEqual(ambiguous, [])
+        self.assertEqual(subdirs, ["sub"])
+
+    def test_compare(self):
+        state = self.compare(self.right)
+        self.assertEqual(state["compared"], {
+            "link": "different", join(self.right, "onlyright"): "only-right", "resized": "different",
+            "sub/edited": "different", "sub/touched": "different", "sub/deep/left": "only-left"})
+        self.assertEqual(sorted(state["children"]), sorted(state["compared"]))
+        self.assertEqual(state["selected"], state["children"][:1])
+        self.assertIn("1 only-left, 1 only-right, 4 different, 1 same", state["text"])
+
+    def test_compare_contents(self):
+        state = self.compare("-c ../right")
+        self.assertEqual(state["compared"].get("sub/edited"), "different")
+        self.assertNotIn("sub/touched", state["compared"])
+        self.assertIn("1 only-left, 1 only-right, 3 different, 2 same", state["text"])
+
+    def test_add_compared(self):
+        state = sp_file_explorer.BasicReducer.getInitState([], self.left)
+        self.assertIs(sp_file_explorer.CommandReducer.addCompared(state, self.left, self.right, [], {}, True), state)
+        state = sp_file_explorer.CommandReducer.compareCommand(state, "missing")
+        self.assertIsNone(state["compared"])
+        newState = sp_file_explorer.CommandReducer.compareCommand(state, "-c")
+        self.assertIsNone(newState["compared"])
+        self.assertIn("Usage", newState["text"])
+        state = sp_file_explorer.CommandReducer._showResults(state, [], "")
+        state["compared"] = {}
+        counts = dict.fromkeys(sp_file_explorer.Compare.CLASSES, 0)
+        newState = sp_file_explorer.CommandReducer.addCompared(state, self.left, self.right, [("a", "only-left")], counts, False)
+        self.assertEqual(newState["children"], ["a"])
+        self.assertEqual(state["children"], [])
+        self.assertEqual(newState["compared"], {"a": "only-left"})
+        moved = sp_file_explorer.BasicReducer.setChildren(newState, ["b"])
+        self.assertIsNone(moved["compared"])
+
+
+class TestComplexity(TestCase):
+    """ Scaling tests - every keypress is run at growing directory sizes, counting operations rather than time
+
+    The operations counted are comparisons of filenames, backend calls (the syscalls of a MemoryBackend) made while handling
+        the keypress, widget (and canvas) calls, and bytes allocated at the peak.
+    A keypress whose cost grows with the number of children fails, so O(n) work per keypress cannot sneak back in.
+    """
+
+    SIZES = (1000, 10000, 100000)
+
+    class Name(str):
+        """ Filename counting how often it is compared """
+
+        compares = 0
+
+        def __eq__(self, other):
+            TestComplexity.Name.compares += 1
+            return str.__eq__(self, other)
+
+        __hash__ = str.__hash__
+
+    class Backend(sp_file_explorer.MemoryBackend):
+        """ MemoryBackend counting the calls made by the main thread """
+
+        calls = 0
+
+        def lstat(self, path):
+            if threading.current_thread() is threading.main_thread():
+                TestComplexity.Backend.calls += 1
+            return super().lstat(path)
+
+        stat = lstat
+
+    class Widget:
+        """ Widget counting its calls """
+
+        calls = 0
+
+        def __getattr__(self, name):
+            def call(*args, **kwargs):
+                TestComplexity.Widget.calls += 1
+            return call
+
+    def setUp(self):
+        sp_file_explorer.LOGGER = getLogger()
+        sp_file_explorer.LOGGER.setLevel(WARN)
+        requests = patch.object(sp_file_explorer.FileType, "request", return_value=None)
+        requests.start()
+        self.addCleanup(requests.stop)
+
+    def cost(self, size, reducer):
+        """ Returns the operations counted while applying reducer to a state of size children and rendering the result """
+        root = f"/scaling{size}"
+        backend = self.Backend(root)
+        backend.synthesize(root, size)
+        sp_file_explorer.FileSystem.mount(backend)
+        self.addCleanup(sp_file_explorer.FileSystem.unmount, root)
+        names = [self.Name(f"file{i}") for i in range(size)]
+        sp_file_explorer.FileSystem.rememberListing(root, backend.stat(root).st_mtime_ns, names, dict.fromkeys(names, "file"))
+        state = sp_file_explorer.BasicReducer.getInitState(list(names), root)
+        state["preview"] = False
+        state = sp_file_explorer.BasicReducer.moveSelection(state, [size // 2])
+        state = sp_file_explorer.BasicReducer.moveScrollUp(state)
+        state = sp_file_explorer.BasicReducer.setMarks(state, state["marks"])
+        pane = sp_file_explorer.Pane.__new__(sp_file_explorer.Pane)
+        for widget in ("label", "scrollbar", "preview", "text", "root"):
+            setattr(pane, widget, self.Widget())
+        pane.listbox = sp_file_explorer.ListCanvas(Canvas())
+        sp_file_explorer.Renderer.render(pane, state)
+        pane.listbox.canvas.flush()
+        self.Name.compares = self.Backend.calls = self.Widget.calls = pane.listbox.canvas.calls = 0
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            sp_file_explorer.Renderer.render(pane, reducer(state))
+            pane.listbox.canvas.flush()
+            allocated = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+        return {"compares": self.Name.compares, "calls": self.Backend.calls, "widgets": self.Widget.calls + pane.listbox.canvas.calls, "bytes": allocated}
+
+    def assertConstant(self, reducer):
+        costs = [self.cost(size, reducer) for size in self.SIZES]
+        for key in ("compares", "calls", "widgets"):
+            self.assertEqual({cost[key] for cost in costs}, {costs[0][key]}, f"{key} grow with size: {costs}")
+        self.assertLess(costs[-1]["bytes"], 2 * costs[0]["bytes"] + 4096, f"allocations grow with size: {costs}")
+
+    def test_down(self):
+        self.assertConstant(sp_file_explorer.KeyBindReducer.downKey)
+
+    def test_up(self):
+        self.assertConstant(sp_file_explorer.KeyBindReducer.upKey)
+
+    def test_mark(self):
+        self.assertConstant(lambda state: sp_file_explorer.KeyBindReducer.spaceKey(state, None))
+
+    def test_mark_range(self):
+        self.assertConstant(sp_file_explorer.KeyBindReducer.controlDownKey)
+
+    def test_select(self):
+        self.assertConstant(lambda state: sp_file_explorer.BasicReducer.moveSelection(state, [len(state["children"]) // 2 + 5]))
+
+    def test_render(self):
+        self.assertConstant(sp_file_explorer.BasicReducer.refresh)